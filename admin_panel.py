@@ -1,5 +1,5 @@
 from fastapi import FastAPI, Request, HTTPException, Depends, Form, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, FileResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
@@ -8,22 +8,29 @@ import asyncio
 import secrets
 import base64
 import json
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from typing import Annotated, Literal, Optional, List, Dict
 import os
 from pathlib import Path
 import hashlib
 import uvicorn
+import jinja2
+from pydantic import BaseModel, BeforeValidator, Field
 
-from config import DATABASE_URL, ADMIN_USERNAME, ADMIN_PASSWORD
+import time
+
+from config import (DATABASE_URL, ADMIN_USERNAME, ADMIN_PASSWORD, ADMIN_DEBUG, METRICS_PATH, BULK_MODERATION_MAX, TOP_CHANNEL,
+                    BOT_TOKEN, TELEGRAM_API_URL)
+from utils import thumbnails, tracing
 
 SECRET_KEY = secrets.token_hex(32)
 
 app = FastAPI(title="Cuteness Bot Admin Panel", docs_url=None, redoc_url=None)
 security = HTTPBasic()
-templates = Jinja2Templates(directory="templates")
 
 _pool: Optional[asyncpg.Pool] = None
+_bot = None
 
 async def get_db_pool():
     global _pool
@@ -38,9 +45,122 @@ async def authenticate(credentials: HTTPBasicCredentials = Depends(security)):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     return credentials.username
 
-def create_templates():
-    os.makedirs("templates", exist_ok=True)
-    
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def _blank_to_none(value):
+    return None if value == "" else value
+
+OptionalInt = Annotated[Optional[int], BeforeValidator(_blank_to_none)]
+OptionalFloat = Annotated[Optional[float], BeforeValidator(_blank_to_none)]
+
+def _encode_cursor(*values) -> str:
+    payload = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: Optional[str], *parsers) -> Optional[list]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError(cursor)
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _page_limit(limit: Optional[int]) -> int:
+    if not limit:
+        return PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def _image_filters(arg, user_id: Optional[int] = None, approved: Optional[int] = None, nsfw: Optional[int] = None,
+                   min_score: Optional[float] = None, max_score: Optional[float] = None) -> List[str]:
+    where = []
+    if user_id is not None:
+        where.append(f"user_id = {arg(user_id)}")
+    if approved is not None:
+        where.append(f"approved = {arg(approved)}")
+    if nsfw is not None:
+        where.append(f"nsfw = {arg(nsfw)}")
+    if min_score is not None:
+        where.append(f"raw_score >= {arg(min_score)}")
+    if max_score is not None:
+        where.append(f"raw_score <= {arg(max_score)}")
+    return where
+
+async def _fetch_images_page(conn, cursor: Optional[str], limit: int, **filters):
+    args = []
+
+    def arg(value):
+        args.append(value)
+        return f"${len(args)}"
+
+    where = _image_filters(arg, **filters)
+    after = _decode_cursor(cursor, datetime.fromisoformat, int)
+    if after:
+        where.append(f"(created_at, id) < ({arg(after[0])}, {arg(after[1])})")
+
+    query = "SELECT id, user_id, username, raw_score, approved, nsfw, created_at, filename FROM images"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += f" ORDER BY created_at DESC, id DESC LIMIT {arg(limit + 1)}"
+    rows = await conn.fetch(query, *args)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows, next_cursor
+
+async def _fetch_users_page(conn, cursor: Optional[str], limit: int, status: Optional[str] = None):
+    where = []
+    args = []
+
+    def arg(value):
+        args.append(value)
+        return f"${len(args)}"
+
+    if status == "banned":
+        where.append("banned = 1")
+    elif status == "active":
+        where.append("banned = 0")
+    elif status == "warned":
+        where.append("warnings > 0")
+    after = _decode_cursor(cursor, int, int)
+    if after:
+        where.append(f"(image_count, user_id) < ({arg(after[0])}, {arg(after[1])})")
+
+    query = """
+        SELECT user_id, username, image_count, best_score, warnings, banned
+        FROM user_stats
+        WHERE image_count > 0
+    """
+    if where:
+        query += " AND " + " AND ".join(where)
+    query += f" ORDER BY image_count DESC, user_id DESC LIMIT {arg(limit + 1)}"
+    rows = await conn.fetch(query, *args)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]['image_count'], rows[-1]['user_id'])
+    return rows, next_cursor
+
+def _image_json(row) -> dict:
+    return {
+        "id": row["id"],
+        "user_id": row["user_id"],
+        "username": row["username"],
+        "raw_score": row["raw_score"],
+        "approved": row["approved"],
+        "nsfw": row["nsfw"],
+        "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+        "filename": row["filename"],
+    }
+
+def create_templates() -> Dict[str, str]:
     main_template = '''<!DOCTYPE html>
 <html lang="ru">
 <head>
@@ -50,14 +170,7 @@ def create_templates():
     <script src="https://cdn.tailwindcss.com"></script>
     <script src="https://unpkg.com/alpinejs@3.x.x/dist/cdn.min.js" defer></script>
     <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css" rel="stylesheet">
-    <style>
-        .glass { backdrop-filter: blur(10px); background: rgba(255, 255, 255, 0.1); border: 1px solid rgba(255, 255, 255, 0.2); }
-        .gradient-bg { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); }
-        .card-hover:hover { transform: translateY(-4px); transition: all 0.3s ease; }
-        .animate-fade-in { animation: fadeIn 0.5s ease-in; }
-        @keyframes fadeIn { from { opacity: 0; transform: translateY(20px); } to { opacity: 1; transform: translateY(0); } }
-        .stat-card { background: linear-gradient(135deg, rgba(99, 102, 241, 0.1) 0%, rgba(139, 92, 246, 0.1) 100%); }
-    </style>
+    <link href="{{ static_url('admin.css') }}" rel="stylesheet">
 </head>
 <body class="gradient-bg min-h-screen">
     <nav class="glass sticky top-0 z-50 border-b border-white/20">
@@ -78,46 +191,7 @@ def create_templates():
         {% block content %}{% endblock %}
     </main>
     
-    <script>
-        function updateTime() {
-            const now = new Date();
-            const timeStr = now.toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' });
-            const timeEl = document.querySelector('.text-white\\/80');
-            if (timeEl) timeEl.textContent = timeStr;
-        }
-        setInterval(updateTime, 1000);
-        
-        async function approveImage(imageId) {
-            try {
-                const response = await fetch(`/api/approve/${imageId}`, { method: 'POST' });
-                if (response.ok) location.reload();
-            } catch (error) {
-                alert('Ошибка при одобрении');
-            }
-        }
-        
-        async function banUser(imageId) {
-            if (confirm('Забанить пользователя?')) {
-                try {
-                    const response = await fetch(`/api/ban/${imageId}`, { method: 'POST' });
-                    if (response.ok) location.reload();
-                } catch (error) {
-                    alert('Ошибка при бане');
-                }
-            }
-        }
-        
-        async function deleteImage(imageId) {
-            if (confirm('Удалить изображение?')) {
-                try {
-                    const response = await fetch(`/api/delete/${imageId}`, { method: 'DELETE' });
-                    if (response.ok) location.reload();
-                } catch (error) {
-                    alert('Ошибка при удалении');
-                }
-            }
-        }
-    </script>
+    <script src="{{ static_url('admin.js') }}"></script>
 </body>
 </html>'''
 
@@ -190,8 +264,8 @@ def create_templates():
                 <div class="space-y-4">
                     {% for image in pending_images %}
                     <div class="glass rounded-lg p-4 flex items-center space-x-4">
-                        <div class="w-16 h-16 bg-gray-700 rounded-lg flex items-center justify-center">
-                            <i class="fas fa-image text-gray-400"></i>
+                        <div class="w-16 h-16 bg-gray-700 rounded-lg flex items-center justify-center overflow-hidden">
+                            <img src="/thumb/{{ image.id }}" loading="lazy" alt="" class="w-16 h-16 object-cover" onerror="this.style.visibility='hidden'">
                         </div>
                         <div class="flex-1">
                             <div class="flex items-center space-x-2">
@@ -288,15 +362,15 @@ function dashboard() {
         <div class="flex items-center justify-between mb-6">
             <h2 class="text-xl font-bold text-white flex items-center">
                 <i class="fas fa-users mr-3 text-blue-400"></i>
-                Пользователи ({{ users|length }})
+                Пользователи
             </h2>
             <div class="flex space-x-4">
                 <input type="text" placeholder="Поиск..." class="px-4 py-2 bg-white/10 border border-white/20 rounded-lg text-white placeholder-white/50 focus:outline-none focus:border-white/40" id="userSearch">
                 <select class="px-4 py-2 bg-white/10 border border-white/20 rounded-lg text-white focus:outline-none focus:border-white/40" id="statusFilter">
-                    <option value="">Все статусы</option>
-                    <option value="active">Активные</option>
-                    <option value="banned">Заблокированные</option>
-                    <option value="warned">С предупреждениями</option>
+                    <option value="" {% if not status %}selected{% endif %}>Все статусы</option>
+                    <option value="active" {% if status == 'active' %}selected{% endif %}>Активные</option>
+                    <option value="banned" {% if status == 'banned' %}selected{% endif %}>Заблокированные</option>
+                    <option value="warned" {% if status == 'warned' %}selected{% endif %}>С предупреждениями</option>
                 </select>
             </div>
         </div>
@@ -362,6 +436,13 @@ function dashboard() {
                 </tbody>
             </table>
         </div>
+        {% if next_cursor %}
+        <div class="mt-6 text-center">
+            <a href="/users?cursor={{ next_cursor }}{% if status %}&status={{ status }}{% endif %}" class="px-4 py-2 bg-blue-500/20 hover:bg-blue-500/30 rounded-lg text-white transition-colors">
+                Далее<i class="fas fa-arrow-right ml-2"></i>
+            </a>
+        </div>
+        {% endif %}
     </div>
 </div>
 
@@ -393,244 +474,22 @@ function viewUserImages(userId) {
 }
 
 document.getElementById('userSearch').addEventListener('input', filterUsers);
-document.getElementById('statusFilter').addEventListener('change', filterUsers);
+document.getElementById('statusFilter').addEventListener('change', (e) => {
+    location.href = e.target.value ? `/users?status=${e.target.value}` : '/users';
+});
 
 function filterUsers() {
     const searchTerm = document.getElementById('userSearch').value.toLowerCase();
-    const statusFilter = document.getElementById('statusFilter').value;
     const rows = document.querySelectorAll('tbody tr');
     
     rows.forEach(row => {
         const username = row.querySelector('td:first-child').textContent.toLowerCase();
-        const status = row.querySelector('td:nth-child(5) span').textContent.toLowerCase();
-        
-        let showRow = true;
-        
-        if (searchTerm && !username.includes(searchTerm)) {
-            showRow = false;
-        }
-        
-        if (statusFilter) {
-            if (statusFilter === 'banned' && !status.includes('заблокирован')) showRow = false;
-            if (statusFilter === 'active' && !status.includes('активен')) showRow = false;
-            if (statusFilter === 'warned' && !row.querySelector('td:nth-child(4) span').textContent.includes('0')) showRow = false;
-        }
-        
-        row.style.display = showRow ? '' : 'none';
+        row.style.display = (!searchTerm || username.includes(searchTerm)) ? '' : 'none';
     });
 }
 </script>
 {% endblock %}'''
 
-    with open("templates/base.html", "w", encoding="utf-8") as f:
-        f.write(main_template)
-    with open("templates/dashboard.html", "w", encoding="utf-8") as f:
-        f.write(dashboard_template)
-    with open("templates/users.html", "w", encoding="utf-8") as f:
-        f.write(users_template)
-
-create_templates()
-
-@app.on_event("startup")
-async def startup_event():
-    await get_db_pool()
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    global _pool
-    if _pool:
-        await _pool.close()
-
-@app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        stats = {}
-        stats['total_images'] = await conn.fetchval("SELECT COUNT(*) FROM images")
-        stats['approved_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE approved = 1")
-        stats['pending_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE approved = 0")
-        stats['total_users'] = await conn.fetchval("SELECT COUNT(DISTINCT user_id) FROM images")
-        stats['today_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE DATE(created_at) = CURRENT_DATE")
-        stats['week_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'")
-        stats['month_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'")
-        
-        pending_images = await conn.fetch("""
-            SELECT id, user_id, username, raw_score, created_at
-            FROM images 
-            WHERE approved = 0 AND raw_score > 85
-            ORDER BY created_at DESC 
-            LIMIT 20
-        """)
-        
-        top_images = await conn.fetch("""
-            SELECT username, raw_score, user_id
-            FROM images 
-            WHERE approved = 1 AND nsfw = 0
-            ORDER BY raw_score DESC 
-            LIMIT 10
-        """)
-    
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "stats": stats,
-        "pending_images": pending_images,
-        "top_images": top_images,
-        "datetime": datetime
-    })
-
-@app.get("/users", response_class=HTMLResponse)
-async def users_page(request: Request, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        users_data = await conn.fetch("""
-            SELECT 
-                i.user_id,
-                i.username,
-                COUNT(i.id) as image_count,
-                MAX(i.raw_score) as best_score,
-                COALESCE(w.warnings, 0) as warnings,
-                COALESCE(w.banned, 0) as banned
-            FROM images i
-            LEFT JOIN user_warnings w ON i.user_id = w.user_id
-            GROUP BY i.user_id, i.username, w.warnings, w.banned
-            ORDER BY image_count DESC
-        """)
-    
-    return templates.TemplateResponse("users.html", {
-        "request": request,
-        "users": users_data
-    })
-
-@app.get("/images", response_class=HTMLResponse)
-async def images_page(request: Request, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        images = await conn.fetch("""
-            SELECT id, user_id, username, raw_score, approved, nsfw, created_at
-            FROM images 
-            ORDER BY created_at DESC 
-            LIMIT 100
-        """)
-    
-    return templates.TemplateResponse("images.html", {
-        "request": request,
-        "images": images
-    })
-
-@app.post("/api/approve/{image_id}")
-async def approve_image(image_id: int, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        await conn.execute("UPDATE images SET approved = 1 WHERE id = $1", image_id)
-    return {"status": "success"}
-
-@app.post("/api/ban/{image_id}")
-async def ban_image(image_id: int, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        user_id = await conn.fetchval("SELECT user_id FROM images WHERE id = $1", image_id)
-        if user_id:
-            await conn.execute("UPDATE images SET approved = 0 WHERE id = $1", image_id)
-            await conn.execute("""
-                INSERT INTO user_warnings (user_id, warnings, banned) 
-                VALUES ($1, 1, 1) 
-                ON CONFLICT (user_id) 
-                DO UPDATE SET warnings = user_warnings.warnings + 1, banned = 1
-            """, user_id)
-    return {"status": "success"}
-
-@app.delete("/api/delete/{image_id}")
-async def delete_image(image_id: int, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        await conn.execute("DELETE FROM images WHERE id = $1", image_id)
-    return {"status": "success"}
-
-@app.post("/api/ban-user/{user_id}")
-async def ban_user_by_id(user_id: int, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        await conn.execute("""
-            INSERT INTO user_warnings (user_id, warnings, banned) 
-            VALUES ($1, 1, 1) 
-            ON CONFLICT (user_id) 
-            DO UPDATE SET banned = 1
-        """, user_id)
-    return {"status": "success"}
-
-@app.post("/api/unban-user/{user_id}")
-async def unban_user(user_id: int, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        await conn.execute("""
-            INSERT INTO user_warnings (user_id, warnings, banned) 
-            VALUES ($1, 0, 0) 
-            ON CONFLICT (user_id) 
-            DO UPDATE SET banned = 0
-        """, user_id)
-    return {"status": "success"}
-
-@app.get("/api/stats")
-async def get_stats(user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        total_images = await conn.fetchval("SELECT COUNT(*) FROM images")
-        approved_images = await conn.fetchval("SELECT COUNT(*) FROM images WHERE approved = 1")
-        pending_images = await conn.fetchval("SELECT COUNT(*) FROM images WHERE approved = 0")
-        total_users = await conn.fetchval("SELECT COUNT(DISTINCT user_id) FROM images")
-        banned_users = await conn.fetchval("SELECT COUNT(*) FROM user_warnings WHERE banned = 1")
-        
-        daily_stats = await conn.fetch("""
-            SELECT DATE(created_at) as date, COUNT(*) as count
-            FROM images 
-            WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """)
-        
-        top_scores = await conn.fetch("""
-            SELECT raw_score, COUNT(*) as count
-            FROM images 
-            WHERE approved = 1
-            GROUP BY CASE 
-                WHEN raw_score >= 90 THEN '90+'
-                WHEN raw_score >= 80 THEN '80-89'
-                WHEN raw_score >= 70 THEN '70-79'
-                WHEN raw_score >= 60 THEN '60-69'
-                ELSE '0-59'
-            END
-            ORDER BY raw_score DESC
-        """)
-    
-    return {
-        "total_images": total_images,
-        "approved_images": approved_images,
-        "pending_images": pending_images,
-        "total_users": total_users,
-        "banned_users": banned_users,
-        "daily_stats": [{"date": str(row["date"]), "count": row["count"]} for row in daily_stats],
-        "score_distribution": [{"range": row["raw_score"], "count": row["count"]} for row in top_scores]
-    }
-
-@app.get("/user/{user_id}", response_class=HTMLResponse)
-async def user_detail(request: Request, user_id: int, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        user_info = await conn.fetchrow("""
-            SELECT DISTINCT user_id, username FROM images WHERE user_id = $1 LIMIT 1
-        """, user_id)
-        
-        user_images = await conn.fetch("""
-            SELECT id, raw_score, approved, nsfw, created_at, filename
-            FROM images 
-            WHERE user_id = $1 
-            ORDER BY created_at DESC
-        """, user_id)
-        
-        warnings_info = await conn.fetchrow("""
-            SELECT warnings, banned FROM user_warnings WHERE user_id = $1
-        """, user_id)
-    
     user_detail_template = '''{% extends "base.html" %}
 {% block content %}
 <div class="animate-fade-in">
@@ -643,13 +502,13 @@ async def user_detail(request: Request, user_id: int, user: str = Depends(authen
                 <div>
                     <h2 class="text-2xl font-bold text-white">{{ user_info.username or 'Аноним' }}</h2>
                     <p class="text-white/60">ID: {{ user_info.user_id }}</p>
-                    {% if warnings_info %}
+                    {% if user_info %}
                     <div class="flex items-center space-x-2 mt-2">
-                        <span class="px-2 py-1 rounded-full text-xs {% if warnings_info.banned %}bg-red-500/20 text-red-400{% else %}bg-green-500/20 text-green-400{% endif %}">
-                            {% if warnings_info.banned %}Заблокирован{% else %}Активен{% endif %}
+                        <span class="px-2 py-1 rounded-full text-xs {% if user_info.banned %}bg-red-500/20 text-red-400{% else %}bg-green-500/20 text-green-400{% endif %}">
+                            {% if user_info.banned %}Заблокирован{% else %}Активен{% endif %}
                         </span>
                         <span class="px-2 py-1 bg-yellow-500/20 text-yellow-400 rounded-full text-xs">
-                            Предупреждений: {{ warnings_info.warnings }}
+                            Предупреждений: {{ user_info.warnings }}
                         </span>
                     </div>
                     {% endif %}
@@ -662,15 +521,15 @@ async def user_detail(request: Request, user_id: int, user: str = Depends(authen
         
         <div class="grid grid-cols-1 md:grid-cols-3 gap-6 mb-6">
             <div class="stat-card glass rounded-lg p-4">
-                <div class="text-2xl font-bold text-white">{{ user_images|length }}</div>
+                <div class="text-2xl font-bold text-white">{{ user_info.image_count }}</div>
                 <div class="text-white/60">Всего изображений</div>
             </div>
             <div class="stat-card glass rounded-lg p-4">
-                <div class="text-2xl font-bold text-green-400">{{ user_images|selectattr("approved", "equalto", 1)|list|length }}</div>
+                <div class="text-2xl font-bold text-green-400">{{ user_info.approved_count }}</div>
                 <div class="text-white/60">Одобрено</div>
             </div>
             <div class="stat-card glass rounded-lg p-4">
-                <div class="text-2xl font-bold text-blue-400">{{ "%.2f"|format(user_images|selectattr("approved", "equalto", 1)|map(attribute="raw_score")|max or 0) }}%</div>
+                <div class="text-2xl font-bold text-blue-400">{{ "%.2f"|format(user_info.best_score or 0) }}%</div>
                 <div class="text-white/60">Лучший результат</div>
             </div>
         </div>
@@ -680,6 +539,7 @@ async def user_detail(request: Request, user_id: int, user: str = Depends(authen
             <table class="w-full">
                 <thead>
                     <tr class="border-b border-white/10">
+                        <th class="text-left py-3 px-4 font-medium text-white/70">Фото</th>
                         <th class="text-left py-3 px-4 font-medium text-white/70">ID</th>
                         <th class="text-left py-3 px-4 font-medium text-white/70">Оценка</th>
                         <th class="text-left py-3 px-4 font-medium text-white/70">Статус</th>
@@ -690,6 +550,7 @@ async def user_detail(request: Request, user_id: int, user: str = Depends(authen
                 <tbody>
                     {% for image in user_images %}
                     <tr class="border-b border-white/5 hover:bg-white/5">
+                        <td class="py-2 px-4"><img src="/thumb/{{ image.id }}" loading="lazy" alt="" class="w-12 h-12 object-cover rounded" onerror="this.style.visibility='hidden'"></td>
                         <td class="py-3 px-4 text-white">{{ image.id }}</td>
                         <td class="py-3 px-4 text-white">{{ "%.2f"|format(image.raw_score) }}%</td>
                         <td class="py-3 px-4">
@@ -718,67 +579,236 @@ async def user_detail(request: Request, user_id: int, user: str = Depends(authen
                 </tbody>
             </table>
         </div>
+        {% if next_cursor %}
+        <div class="mt-6 text-center">
+            <a href="/user/{{ user_info.user_id }}?cursor={{ next_cursor }}" class="px-4 py-2 bg-blue-500/20 hover:bg-blue-500/30 rounded-lg text-white transition-colors">
+                Далее<i class="fas fa-arrow-right ml-2"></i>
+            </a>
+        </div>
+        {% endif %}
     </div>
 </div>
 {% endblock %}'''
-    
-    if not os.path.exists("templates/user_detail.html"):
-        with open("templates/user_detail.html", "w", encoding="utf-8") as f:
-            f.write(user_detail_template)
-    
-    return templates.TemplateResponse("user_detail.html", {
-        "request": request,
-        "user_info": user_info,
-        "user_images": user_images,
-        "warnings_info": warnings_info or {"warnings": 0, "banned": False}
-    })
 
-@app.get("/analytics", response_class=HTMLResponse)
-async def analytics_page(request: Request, user: str = Depends(authenticate)):
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        daily_stats = await conn.fetch("""
-            SELECT DATE(created_at) as date, COUNT(*) as count
-            FROM images 
-            WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """)
-        
-        score_distribution = await conn.fetch("""
-            SELECT 
-                CASE 
-                    WHEN raw_score >= 95 THEN '95-100%'
-                    WHEN raw_score >= 90 THEN '90-95%'
-                    WHEN raw_score >= 80 THEN '80-90%'
-                    WHEN raw_score >= 70 THEN '70-80%'
-                    WHEN raw_score >= 60 THEN '60-70%'
-                    ELSE '0-60%'
-                END as score_range,
-                COUNT(*) as count
-            FROM images 
-            WHERE approved = 1
-            GROUP BY 
-                CASE 
-                    WHEN raw_score >= 95 THEN '95-100%'
-                    WHEN raw_score >= 90 THEN '90-95%'
-                    WHEN raw_score >= 80 THEN '80-90%'
-                    WHEN raw_score >= 70 THEN '70-80%'
-                    WHEN raw_score >= 60 THEN '60-70%'
-                    ELSE '0-60%'
-                END
-            ORDER BY MIN(raw_score) DESC
-        """)
-        
-        top_users = await conn.fetch("""
-            SELECT username, user_id, COUNT(*) as image_count, AVG(raw_score) as avg_score, MAX(raw_score) as best_score
-            FROM images 
-            WHERE approved = 1
-            GROUP BY username, user_id
-            ORDER BY image_count DESC
-            LIMIT 10
-        """)
-    
+    images_template = '''{% extends "base.html" %}
+{% block content %}
+<div class="animate-fade-in" x-data="imagesPage()">
+    <div class="glass rounded-xl p-6 mb-6">
+        <div class="flex items-center justify-between mb-6">
+            <h2 class="text-xl font-bold text-white flex items-center">
+                <i class="fas fa-images mr-3 text-blue-400"></i>
+                Изображения
+            </h2>
+            <form method="get" action="/images" class="flex space-x-4">
+                <select name="approved" class="px-4 py-2 bg-white/10 border border-white/20 rounded-lg text-white focus:outline-none focus:border-white/40">
+                    <option value="" {% if filters.approved is none %}selected{% endif %}>Все</option>
+                    <option value="1" {% if filters.approved == 1 %}selected{% endif %}>Одобренные</option>
+                    <option value="0" {% if filters.approved == 0 %}selected{% endif %}>На модерации</option>
+                </select>
+                <select name="nsfw" class="px-4 py-2 bg-white/10 border border-white/20 rounded-lg text-white focus:outline-none focus:border-white/40">
+                    <option value="" {% if filters.nsfw is none %}selected{% endif %}>NSFW: все</option>
+                    <option value="0" {% if filters.nsfw == 0 %}selected{% endif %}>Без NSFW</option>
+                    <option value="1" {% if filters.nsfw == 1 %}selected{% endif %}>Только NSFW</option>
+                </select>
+                <input type="number" step="any" name="min_score" value="{{ filters.min_score if filters.min_score is not none else '' }}" placeholder="от %" class="px-3 py-2 bg-white/10 border border-white/20 rounded-lg text-white placeholder-white/50 w-24">
+                <input type="number" step="any" name="max_score" value="{{ filters.max_score if filters.max_score is not none else '' }}" placeholder="до %" class="px-3 py-2 bg-white/10 border border-white/20 rounded-lg text-white placeholder-white/50 w-24">
+                <button type="submit" class="px-4 py-2 bg-blue-500/20 hover:bg-blue-500/30 rounded-lg text-white transition-colors">
+                    <i class="fas fa-filter mr-2"></i>Фильтр
+                </button>
+            </form>
+        </div>
+
+        <div class="flex items-center justify-between mb-4 px-4 py-3 bg-white/5 rounded-lg">
+            <div class="text-white/70 text-sm">
+                Выбрано: <span class="text-white font-medium" x-text="selected.size"></span>
+                <button @click="selectFiltered()" :disabled="busy" class="ml-4 px-3 py-1 bg-white/10 hover:bg-white/20 rounded text-white text-xs">
+                    Выбрать все по фильтру
+                </button>
+                <button x-show="selected.size" @click="clearSelection()" class="ml-2 px-3 py-1 bg-white/10 hover:bg-white/20 rounded text-white text-xs">
+                    Снять выделение
+                </button>
+            </div>
+            <div class="flex space-x-2" x-show="selected.size">
+                <button @click="bulk('approve')" :disabled="busy" class="px-3 py-1 bg-green-500/20 hover:bg-green-500/40 text-green-400 rounded text-sm">
+                    <i class="fas fa-check mr-1"></i>Одобрить
+                </button>
+                <button @click="bulk('ban')" :disabled="busy" class="px-3 py-1 bg-yellow-500/20 hover:bg-yellow-500/40 text-yellow-400 rounded text-sm">
+                    <i class="fas fa-ban mr-1"></i>Бан
+                </button>
+                <button @click="bulk('delete')" :disabled="busy" class="px-3 py-1 bg-red-500/20 hover:bg-red-500/40 text-red-400 rounded text-sm">
+                    <i class="fas fa-trash mr-1"></i>Удалить
+                </button>
+            </div>
+        </div>
+
+        <div class="overflow-x-auto">
+            <table class="w-full">
+                <thead>
+                    <tr class="border-b border-white/10">
+                        <th class="py-3 px-4"><input type="checkbox" id="selectPage" @change="selectPage($event.target.checked)"></th>
+                        <th class="text-left py-3 px-4 font-medium text-white/70">Фото</th>
+                        <th class="text-left py-3 px-4 font-medium text-white/70">ID</th>
+                        <th class="text-left py-3 px-4 font-medium text-white/70">Пользователь</th>
+                        <th class="text-left py-3 px-4 font-medium text-white/70">Оценка</th>
+                        <th class="text-left py-3 px-4 font-medium text-white/70">Статус</th>
+                        <th class="text-left py-3 px-4 font-medium text-white/70">Дата</th>
+                        <th class="text-left py-3 px-4 font-medium text-white/70">Действия</th>
+                    </tr>
+                </thead>
+                <tbody id="imagesBody" @change="onSelect($event)">
+                    {% for image in images %}
+                    <tr class="border-b border-white/5 hover:bg-white/5">
+                        <td class="py-3 px-4"><input type="checkbox" class="image-select" value="{{ image.id }}"></td>
+                        <td class="py-2 px-4"><img src="/thumb/{{ image.id }}" loading="lazy" alt="" class="w-12 h-12 object-cover rounded" onerror="this.style.visibility='hidden'"></td>
+                        <td class="py-3 px-4 text-white">{{ image.id }}</td>
+                        <td class="py-3 px-4"><a href="/user/{{ image.user_id }}" class="text-white hover:underline">{{ image.username or 'Аноним' }}</a></td>
+                        <td class="py-3 px-4 text-white">{{ "%.2f"|format(image.raw_score) }}%</td>
+                        <td class="py-3 px-4">
+                            <span class="px-2 py-1 rounded-full text-xs {% if image.approved %}bg-green-500/20 text-green-400{% else %}bg-yellow-500/20 text-yellow-400{% endif %}">
+                                {% if image.approved %}Одобрено{% else %}На модерации{% endif %}
+                            </span>
+                            {% if image.nsfw %}
+                            <span class="px-2 py-1 bg-red-500/20 text-red-400 rounded-full text-xs ml-1">NSFW</span>
+                            {% endif %}
+                        </td>
+                        <td class="py-3 px-4 text-white/70">{{ image.created_at.strftime('%d.%m.%Y %H:%M') }}</td>
+                        <td class="py-3 px-4">
+                            <div class="flex space-x-2">
+                                {% if not image.approved %}
+                                <button onclick="approveImage({{ image.id }})" class="px-2 py-1 bg-green-500/20 hover:bg-green-500/40 text-green-400 rounded text-xs">
+                                    Одобрить
+                                </button>
+                                {% endif %}
+                                <button onclick="deleteImage({{ image.id }})" class="px-2 py-1 bg-red-500/20 hover:bg-red-500/40 text-red-400 rounded text-xs">
+                                    Удалить
+                                </button>
+                            </div>
+                        </td>
+                    </tr>
+                    {% endfor %}
+                </tbody>
+            </table>
+        </div>
+        <div id="imagesSentinel" class="py-6 text-center text-white/60" x-show="cursor">
+            <i class="fas fa-spinner fa-spin mr-2"></i>Загрузка...
+        </div>
+    </div>
+</div>
+
+<script>
+function filterParams() {
+    const params = new URLSearchParams(location.search);
+    for (const [key, value] of [...params]) if (value === '') params.delete(key);
+    return params;
+}
+
+function imagesPage() {
+    return {
+        cursor: {{ next_cursor|tojson }},
+        loading: false,
+        busy: false,
+        selected: new Set(),
+        bulkMax: {{ bulk_max }},
+        init() {
+            const observer = new IntersectionObserver((entries) => {
+                if (entries[0].isIntersecting) this.loadMore();
+            });
+            observer.observe(document.getElementById('imagesSentinel'));
+        },
+        async loadMore() {
+            if (!this.cursor || this.loading) return;
+            this.loading = true;
+            const params = filterParams();
+            params.set('cursor', this.cursor);
+            try {
+                const response = await fetch(`/api/images?${params}`);
+                const data = await response.json();
+                const body = document.getElementById('imagesBody');
+                for (const image of data.items) body.insertAdjacentHTML('beforeend', renderImageRow(image, this.selected.has(image.id)));
+                this.cursor = data.next_cursor;
+            } finally {
+                this.loading = false;
+            }
+        },
+        onSelect(event) {
+            if (!event.target.classList.contains('image-select')) return;
+            const id = Number(event.target.value);
+            event.target.checked ? this.selected.add(id) : this.selected.delete(id);
+            this.selected = new Set(this.selected);
+        },
+        selectPage(checked) {
+            for (const box of document.querySelectorAll('.image-select')) {
+                box.checked = checked;
+                const id = Number(box.value);
+                checked ? this.selected.add(id) : this.selected.delete(id);
+            }
+            this.selected = new Set(this.selected);
+        },
+        async selectFiltered() {
+            const params = filterParams();
+            params.delete('cursor');
+            const response = await fetch(`/api/images/ids?${params}`);
+            if (!response.ok) return alert('Не удалось получить список изображений');
+            const data = await response.json();
+            this.selected = new Set(data.ids);
+            for (const box of document.querySelectorAll('.image-select')) box.checked = this.selected.has(Number(box.value));
+        },
+        clearSelection() {
+            this.selected = new Set();
+            document.getElementById('selectPage').checked = false;
+            for (const box of document.querySelectorAll('.image-select')) box.checked = false;
+        },
+        async bulk(action) {
+            const labels = { approve: 'Одобрить', ban: 'Забанить авторов', delete: 'Удалить' };
+            if (!confirm(`${labels[action]}: ${this.selected.size} изображений?`)) return;
+            const ids = [...this.selected];
+            this.busy = true;
+            try {
+                for (let i = 0; i < ids.length; i += this.bulkMax) {
+                    const response = await fetch(`/api/images/bulk/${action}`, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ ids: ids.slice(i, i + this.bulkMax) })
+                    });
+                    if (!response.ok) throw new Error(response.status);
+                }
+                location.reload();
+            } catch (error) {
+                alert('Ошибка массовой модерации');
+            } finally {
+                this.busy = false;
+            }
+        }
+    }
+}
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value;
+    return div.innerHTML;
+}
+
+function renderImageRow(image, checked) {
+    const created = new Date(image.created_at).toLocaleString('ru-RU', { day: '2-digit', month: '2-digit', year: 'numeric', hour: '2-digit', minute: '2-digit' }).replace(',', '');
+    const status = image.approved
+        ? '<span class="px-2 py-1 rounded-full text-xs bg-green-500/20 text-green-400">Одобрено</span>'
+        : '<span class="px-2 py-1 rounded-full text-xs bg-yellow-500/20 text-yellow-400">На модерации</span>';
+    const nsfw = image.nsfw ? '<span class="px-2 py-1 bg-red-500/20 text-red-400 rounded-full text-xs ml-1">NSFW</span>' : '';
+    const approve = image.approved ? '' : `<button onclick="approveImage(${image.id})" class="px-2 py-1 bg-green-500/20 hover:bg-green-500/40 text-green-400 rounded text-xs">Одобрить</button>`;
+    return `<tr class="border-b border-white/5 hover:bg-white/5">
+        <td class="py-3 px-4"><input type="checkbox" class="image-select" value="${image.id}" ${checked ? 'checked' : ''}></td>
+        <td class="py-2 px-4"><img src="/thumb/${image.id}" loading="lazy" alt="" class="w-12 h-12 object-cover rounded" onerror="this.style.visibility='hidden'"></td>
+        <td class="py-3 px-4 text-white">${image.id}</td>
+        <td class="py-3 px-4"><a href="/user/${image.user_id}" class="text-white hover:underline">${escapeHtml(image.username || 'Аноним')}</a></td>
+        <td class="py-3 px-4 text-white">${image.raw_score.toFixed(2)}%</td>
+        <td class="py-3 px-4">${status}${nsfw}</td>
+        <td class="py-3 px-4 text-white/70">${created}</td>
+        <td class="py-3 px-4"><div class="flex space-x-2">${approve}<button onclick="deleteImage(${image.id})" class="px-2 py-1 bg-red-500/20 hover:bg-red-500/40 text-red-400 rounded text-xs">Удалить</button></div></td>
+    </tr>`;
+}
+</script>
+{% endblock %}'''
+
     analytics_template = '''{% extends "base.html" %}
 {% block content %}
 <div class="animate-fade-in">
@@ -857,20 +887,7 @@ async def analytics_page(request: Request, user: str = Depends(authenticate)):
     </div>
 </div>
 {% endblock %}'''
-    
-    if not os.path.exists("templates/analytics.html"):
-        with open("templates/analytics.html", "w", encoding="utf-8") as f:
-            f.write(analytics_template)
-    
-    return templates.TemplateResponse("analytics.html", {
-        "request": request,
-        "daily_stats": daily_stats,
-        "score_distribution": score_distribution,
-        "top_users": top_users
-    })
 
-@app.get("/settings", response_class=HTMLResponse)
-async def settings_page(request: Request, user: str = Depends(authenticate)):
     settings_template = '''{% extends "base.html" %}
 {% block content %}
 <div class="animate-fade-in">
@@ -989,12 +1006,468 @@ async def settings_page(request: Request, user: str = Depends(authenticate)):
 }
 </style>
 {% endblock %}'''
+
+    return {
+        "base.html": main_template,
+        "dashboard.html": dashboard_template,
+        "users.html": users_template,
+        "user_detail.html": user_detail_template,
+        "images.html": images_template,
+        "analytics.html": analytics_template,
+        "settings.html": settings_template,
+    }
+
+ADMIN_CSS = '''.glass { backdrop-filter: blur(10px); background: rgba(255, 255, 255, 0.1); border: 1px solid rgba(255, 255, 255, 0.2); }
+.gradient-bg { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); }
+.card-hover:hover { transform: translateY(-4px); transition: all 0.3s ease; }
+.animate-fade-in { animation: fadeIn 0.5s ease-in; }
+@keyframes fadeIn { from { opacity: 0; transform: translateY(20px); } to { opacity: 1; transform: translateY(0); } }
+.stat-card { background: linear-gradient(135deg, rgba(99, 102, 241, 0.1) 0%, rgba(139, 92, 246, 0.1) 100%); }
+'''
+
+ADMIN_JS = '''function updateTime() {
+    const now = new Date();
+    const timeStr = now.toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' });
+    const timeEl = document.querySelector('.text-white\\/80');
+    if (timeEl) timeEl.textContent = timeStr;
+}
+setInterval(updateTime, 1000);
+
+async function approveImage(imageId) {
+    try {
+        const response = await fetch(`/api/approve/${imageId}`, { method: 'POST' });
+        if (response.ok) location.reload();
+    } catch (error) {
+        alert('Ошибка при одобрении');
+    }
+}
+
+async function banUser(imageId) {
+    if (confirm('Забанить пользователя?')) {
+        try {
+            const response = await fetch(`/api/ban/${imageId}`, { method: 'POST' });
+            if (response.ok) location.reload();
+        } catch (error) {
+            alert('Ошибка при бане');
+        }
+    }
+}
+
+async function deleteImage(imageId) {
+    if (confirm('Удалить изображение?')) {
+        try {
+            const response = await fetch(`/api/delete/${imageId}`, { method: 'DELETE' });
+            if (response.ok) location.reload();
+        } catch (error) {
+            alert('Ошибка при удалении');
+        }
+    }
+}
+'''
+
+def _static_asset(content: str, media_type: str) -> Dict[str, str]:
+    body = content.encode("utf-8")
+    return {"body": body, "media_type": media_type, "etag": hashlib.sha256(body).hexdigest()[:16]}
+
+STATIC_ASSETS = {
+    "admin.css": _static_asset(ADMIN_CSS, "text/css; charset=utf-8"),
+    "admin.js": _static_asset(ADMIN_JS, "application/javascript; charset=utf-8"),
+}
+
+def static_url(name: str) -> str:
+    return f"/static/{name}?v={STATIC_ASSETS[name]['etag']}"
+
+def _create_template_env() -> jinja2.Environment:
+    env = jinja2.Environment(
+        loader=jinja2.DictLoader(create_templates()),
+        autoescape=jinja2.select_autoescape(default=True),
+        auto_reload=ADMIN_DEBUG,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(),
+    )
+    env.globals["datetime"] = datetime
+    env.globals["static_url"] = static_url
+    for name in env.list_templates():
+        env.get_template(name)
+    return env
+
+templates = Jinja2Templates(env=_create_template_env())
+
+@app.on_event("startup")
+async def startup_event():
+    await get_db_pool()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global _pool
+    if _pool:
+        await _pool.close()
+    if _bot is not None:
+        await _bot.session.close()
+
+def _storage_bot():
+    global _bot
+    if _bot is None:
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+        _bot = Bot(token=BOT_TOKEN, session=session)
+    return _bot
+
+async def _download_photo(file_id: Optional[str]) -> Optional[bytes]:
+    if not file_id or not BOT_TOKEN:
+        return None
+    try:
+        bot = _storage_bot()
+        file_obj = await bot.get_file(file_id)
+        return (await bot.download_file(file_obj.file_path)).getvalue()
+    except Exception:
+        return None
+
+@app.middleware("http")
+async def record_request_time(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    tracing.record("admin_request", time.perf_counter() - start)
+    return response
+
+@app.get("/metrics")
+async def metrics(user: str = Depends(authenticate)):
+    hists = {name: tracing.Histogram.from_dict(hist.to_dict()) for name, hist in tracing.histograms().items()}
+    gauges = {}
+    snapshot = await asyncio.to_thread(tracing.read_snapshot, METRICS_PATH)
+    if snapshot:
+        for name, hist in snapshot["histograms"].items():
+            hists.setdefault(name, tracing.Histogram()).merge(hist)
+        gauges.update(snapshot["gauges"])
+        gauges["bot_snapshot_age_seconds"] = round(time.time() - snapshot["written_at"], 3)
+    return Response(content=tracing.render_prometheus(hists, gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/static/{name}")
+async def static_asset(name: str, request: Request):
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    etag = f'"{asset["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=asset["body"], media_type=asset["media_type"], headers=headers)
+
+@app.get("/thumb/{image_id}")
+async def thumbnail(image_id: int, request: Request, user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("SELECT filename, image_hash, file_id FROM images WHERE id = $1", image_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    etag = thumbnails.etag(row["image_hash"])
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    with tracing.span('thumbnail'):
+        path = await thumbnails.get(row["image_hash"], row["filename"], lambda: _download_photo(row["file_id"]))
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(path, media_type="image/webp", headers=headers)
+
+@app.get("/", response_class=HTMLResponse)
+async def dashboard(request: Request, user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        stats = {}
+        stats['total_images'] = await conn.fetchval("SELECT COUNT(*) FROM images")
+        stats['approved_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE approved = 1")
+        stats['pending_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE approved = 0")
+        stats['total_users'] = await conn.fetchval("SELECT COUNT(*) FROM user_stats WHERE image_count > 0")
+        stats['today_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE DATE(created_at) = CURRENT_DATE")
+        stats['week_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'")
+        stats['month_images'] = await conn.fetchval("SELECT COUNT(*) FROM images WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'")
+        
+        pending_images = await conn.fetch("""
+            SELECT id, user_id, username, raw_score, created_at
+            FROM images 
+            WHERE approved = 0 AND raw_score > 85
+            ORDER BY created_at DESC 
+            LIMIT 20
+        """)
+        
+        top_images = await conn.fetch("""
+            SELECT username, raw_score, user_id
+            FROM images 
+            WHERE approved = 1 AND nsfw = 0
+            ORDER BY raw_score DESC 
+            LIMIT 10
+        """)
+    
+    return templates.TemplateResponse("dashboard.html", {
+        "request": request,
+        "stats": stats,
+        "pending_images": pending_images,
+        "top_images": top_images,
+        "datetime": datetime
+    })
+
+@app.get("/users", response_class=HTMLResponse)
+async def users_page(request: Request, cursor: Optional[str] = None, status: Optional[str] = None,
+                     limit: Optional[int] = None, user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        users_data, next_cursor = await _fetch_users_page(conn, cursor, _page_limit(limit), status)
+    
+    return templates.TemplateResponse("users.html", {
+        "request": request,
+        "users": users_data,
+        "status": status,
+        "next_cursor": next_cursor
+    })
+
+@app.get("/images", response_class=HTMLResponse)
+async def images_page(request: Request, cursor: Optional[str] = None, approved: OptionalInt = None,
+                      nsfw: OptionalInt = None, min_score: OptionalFloat = None, max_score: OptionalFloat = None,
+                      limit: OptionalInt = None, user: str = Depends(authenticate)):
+    filters = {"approved": approved, "nsfw": nsfw, "min_score": min_score, "max_score": max_score}
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        images, next_cursor = await _fetch_images_page(conn, cursor, _page_limit(limit), **filters)
+    
+    return templates.TemplateResponse("images.html", {
+        "request": request,
+        "images": images,
+        "filters": filters,
+        "next_cursor": next_cursor,
+        "bulk_max": BULK_MODERATION_MAX
+    })
+
+@app.get("/api/images")
+async def api_images(cursor: Optional[str] = None, approved: OptionalInt = None, nsfw: OptionalInt = None,
+                     min_score: OptionalFloat = None, max_score: OptionalFloat = None,
+                     user_id: OptionalInt = None, limit: OptionalInt = None, user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows, next_cursor = await _fetch_images_page(conn, cursor, _page_limit(limit), user_id=user_id,
+                                                     approved=approved, nsfw=nsfw,
+                                                     min_score=min_score, max_score=max_score)
+    return {"items": [_image_json(r) for r in rows], "next_cursor": next_cursor}
+
+@app.get("/api/users")
+async def api_users(cursor: Optional[str] = None, status: Optional[str] = None, limit: OptionalInt = None,
+                    user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows, next_cursor = await _fetch_users_page(conn, cursor, _page_limit(limit), status)
+    return {"items": [dict(r) for r in rows], "next_cursor": next_cursor}
+
+@app.get("/api/images/ids")
+async def api_image_ids(approved: OptionalInt = None, nsfw: OptionalInt = None,
+                        min_score: OptionalFloat = None, max_score: OptionalFloat = None,
+                        user_id: OptionalInt = None, user: str = Depends(authenticate)):
+    args = []
+
+    def arg(value):
+        args.append(value)
+        return f"${len(args)}"
+
+    where = _image_filters(arg, user_id=user_id, approved=approved, nsfw=nsfw, min_score=min_score, max_score=max_score)
+    query = "SELECT id FROM images"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += f" ORDER BY created_at DESC, id DESC LIMIT {arg(BULK_MODERATION_MAX)}"
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    return {"ids": [r["id"] for r in rows]}
+
+async def _moderate_images(action: str, ids: List[int]) -> dict:
+    users = Counter()
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if action == "approve":
+                rows = await conn.fetch(
+                    "UPDATE images SET approved = 1 WHERE id = ANY($1::int[]) AND approved IS DISTINCT FROM 1 RETURNING id", ids)
+            elif action == "ban":
+                rows = await conn.fetch("UPDATE images SET approved = 0 WHERE id = ANY($1::int[]) RETURNING user_id", ids)
+                users.update(r["user_id"] for r in rows)
+                if users:
+                    await conn.execute("""
+                        INSERT INTO user_stats (user_id, warnings, banned)
+                        SELECT user_id, warnings, 1 FROM unnest($1::bigint[], $2::int[]) AS w(user_id, warnings)
+                        ON CONFLICT (user_id)
+                        DO UPDATE SET warnings = user_stats.warnings + EXCLUDED.warnings, banned = 1
+                    """, list(users), list(users.values()))
+            else:
+                rows = await conn.fetch("DELETE FROM images WHERE id = ANY($1::int[]) RETURNING id", ids)
+            if rows:
+                await conn.execute("SELECT pg_notify($1, $2)", TOP_CHANNEL, action)
+    return {"status": "success", "images": len(rows), "users": len(users)}
+
+class BulkModeration(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=BULK_MODERATION_MAX)
+
+@app.post("/api/images/bulk/{action}")
+async def bulk_moderate(action: Literal["approve", "ban", "delete"], payload: BulkModeration,
+                        user: str = Depends(authenticate)):
+    return await _moderate_images(action, sorted(set(payload.ids)))
+
+@app.post("/api/approve/{image_id}")
+async def approve_image(image_id: int, user: str = Depends(authenticate)):
+    return await _moderate_images("approve", [image_id])
+
+@app.post("/api/ban/{image_id}")
+async def ban_image(image_id: int, user: str = Depends(authenticate)):
+    return await _moderate_images("ban", [image_id])
+
+@app.delete("/api/delete/{image_id}")
+async def delete_image(image_id: int, user: str = Depends(authenticate)):
+    return await _moderate_images("delete", [image_id])
+
+@app.post("/api/ban-user/{user_id}")
+async def ban_user_by_id(user_id: int, user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO user_stats (user_id, warnings, banned) 
+            VALUES ($1, 1, 1) 
+            ON CONFLICT (user_id) 
+            DO UPDATE SET banned = 1, warnings = GREATEST(user_stats.warnings, 1)
+        """, user_id)
+    return {"status": "success"}
+
+@app.post("/api/unban-user/{user_id}")
+async def unban_user(user_id: int, user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO user_stats (user_id, warnings, banned) 
+            VALUES ($1, 0, 0) 
+            ON CONFLICT (user_id) 
+            DO UPDATE SET banned = 0
+        """, user_id)
+    return {"status": "success"}
+
+@app.get("/api/stats")
+async def get_stats(user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        total_images = await conn.fetchval("SELECT COUNT(*) FROM images")
+        approved_images = await conn.fetchval("SELECT COUNT(*) FROM images WHERE approved = 1")
+        pending_images = await conn.fetchval("SELECT COUNT(*) FROM images WHERE approved = 0")
+        total_users = await conn.fetchval("SELECT COUNT(*) FROM user_stats WHERE image_count > 0")
+        banned_users = await conn.fetchval("SELECT COUNT(*) FROM user_stats WHERE banned = 1")
+        
+        daily_stats = await conn.fetch("""
+            SELECT DATE(created_at) as date, COUNT(*) as count
+            FROM images 
+            WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
+            GROUP BY DATE(created_at)
+            ORDER BY date
+        """)
+        
+        top_scores = await conn.fetch("""
+            SELECT raw_score, COUNT(*) as count
+            FROM images 
+            WHERE approved = 1
+            GROUP BY CASE 
+                WHEN raw_score >= 90 THEN '90+'
+                WHEN raw_score >= 80 THEN '80-89'
+                WHEN raw_score >= 70 THEN '70-79'
+                WHEN raw_score >= 60 THEN '60-69'
+                ELSE '0-59'
+            END
+            ORDER BY raw_score DESC
+        """)
     
-    if not os.path.exists("templates/settings.html"):
-        with open("templates/settings.html", "w", encoding="utf-8") as f:
-            f.write(settings_template)
+    return {
+        "total_images": total_images,
+        "approved_images": approved_images,
+        "pending_images": pending_images,
+        "total_users": total_users,
+        "banned_users": banned_users,
+        "daily_stats": [{"date": str(row["date"]), "count": row["count"]} for row in daily_stats],
+        "score_distribution": [{"range": row["raw_score"], "count": row["count"]} for row in top_scores]
+    }
+
+@app.get("/user/{user_id}", response_class=HTMLResponse)
+async def user_detail(request: Request, user_id: int, cursor: Optional[str] = None, limit: Optional[int] = None,
+                      user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        user_info = await conn.fetchrow("""
+            SELECT user_id, username, image_count, approved_count, approved_best_score AS best_score,
+                   warnings, banned
+            FROM user_stats
+            WHERE user_id = $1
+        """, user_id)
+        
+        user_images, next_cursor = await _fetch_images_page(conn, cursor, _page_limit(limit), user_id=user_id)
     
+
+    return templates.TemplateResponse("user_detail.html", {
+        "request": request,
+        "user_info": user_info,
+        "user_images": user_images,
+        "next_cursor": next_cursor
+    })
+
+@app.get("/analytics", response_class=HTMLResponse)
+async def analytics_page(request: Request, user: str = Depends(authenticate)):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        daily_stats = await conn.fetch("""
+            SELECT DATE(created_at) as date, COUNT(*) as count
+            FROM images 
+            WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'
+            GROUP BY DATE(created_at)
+            ORDER BY date
+        """)
+        
+        score_distribution = await conn.fetch("""
+            SELECT 
+                CASE 
+                    WHEN raw_score >= 95 THEN '95-100%'
+                    WHEN raw_score >= 90 THEN '90-95%'
+                    WHEN raw_score >= 80 THEN '80-90%'
+                    WHEN raw_score >= 70 THEN '70-80%'
+                    WHEN raw_score >= 60 THEN '60-70%'
+                    ELSE '0-60%'
+                END as score_range,
+                COUNT(*) as count
+            FROM images 
+            WHERE approved = 1
+            GROUP BY 
+                CASE 
+                    WHEN raw_score >= 95 THEN '95-100%'
+                    WHEN raw_score >= 90 THEN '90-95%'
+                    WHEN raw_score >= 80 THEN '80-90%'
+                    WHEN raw_score >= 70 THEN '70-80%'
+                    WHEN raw_score >= 60 THEN '60-70%'
+                    ELSE '0-60%'
+                END
+            ORDER BY MIN(raw_score) DESC
+        """)
+        
+        top_users = await conn.fetch("""
+            SELECT username, user_id, approved_count as image_count,
+                   approved_score_sum / approved_count as avg_score, approved_best_score as best_score
+            FROM user_stats 
+            WHERE approved_count > 0
+            ORDER BY approved_count DESC, user_id DESC
+            LIMIT 10
+        """)
+    
+
+    return templates.TemplateResponse("analytics.html", {
+        "request": request,
+        "daily_stats": daily_stats,
+        "score_distribution": score_distribution,
+        "top_users": top_users
+    })
+
+@app.get("/settings", response_class=HTMLResponse)
+async def settings_page(request: Request, user: str = Depends(authenticate)):
+
     return templates.TemplateResponse("settings.html", {"request": request})
 
 if __name__ == "__main__":
-    uvicorn.run("admin_panel:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("admin_panel:app", host="0.0.0.0", port=8000, reload=ADMIN_DEBUG)
\ No newline at end of file
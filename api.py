@@ -0,0 +1,223 @@
+from fastapi import FastAPI, Request, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from fastapi.security import APIKeyHeader
+from starlette.datastructures import UploadFile
+import asyncio
+import json
+import secrets
+import tarfile
+import tempfile
+import time
+import zipfile
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import uvicorn
+
+from config import (DUPLICATE_SIMILARITY, SCORING_API_KEYS, SCORING_API_KEY_CONCURRENCY,
+                    SCORING_API_MAX_FILES, SCORING_API_MAX_FILE_BYTES, SCORING_API_MAX_BODY_BYTES)
+from model import model
+from utils import func, tracing
+
+ARCHIVE_TYPES = {
+    'application/x-tar': 'tar',
+    'application/x-gtar': 'tar',
+    'application/gzip': 'tar',
+    'application/x-gzip': 'tar',
+    'application/zip': 'zip',
+    'application/x-zip-compressed': 'zip',
+}
+SPOOL_BYTES = 8 * 1024 ** 2
+
+app = FastAPI(title="Cuteness Scoring API", docs_url=None, redoc_url=None)
+api_key_header = APIKeyHeader(name='X-API-Key', auto_error=False)
+
+_keys = {key: name for name, _, key in (entry.strip().rpartition(':') for entry in SCORING_API_KEYS.split(',')) if key}
+_key_slots: Dict[str, asyncio.Semaphore] = {}
+_inference_lock = asyncio.Lock()
+
+async def authenticate(api_key: Optional[str] = Depends(api_key_header)) -> str:
+    for key, name in _keys.items():
+        if api_key and secrets.compare_digest(api_key, key):
+            return name or key[:8]
+    raise HTTPException(status_code=401, detail="Invalid API key")
+
+def _iter_archive(spool, kind: str) -> Iterator[Tuple[str, bytes]]:
+    spool.seek(0)
+    if kind == 'zip':
+        with zipfile.ZipFile(spool) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.file_size <= SCORING_API_MAX_FILE_BYTES:
+                    yield info.filename, archive.read(info)
+        return
+    with tarfile.open(fileobj=spool, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and member.size <= SCORING_API_MAX_FILE_BYTES:
+                yield member.name, archive.extractfile(member).read()
+
+async def _archive_items(spool, kind: str, batch_size: int) -> AsyncIterator[List[Tuple[str, bytes]]]:
+    members = _iter_archive(spool, kind)
+    while True:
+        try:
+            batch = await asyncio.to_thread(lambda: [item for _, item in zip(range(batch_size), members)])
+        except (tarfile.TarError, zipfile.BadZipFile) as e:
+            raise ValueError(f'Broken archive: {e}')
+        if not batch:
+            return
+        yield batch
+
+async def _upload_items(files: List[UploadFile], batch_size: int) -> AsyncIterator[List[Tuple[str, bytes]]]:
+    for start in range(0, len(files), batch_size):
+        yield [(f.filename or '', await f.read(SCORING_API_MAX_FILE_BYTES + 1)) for f in files[start:start + batch_size]]
+
+def _score_batch(items: List[Tuple[str, bytes]]) -> List[Optional[Tuple[float, np.ndarray]]]:
+    tensors, positions = [], []
+    for position, (_, data) in enumerate(items):
+        if len(data) > SCORING_API_MAX_FILE_BYTES:
+            continue
+        try:
+            tensors.append(model._to_tensor(data))
+            positions.append(position)
+        except Exception:
+            continue
+    results: List[Optional[Tuple[float, np.ndarray]]] = [None] * len(items)
+    if tensors:
+        scores, embeddings = model.scores_and_embeddings(tensors)
+        for position, score, embedding in zip(positions, scores, embeddings):
+            results[position] = (score, embedding)
+    return results
+
+class _SeenImages:
+    def __init__(self):
+        self.hashes: Dict[str, int] = {}
+        self.vectors: Optional[np.ndarray] = None
+        self.indexes = np.empty(0, dtype=np.int64)
+        self.count = 0
+
+    def _append(self, vectors: np.ndarray, indexes: List[int]) -> None:
+        needed = self.count + len(vectors)
+        if self.vectors is None or needed > len(self.vectors):
+            capacity = max(needed, 256, 2 * self.count)
+            grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            grown_indexes = np.empty(capacity, dtype=np.int64)
+            if self.count:
+                grown[:self.count] = self.vectors[:self.count]
+                grown_indexes[:self.count] = self.indexes[:self.count]
+            self.vectors, self.indexes = grown, grown_indexes
+        self.vectors[self.count:needed] = vectors
+        self.indexes[self.count:needed] = indexes
+        self.count = needed
+
+    def match(self, first_index: int, hashes: List[str],
+              results: List[Optional[Tuple[float, np.ndarray]]]) -> List[Optional[int]]:
+        matches: List[Optional[int]] = [None] * len(results)
+        positions = [position for position, result in enumerate(results) if result is not None]
+        if not positions:
+            return matches
+        vectors = np.stack([results[position][1] for position in positions]).astype(np.float32)
+        previous = vectors @ self.vectors[:self.count].T if self.count else None
+        within = vectors @ vectors.T
+        for k, position in enumerate(positions):
+            duplicate_of = self.hashes.get(hashes[position])
+            if duplicate_of is None:
+                best, similarity = None, -np.inf
+                if previous is not None:
+                    j = int(np.argmax(previous[k]))
+                    best, similarity = int(self.indexes[j]), previous[k, j]
+                if k:
+                    j = int(np.argmax(within[k, :k]))
+                    if within[k, j] > similarity:
+                        best, similarity = first_index + positions[j], within[k, j]
+                if similarity >= DUPLICATE_SIMILARITY:
+                    duplicate_of = best
+            matches[position] = duplicate_of
+            self.hashes.setdefault(hashes[position], first_index + position)
+        self._append(vectors, [first_index + position for position in positions])
+        return matches
+
+def _annotate(items: List[Tuple[str, bytes]], results: List[Optional[Tuple[float, np.ndarray]]], first_index: int,
+              with_hash: bool, seen: Optional[_SeenImages]) -> Tuple[List[str], List[Optional[int]]]:
+    hashes = [func.calculate_image_hash(data) for _, data in items] if with_hash or seen else []
+    return hashes, seen.match(first_index, hashes, results) if seen else []
+
+async def _stream_scores(batches: AsyncIterator[List[Tuple[str, bytes]]], with_hash: bool, dedup: bool,
+                         slot: asyncio.Semaphore, cleanup) -> AsyncIterator[bytes]:
+    started = time.perf_counter()
+    index = errors = 0
+    seen = _SeenImages() if dedup else None
+    try:
+        try:
+            async for items in batches:
+                with tracing.span('api_score_batch', images=len(items)):
+                    async with _inference_lock:
+                        results = await asyncio.to_thread(_score_batch, items)
+                    hashes, duplicates = await asyncio.to_thread(_annotate, items, results, index, with_hash, seen)
+                lines = []
+                for position, ((name, _), result) in enumerate(zip(items, results)):
+                    line = {'index': index, 'name': name}
+                    if result is None:
+                        line['error'] = 'too_large' if len(items[position][1]) > SCORING_API_MAX_FILE_BYTES else 'undecodable'
+                        errors += 1
+                    else:
+                        raw, embedding = result
+                        line['score'] = func.map_score(raw)
+                        line['raw_score'] = round(raw, 4)
+                    if hashes:
+                        line['sha256'] = hashes[position]
+                    if dedup and result is not None:
+                        line['duplicate_of'] = duplicates[position]
+                    lines.append(json.dumps(line, ensure_ascii=False))
+                    index += 1
+                yield ('\n'.join(lines) + '\n').encode()
+        except ValueError as e:
+            yield (json.dumps({'error': str(e)}) + '\n').encode()
+        yield (json.dumps({'done': True, 'count': index, 'errors': errors,
+                           'seconds': round(time.perf_counter() - started, 3)}) + '\n').encode()
+    finally:
+        slot.release()
+        await cleanup()
+
+@app.on_event("startup")
+async def startup_event():
+    await asyncio.to_thread(model.get_model)
+
+@app.post("/v1/score")
+async def score_images(request: Request, with_hash: bool = Query(False, alias='hash'), dedup: bool = Query(False),
+                       key: str = Depends(authenticate)):
+    slot = _key_slots.setdefault(key, asyncio.Semaphore(SCORING_API_KEY_CONCURRENCY))
+    if slot.locked():
+        raise HTTPException(status_code=429, detail="Too many concurrent requests for this key", headers={'Retry-After': '1'})
+    await slot.acquire()
+    batch_size = max(model.profile['batch_size'], 8)
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    try:
+        if content_type == 'multipart/form-data':
+            form = await request.form(max_files=SCORING_API_MAX_FILES, max_fields=SCORING_API_MAX_FILES)
+            files = [f for f in form.getlist('files') if isinstance(f, UploadFile)]
+            if not files:
+                await form.close()
+                raise HTTPException(status_code=400, detail="No files in the 'files' field")
+            batches, cleanup = _upload_items(files, batch_size), form.close
+        elif content_type in ARCHIVE_TYPES:
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+            size = 0
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > SCORING_API_MAX_BODY_BYTES:
+                    spool.close()
+                    raise HTTPException(status_code=413, detail="Archive is too large")
+                spool.write(chunk)
+
+            async def close_spool():
+                spool.close()
+
+            batches, cleanup = _archive_items(spool, ARCHIVE_TYPES[content_type], batch_size), close_spool
+        else:
+            raise HTTPException(status_code=415, detail="Send multipart/form-data with 'files' or a tar/zip archive")
+    except BaseException:
+        slot.release()
+        raise
+    return StreamingResponse(_stream_scores(batches, with_hash, dedup, slot, cleanup), media_type='application/x-ndjson')
+
+if __name__ == "__main__":
+    uvicorn.run("api:app", host="0.0.0.0", port=8001)
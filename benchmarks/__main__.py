@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('ADMIN_ID', '0')
+os.environ.setdefault('STORAGE_CHAT_ID', '0')
+os.environ.setdefault('DUPLICATE_SIMILARITY', '1.01')
+
+SUITES = ('scoring', 'hashing', 'render', 'handler')
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _meta(quick: bool) -> dict:
+    meta = {
+        'revision': _git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'quick': quick,
+    }
+    if 'torch' in sys.modules:
+        torch = sys.modules['torch']
+        meta['torch'] = torch.__version__
+        meta['torch_threads'] = torch.get_num_threads()
+    return meta
+
+async def _run(suites: list[str], quick: bool) -> dict:
+    results = {}
+    for name in suites:
+        module = importlib.import_module(f'benchmarks.{name}')
+        print(f'running {name}...', file=sys.stderr)
+        results[name] = await module.run(quick)
+    return results
+
+def _flatten(results: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and 'median' in value:
+            flat[prefix + key] = value['median']
+        elif isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+    return flat
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    new, old = _flatten(current['results']), _flatten(baseline['results'])
+    regressions = []
+    for key in sorted(new.keys() & old.keys()):
+        ratio = new[key] / old[key] if old[key] else 1.0
+        marker = ''
+        if ratio > 1 + threshold:
+            marker = '  REGRESSION'
+            regressions.append(key)
+        print(f'{key:50s} {old[key] * 1000:10.3f}ms -> {new[key] * 1000:10.3f}ms  x{ratio:.2f}{marker}', file=sys.stderr)
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Offline CPU benchmarks for scoring, hashing, dedup and rendering')
+    parser.add_argument('--only', action='append', choices=SUITES, help='run only the given suite (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='fewer sizes and repetitions')
+    parser.add_argument('--out', help='write JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='baseline JSON from a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed median slowdown before failing --compare')
+    args = parser.parse_args()
+
+    results = asyncio.run(_run(args.only or list(SUITES), args.quick))
+    report = {'meta': _meta(args.quick), 'results': results}
+    payload = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(payload + '\n')
+    else:
+        print(payload)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}', file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
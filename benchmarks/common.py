@@ -0,0 +1,42 @@
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable
+
+from loadtest.fake_telegram import make_fixture_jpeg
+
+def synthetic_images(count: int, width: int = 1280, height: int = 960) -> list[bytes]:
+    return [make_fixture_jpeg(width, height, seed=i) for i in range(count)]
+
+def summarize(samples: list[float], items: int = 1) -> dict:
+    samples = sorted(samples)
+    median = statistics.median(samples)
+    return {
+        'runs': len(samples),
+        'min': samples[0],
+        'median': median,
+        'p95': samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        'mean': statistics.fmean(samples),
+        'per_second': items / median if median else 0.0,
+    }
+
+def measure(fn: Callable[[], object], repeat: int, items: int = 1, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, items)
+
+async def measure_async(fn: Callable[[], Awaitable[object]], repeat: int, items: int = 1, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0)
+    return summarize(samples, items)
@@ -0,0 +1,77 @@
+import itertools
+import tempfile
+from pathlib import Path
+
+import torch
+from aiogram import Bot
+from aiogram.types import Message
+
+from benchmarks.common import measure, measure_async
+from loadtest.fake_telegram import FakeSession, FakeTelegram, make_fixture_jpeg
+
+class _MemoryDB:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    async def fetchrow(self, query, *args):
+        if 'RETURNING id' in query:
+            return {'id': next(self._ids)}
+        if 'AS rank' in query:
+            return {'rank': 1}
+        return None
+
+    async def fetch(self, query, *args):
+        return []
+
+    async def fetchval(self, query, *args):
+        return next(self._ids)
+
+    async def execute(self, query, *args):
+        return None
+
+def _photo_message(bot: Bot, n: int) -> Message:
+    return Message.model_validate({
+        'message_id': n,
+        'date': 0,
+        'chat': {'id': n, 'type': 'private'},
+        'from': {'id': n, 'is_bot': False, 'first_name': 'bench', 'username': 'bench'},
+        'caption': 'cute',
+        'photo': [
+            {'file_id': f'thumb_{n}', 'file_unique_id': f't{n}', 'width': 90, 'height': 68},
+            {'file_id': f'photo_{n}', 'file_unique_id': f'u{n}', 'width': 320, 'height': 240},
+            {'file_id': f'large_{n}', 'file_unique_id': f'l{n}', 'width': 1280, 'height': 960},
+        ],
+    }, context={'bot': bot})
+
+async def run(quick: bool) -> dict:
+    from config import EMBEDDING_DIM
+    from database import db
+    from model import model
+    from utils import func
+    from utils.vector_index import VectorIndex
+    from handlers import main_handler
+    torch.manual_seed(0)
+    model.set_model(model.CutenessModel(pretrained=False))
+    results = {'map_score': measure(lambda: [func.map_score(x * 0.1) for x in range(10_000)], repeat=10, items=10_000)}
+
+    memory = _MemoryDB()
+    saved = db.fetchrow, db.fetch, db.fetchval, db.execute, func.embedding_index
+    db.fetchrow, db.fetch, db.fetchval, db.execute = memory.fetchrow, memory.fetch, memory.fetchval, memory.execute
+    tmp = tempfile.TemporaryDirectory()
+    func.embedding_index = VectorIndex(Path(tmp.name), EMBEDDING_DIM)
+    func.embedding_index.reset()
+    fake = FakeTelegram(photo=make_fixture_jpeg(320, 240))
+    bot = Bot('123:benchmark', session=FakeSession(fake))
+    counter = itertools.count(1)
+    try:
+        async def handle():
+            message = _photo_message(bot, next(counter))
+            await main_handler.process_cute_command(message, message, bot)
+        results['process_cute_command'] = await measure_async(handle, repeat=5 if quick else 30)
+    finally:
+        db.fetchrow, db.fetch, db.fetchval, db.execute, func.embedding_index = saved
+        tmp.cleanup()
+        await bot.session.close()
+    handled = next(counter) - 1
+    results['api_calls_per_command'] = {name: count / handled for name, count in sorted(fake.calls.items())}
+    return results
@@ -0,0 +1,43 @@
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import measure, synthetic_images
+
+SCAN_SIZES = (10_000, 100_000, 1_000_000)
+QUICK_SCAN_SIZES = (10_000, 100_000)
+IVF_SIZE = 100_000
+
+def _random_index(directory: Path, count: int, mode: str, rng: np.random.Generator):
+    from config import EMBEDDING_DIM
+    from utils.vector_index import VectorIndex, normalize
+    index = VectorIndex(directory, EMBEDDING_DIM, mode=mode, ivf_min_rows=0)
+    index.reset()
+    for start in range(0, count, 50_000):
+        n = min(50_000, count - start)
+        index.add_many(range(start + 1, start + n + 1), range(start, start + n),
+                       normalize(rng.standard_normal((n, EMBEDDING_DIM), dtype=np.float32)))
+    return index
+
+async def run(quick: bool) -> dict:
+    from utils import func
+    images = synthetic_images(8)
+    results = {
+        'sha256': measure(lambda: [func.calculate_image_hash(b) for b in images], repeat=10, items=len(images)),
+    }
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in QUICK_SCAN_SIZES if quick else SCAN_SIZES:
+            index = _random_index(Path(tmp) / f'flat_{size}', size, 'flat', rng)
+            probe = np.asarray(index.vectors[size // 2])
+            results[f'dedup_search_flat_{size}'] = measure(lambda: index.search(probe), repeat=3 if quick else 10)
+        if not quick:
+            index = _random_index(Path(tmp) / 'ivfpq', IVF_SIZE, 'ivfpq', rng)
+            start = time.perf_counter()
+            index.build_ivf()
+            results[f'ivfpq_build_{IVF_SIZE}_seconds'] = time.perf_counter() - start
+            probe = np.asarray(index.vectors[IVF_SIZE // 2])
+            results[f'dedup_search_ivfpq_{IVF_SIZE}'] = measure(lambda: index.search(probe), repeat=50)
+    return results
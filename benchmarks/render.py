@@ -0,0 +1,27 @@
+import base64
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import measure_async, synthetic_images
+
+async def run(quick: bool) -> dict:
+    from utils.stats_generator import process_image, render_card
+    repeat = 3 if quick else 15
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        images = synthetic_images(5, 640, 640)
+        tops = []
+        for i, data in enumerate(images[:4]):
+            path = tmp / f'top{i}.jpg'
+            path.write_bytes(data)
+            tops.append(str(path))
+        userpic = base64.b64encode(images[4]).decode()
+        output = tmp / 'card.png'
+        return {
+            'process_image': await measure_async(
+                lambda: process_image(87, 12, 'benchmark', userpic, tops, output), repeat=repeat),
+            'process_image_placeholders': await measure_async(
+                lambda: process_image(87, 12, None, None, [None] * 4, output), repeat=repeat),
+            'render_card': await measure_async(
+                lambda: render_card(87, 12, 'benchmark', userpic, tops), repeat=repeat),
+        }
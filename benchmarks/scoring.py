@@ -0,0 +1,25 @@
+import torch
+
+from benchmarks.common import measure_async, synthetic_images
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+QUICK_BATCH_SIZES = (1, 8, 32)
+CASCADE_SIZES = (128, 160)
+
+async def run(quick: bool) -> dict:
+    from model import model
+    torch.manual_seed(0)
+    model.set_model(model.CutenessModel(pretrained=False))
+    sizes = QUICK_BATCH_SIZES if quick else BATCH_SIZES
+    images = synthetic_images(max(sizes), 640, 480)
+    results = {}
+    for size in sizes:
+        batch = images[:size]
+        results[f'batch_{size}'] = await measure_async(
+            lambda: model.get_cuteness_scores(batch), repeat=3 if quick else 10, items=size)
+    single = images[0]
+    results['single_call'] = await measure_async(lambda: model.get_cuteness_score(single), repeat=5 if quick else 30)
+    for size in CASCADE_SIZES:
+        results[f'single_call_{size}px'] = await measure_async(
+            lambda: model.get_score_and_embedding(single, size), repeat=5 if quick else 30)
+    return results
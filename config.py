@@ -7,6 +7,13 @@ load_dotenv()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGES_DIR = Path('images')
 IMAGES_DIR.mkdir(exist_ok=True)
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+THUMBS_DIR = Path(os.getenv('THUMBS_DIR', 'thumbs'))
+THUMB_SIZE = 128
+THUMB_QUALITY = 70
+THUMB_CACHE_MAX_BYTES = int(os.getenv('THUMB_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+THUMB_WORKERS = min(4, os.cpu_count() or 1)
+CARD_CACHE_MAX_BYTES = int(os.getenv('CARD_CACHE_MAX_BYTES', 64 * 1024 ** 2))
 
 CUTE_COMMANDS = ['cute', 'сгеу', 'мило', 'куте']
 
@@ -15,12 +22,69 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 DATABASE_URL = os.getenv('DATABASE_URL') 
 ADMIN_ID = int(os.getenv('ADMIN_ID'))
 ADMIN_PASSWORD = os.environ.get('ADMIN_PANEL_PASSWORD')
+ADMIN_DEBUG = os.getenv('ADMIN_DEBUG', '0') == '1'
 STORAGE_CHAT_ID = int(os.getenv('STORAGE_CHAT_ID'))
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 32))
+WEBHOOK_DRAIN_TIMEOUT = 30
+HEAVY_WORKERS = int(os.getenv('HEAVY_WORKERS', 2))
+HEAVY_QUEUE_SIZE = int(os.getenv('HEAVY_QUEUE_SIZE', 50))
+LIGHT_WORKERS = int(os.getenv('LIGHT_WORKERS', 8))
+LIGHT_QUEUE_SIZE = int(os.getenv('LIGHT_QUEUE_SIZE', 500))
+METRICS_PATH = Path(os.getenv('METRICS_PATH', 'metrics/bot.json'))
+METRICS_FLUSH_SECONDS = 10
+TRACE_LOG_PATH = os.getenv('TRACE_LOG_PATH')
 
 NSFW_FILTER_ENABLED = False #WARNING!!!!
 
 MODEL_PATH = 'model/CuteLarge.pt'
+MODEL_INPUT_SIZE = 224
+INFERENCE_PROFILE_PATH = Path(os.getenv('INFERENCE_PROFILE_PATH', 'model/inference_profile.json'))
+SCORING_API_KEYS = os.getenv('SCORING_API_KEYS', '')
+SCORING_API_KEY_CONCURRENCY = int(os.getenv('SCORING_API_KEY_CONCURRENCY', 2))
+SCORING_API_MAX_FILES = 10_000
+SCORING_API_MAX_FILE_BYTES = 20 * 1024 ** 2
+SCORING_API_MAX_BODY_BYTES = int(os.getenv('SCORING_API_MAX_BODY_BYTES', 2 * 1024 ** 3))
+MODERATION_DIGEST_INTERVAL = float(os.getenv('MODERATION_DIGEST_INTERVAL', 10))
+MODERATION_DIGEST_SIZE = 10
+MODERATION_DIGEST_ATTEMPTS = 3
+ALBUM_WINDOW = 1.0
+ALBUM_MAX_PHOTOS = 10
+CASCADE_SIZE = int(os.getenv('CASCADE_SIZE', 0))
+CASCADE_MAX_ERROR = float(os.getenv('CASCADE_MAX_ERROR', 2.0))
+CASCADE_AUDIT_RATE = 0.05
+CASCADE_MIN_SAMPLES = 200
+CASCADE_QUANTILE = 0.99
+CASCADE_WINDOW = 2000
+CASCADE_CALIBRATION_PATH = Path(os.getenv('CASCADE_CALIBRATION_PATH', 'model/cascade_calibration.json'))
+AVATAR_MIN_SIDE = 150
 DB_PATH = 'cute_bot.db'
 RATE_LIMIT_SECONDS = 10
+RATE_LIMIT_BURST = 1
+GLOBAL_RATE_LIMIT = 20
+GLOBAL_RATE_BURST = 40
+REDIS_URL = os.getenv('REDIS_URL')
+STATE_STORE_CAPACITY = 100_000
+USER_STATE_TTL = 600
+STATE_CLEANUP_SECONDS = 60
 TOP_THRESHOLD = 50
+TOP_CACHE_CONCURRENCY = 5
+TOP_CACHE_DEBOUNCE = 2.0
+TOP_CHANNEL = 'top_images'
+LISTEN_HEALTHCHECK_SECONDS = 30
+LISTEN_RECONNECT_MAX_DELAY = 30
+BULK_MODERATION_MAX = 5000
+EMBEDDING_DIM = 960
+EMBEDDINGS_DIR = Path(os.getenv('EMBEDDINGS_DIR', 'embeddings'))
+VECTOR_INDEX_MODE = os.getenv('VECTOR_INDEX_MODE', 'flat')
+IVF_MIN_ROWS = 100_000
+IVF_NPROBE = 8
+IVF_RETRAIN_RATIO = 0.5
+DUPLICATE_SIMILARITY = float(os.getenv('DUPLICATE_SIMILARITY', 0.95))
 RAW_MIN, RAW_MAX = 0, 100
\ No newline at end of file
@@ -1,8 +1,16 @@
+import asyncio
+import logging
 import asyncpg
-from typing import Any, List, Optional
-from config import DATABASE_URL
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config import DATABASE_URL, LISTEN_HEALTHCHECK_SECONDS, LISTEN_RECONNECT_MAX_DELAY
+
+logger = logging.getLogger(__name__)
 
 _pool: Optional[asyncpg.Pool] = None
+_subscriptions: Dict[str, List[Tuple[Callable, Optional[Callable[[], Awaitable[None]]]]]] = {}
+_listener: Optional[asyncpg.Connection] = None
+_listener_task: Optional[asyncio.Task] = None
+_listener_ready: Optional[asyncio.Future] = None
 
 async def init_db() -> None:
     global _pool
@@ -24,43 +32,255 @@ async def init_db() -> None:
         );
         ''')
         await conn.execute('''
-        CREATE TABLE IF NOT EXISTS user_avatars (
+        CREATE TABLE IF NOT EXISTS user_stats (
             user_id BIGINT PRIMARY KEY,
             username TEXT,
             userpic TEXT,
+            image_count INTEGER NOT NULL DEFAULT 0,
+            best_score REAL,
+            approved_count INTEGER NOT NULL DEFAULT 0,
+            approved_score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            approved_best_score REAL,
+            warnings INTEGER NOT NULL DEFAULT 0,
+            banned INTEGER NOT NULL DEFAULT 0,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         ''')
         await conn.execute('''
-        CREATE TABLE IF NOT EXISTS user_warnings (
-            user_id BIGINT PRIMARY KEY,
-            warnings INTEGER DEFAULT 0,
-            banned INTEGER DEFAULT 0
-        );
-        ''')
-        await conn.execute('''
         CREATE TABLE IF NOT EXISTS image_hashes (
             id SERIAL PRIMARY KEY,
             user_id BIGINT NOT NULL,
             image_hash TEXT NOT NULL,
-            perceptual_hash TEXT NOT NULL,
+            perceptual_hash TEXT,
+            embedding BYTEA,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         ''')
-        try:
-            await conn.execute('ALTER TABLE images ADD COLUMN filename TEXT;')
-        except asyncpg.exceptions.DuplicateColumnError:
-            pass
-        except Exception:
-            pass
+        await conn.execute('ALTER TABLE images ADD COLUMN IF NOT EXISTS filename TEXT;')
+        await conn.execute('ALTER TABLE images ADD COLUMN IF NOT EXISTS file_id TEXT;')
+        await conn.execute('ALTER TABLE images ADD COLUMN IF NOT EXISTS card_file_id TEXT;')
+        await conn.execute('ALTER TABLE image_hashes ADD COLUMN IF NOT EXISTS embedding BYTEA;')
+        await conn.execute('ALTER TABLE image_hashes ADD COLUMN IF NOT EXISTS file_unique_id TEXT;')
+        await conn.execute('ALTER TABLE image_hashes ALTER COLUMN perceptual_hash DROP NOT NULL;')
         await conn.execute('CREATE INDEX IF NOT EXISTS idx_image_hash ON image_hashes(image_hash);')
-        await conn.execute('CREATE INDEX IF NOT EXISTS idx_perceptual_hash ON image_hashes(perceptual_hash);')
-        await conn.execute('CREATE INDEX IF NOT EXISTS idx_user_warnings ON user_warnings(user_id);')
-        await conn.execute('CREATE INDEX IF NOT EXISTS idx_user_avatars ON user_avatars(user_id);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_image_file_unique_id ON image_hashes(file_unique_id) WHERE file_unique_id IS NOT NULL;')
+        await conn.execute('DROP INDEX IF EXISTS idx_perceptual_hash;')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_images_hash ON images(image_hash);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_images_raw_score ON images(raw_score DESC);')
         await conn.execute('CREATE INDEX IF NOT EXISTS idx_images_score ON images(raw_score DESC) WHERE nsfw=0 AND approved=1;')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_images_created ON images(created_at DESC, id DESC);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_images_approved_created ON images(approved, created_at DESC, id DESC);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_images_nsfw_created ON images(nsfw, created_at DESC, id DESC);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_images_user_created ON images(user_id, created_at DESC, id DESC);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_images_approved_score ON images(approved, raw_score DESC);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_user_stats_images ON user_stats(image_count DESC, user_id DESC);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_user_stats_approved ON user_stats(approved_count DESC, user_id DESC);')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_user_stats_banned ON user_stats(user_id) WHERE banned=1;')
+        await _init_user_stats(conn)
+        await conn.execute('''
+        CREATE OR REPLACE FUNCTION notify_user_ban() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('user_bans', NEW.banned || ':' || NEW.user_id);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        ''')
+        await conn.execute('DROP TRIGGER IF EXISTS user_stats_ban_notify ON user_stats;')
+        await conn.execute('DROP TRIGGER IF EXISTS user_stats_ban_notify_ins ON user_stats;')
+        await conn.execute('''
+        CREATE TRIGGER user_stats_ban_notify AFTER UPDATE OF banned ON user_stats
+        FOR EACH ROW WHEN (OLD.banned IS DISTINCT FROM NEW.banned)
+        EXECUTE FUNCTION notify_user_ban();
+        ''')
+        await conn.execute('''
+        CREATE TRIGGER user_stats_ban_notify_ins AFTER INSERT ON user_stats
+        FOR EACH ROW WHEN (NEW.banned = 1)
+        EXECUTE FUNCTION notify_user_ban();
+        ''')
+
+_USER_STATS_REFRESH = '''
+    UPDATE user_stats s
+    SET image_count=0, best_score=NULL, approved_count=0, approved_score_sum=0,
+        approved_best_score=NULL, updated_at=CURRENT_TIMESTAMP
+    FROM {source} c
+    WHERE s.user_id=c.user_id AND NOT EXISTS (SELECT 1 FROM images i WHERE i.user_id=c.user_id);
+    INSERT INTO user_stats (user_id, username, image_count, best_score, approved_count, approved_score_sum, approved_best_score)
+    SELECT i.user_id,
+           (ARRAY_AGG(i.username ORDER BY i.created_at DESC))[1],
+           COUNT(*),
+           MAX(i.raw_score),
+           COUNT(*) FILTER (WHERE i.approved=1),
+           COALESCE(SUM(i.raw_score) FILTER (WHERE i.approved=1), 0),
+           MAX(i.raw_score) FILTER (WHERE i.approved=1)
+    FROM images i
+    WHERE i.user_id IN (SELECT user_id FROM {source} c)
+    GROUP BY i.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        username=COALESCE(EXCLUDED.username, user_stats.username),
+        image_count=EXCLUDED.image_count,
+        best_score=EXCLUDED.best_score,
+        approved_count=EXCLUDED.approved_count,
+        approved_score_sum=EXCLUDED.approved_score_sum,
+        approved_best_score=EXCLUDED.approved_best_score,
+        updated_at=CURRENT_TIMESTAMP;
+'''
+
+_USER_STATS_ADD = '''
+    INSERT INTO user_stats (user_id, username, image_count, best_score, approved_count, approved_score_sum, approved_best_score)
+    SELECT n.user_id,
+           (ARRAY_AGG(n.username ORDER BY n.created_at DESC))[1],
+           COUNT(*),
+           MAX(n.raw_score),
+           COUNT(*) FILTER (WHERE n.approved=1),
+           COALESCE(SUM(n.raw_score) FILTER (WHERE n.approved=1), 0),
+           MAX(n.raw_score) FILTER (WHERE n.approved=1)
+    FROM new_rows n
+    GROUP BY n.user_id
+    ORDER BY n.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        username=COALESCE(EXCLUDED.username, user_stats.username),
+        image_count=user_stats.image_count + EXCLUDED.image_count,
+        best_score=GREATEST(user_stats.best_score, EXCLUDED.best_score),
+        approved_count=user_stats.approved_count + EXCLUDED.approved_count,
+        approved_score_sum=user_stats.approved_score_sum + EXCLUDED.approved_score_sum,
+        approved_best_score=GREATEST(user_stats.approved_best_score, EXCLUDED.approved_best_score),
+        updated_at=CURRENT_TIMESTAMP;
+'''
+
+_USER_STATS_LOCK = '''
+    INSERT INTO user_stats (user_id)
+    SELECT DISTINCT user_id FROM {source} c ORDER BY user_id
+    ON CONFLICT (user_id) DO NOTHING;
+    PERFORM 1 FROM user_stats WHERE user_id IN (SELECT user_id FROM {source} c) ORDER BY user_id FOR UPDATE;
+'''
+
+_USER_STATS_TRIGGERS = {
+    'ins': ('INSERT', 'NEW TABLE AS new_rows', None),
+    'upd': ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows', '''(
+        SELECT u.user_id FROM new_rows n JOIN old_rows o ON o.id=n.id
+        CROSS JOIN LATERAL (VALUES (n.user_id), (o.user_id)) AS u(user_id)
+        WHERE (n.user_id, n.username, n.raw_score, n.approved, n.created_at)
+              IS DISTINCT FROM (o.user_id, o.username, o.raw_score, o.approved, o.created_at))'''),
+    'del': ('DELETE', 'OLD TABLE AS old_rows', '(SELECT DISTINCT user_id FROM old_rows)'),
+}
+
+async def _init_user_stats(conn: asyncpg.Connection) -> None:
+    for suffix, (event, referencing, source) in _USER_STATS_TRIGGERS.items():
+        body = _USER_STATS_LOCK.format(source=source) + _USER_STATS_REFRESH.format(source=source) if source else _USER_STATS_ADD
+        await conn.execute(f'''
+        CREATE OR REPLACE FUNCTION refresh_user_stats_{suffix}() RETURNS trigger AS $$
+        BEGIN
+            {body}
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        ''')
+        await conn.execute(f'DROP TRIGGER IF EXISTS images_user_stats_{suffix} ON images;')
+        await conn.execute(f'''
+        CREATE TRIGGER images_user_stats_{suffix} AFTER {event} ON images
+        REFERENCING {referencing}
+        FOR EACH STATEMENT EXECUTE FUNCTION refresh_user_stats_{suffix}();
+        ''')
+
+    if await conn.fetchval('SELECT EXISTS (SELECT 1 FROM user_stats)'):
+        return
+    async with conn.transaction():
+        await conn.execute(_USER_STATS_REFRESH.format(source='(SELECT DISTINCT user_id FROM images)'))
+        if await conn.fetchval("SELECT to_regclass('user_warnings') IS NOT NULL"):
+            await conn.execute('''
+            INSERT INTO user_stats (user_id, warnings, banned)
+            SELECT user_id, COALESCE(warnings, 0), COALESCE(banned, 0) FROM user_warnings
+            ON CONFLICT (user_id) DO UPDATE SET warnings=EXCLUDED.warnings, banned=EXCLUDED.banned;
+            ''')
+        if await conn.fetchval("SELECT to_regclass('user_avatars') IS NOT NULL"):
+            await conn.execute('''
+            INSERT INTO user_stats (user_id, username, userpic)
+            SELECT user_id, username, userpic FROM user_avatars
+            ON CONFLICT (user_id) DO UPDATE SET
+                userpic=EXCLUDED.userpic,
+                username=COALESCE(user_stats.username, EXCLUDED.username);
+            ''')
+
+async def connect() -> asyncpg.Connection:
+    return await asyncpg.connect(DATABASE_URL)
+
+async def _subscribe(conn: asyncpg.Connection, channel: str, callback, resync) -> None:
+    await conn.add_listener(channel, callback)
+    if resync is not None:
+        await resync()
+
+async def _listen_loop() -> None:
+    global _listener
+    delay = 1.0
+    while True:
+        conn = None
+        try:
+            conn = await connect()
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda _: lost.set())
+            for channel, entries in list(_subscriptions.items()):
+                for callback, resync in list(entries):
+                    await _subscribe(conn, channel, callback, resync)
+            _listener = conn
+            if not _listener_ready.done():
+                _listener_ready.set_result(None)
+            delay = 1.0
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), LISTEN_HEALTHCHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    await conn.execute('SELECT 1', timeout=LISTEN_HEALTHCHECK_SECONDS)
+            logger.warning("LISTEN connection lost, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not _listener_ready.done():
+                _listener_ready.set_exception(e)
+                return
+            logger.warning("LISTEN connection failed, retrying in %.0fs: %s", delay, e)
+        finally:
+            _listener = None
+            if conn is not None and not conn.is_closed():
+                conn.terminate()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, LISTEN_RECONNECT_MAX_DELAY)
+
+async def listen(channel: str, callback, resync: Optional[Callable[[], Awaitable[None]]] = None) -> None:
+    global _listener_task, _listener_ready
+    _subscriptions.setdefault(channel, []).append((callback, resync))
+    if _listener is not None:
+        await _subscribe(_listener, channel, callback, resync)
+        return
+    if _listener_task is None or _listener_task.done():
+        _listener_ready = asyncio.get_running_loop().create_future()
+        _listener_task = asyncio.create_task(_listen_loop())
+    try:
+        await asyncio.shield(_listener_ready)
+    except Exception:
+        _subscriptions[channel].remove((callback, resync))
+        raise
+
+async def unlisten(channel: str, callback) -> None:
+    entries = _subscriptions.get(channel, [])
+    entries[:] = [entry for entry in entries if entry[0] is not callback]
+    if _listener is not None:
+        await _listener.remove_listener(channel, callback)
+
+async def _stop_listener() -> None:
+    global _listener_task, _listener
+    _subscriptions.clear()
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _listener_task = None
+    _listener = None
 
 async def close_db() -> None:
     global _pool
+    await _stop_listener()
     if _pool:
         await _pool.close()
         _pool = None
@@ -79,6 +299,13 @@ async def fetchrow(query: str, *args: Any) -> Optional[asyncpg.Record]:
     async with _pool.acquire() as conn:
         return await conn.fetchrow(query, *args)
 
+async def fetchval(query: str, *args: Any) -> Any:
+    global _pool
+    if _pool is None:
+        await init_db()
+    async with _pool.acquire() as conn:
+        return await conn.fetchval(query, *args)
+
 async def execute(query: str, *args: Any) -> None:
     global _pool
     if _pool is None:
@@ -1,37 +1,30 @@
 from aiogram import Router, Bot, types
 from aiogram.filters import Command
-from aiogram.types import FSInputFile, CallbackQuery
+from aiogram.types import FSInputFile, BufferedInputFile, CallbackQuery, InlineKeyboardMarkup, InputMediaPhoto
 import base64
-import time
-import uuid
+import logging
 import asyncio
 
-from config import ADMIN_ID, RATE_LIMIT_SECONDS, TOP_THRESHOLD, STORAGE_CHAT_ID, IMAGES_DIR, CUTE_COMMANDS, NSFW_FILTER_ENABLED
+from config import ADMIN_ID, USER_STATE_TTL, TOP_THRESHOLD, TOP_CACHE_CONCURRENCY, TOP_CACHE_DEBOUNCE, STORAGE_CHAT_ID, CUTE_COMMANDS, NSFW_FILTER_ENABLED, AVATAR_MIN_SIDE, CASCADE_SIZE, ALBUM_MAX_PHOTOS
 from database import db
 from utils import func
+from utils.state_store import create_store
+from utils import image_cache, card_cache, moderation, thumbnails, tracing
 from model import model
+from model.cascade import cascade
 from keyboards.messages import MESSAGES
-from keyboards.inline_keyboards import show_image_kb, moderation_kb
+from keyboards.inline_keyboards import show_image_kb
+from handlers.middlewares import AlbumMiddleware, ThrottlingMiddleware, SchedulingMiddleware, heavy_queue, light_queue, limiter_stats
 
+logger = logging.getLogger(__name__)
 router = Router()
-_last_call: dict[int, float] = {}
-_user_states: dict[int, str] = {}
-_storage_queue = asyncio.Queue()
-
-async def storage_worker(bot: Bot):
-    while True:
-        try:
-            image_bytes = await _storage_queue.get()
-            temp_path = IMAGES_DIR / f'storage_{uuid.uuid4().hex}.jpg'
-            temp_path.write_bytes(image_bytes)
-            try:
-                await bot.send_photo(STORAGE_CHAT_ID, FSInputFile(temp_path))
-                await asyncio.sleep(0.1)
-            finally:
-                if temp_path.exists():
-                    temp_path.unlink()
-        except Exception:
-            pass
+states = create_store()
+router.message.outer_middleware(AlbumMiddleware())
+router.message.middleware(ThrottlingMiddleware(states))
+router.message.middleware(SchedulingMiddleware())
+router.callback_query.middleware(SchedulingMiddleware())
+_top_cache_task: asyncio.Task | None = None
+_top_cache_pending = False
 
 @router.message(Command(commands=['start']))
 async def cmd_start(message: types.Message):
@@ -51,263 +44,450 @@ async def cmd_top(message: types.Message):
         text += f"{r['place']}) {r['username'] or 'аноним'} - {r['raw_score']:.4f}%\n"
     await message.reply(text, reply_markup=show_image_kb)
 
-async def _save_image_record(user_id: int, username: str | None, message_id: int, raw: float, nsfw: int, image_hash: str, filename: str) -> int:
-    await db.execute('''
-        INSERT INTO images (user_id, username, message_id, image_hash, raw_score, nsfw, filename)
-        VALUES ($1,$2,$3,$4,$5,$6,$7)
-    ''', user_id, username, message_id, image_hash, raw, nsfw, filename)
-    row = await db.fetchrow('SELECT id FROM images WHERE image_hash=$1 ORDER BY created_at DESC LIMIT 1', image_hash)
+@router.message(Command(commands=['queue']), flags={'queue': 'admin'})
+async def cmd_queue(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    lines = []
+    for queue in (heavy_queue, light_queue):
+        stats = queue.stats()
+        lines.append(f"{queue.name}: depth {stats['depth']}/{stats['maxsize']}, running {stats['running']}/{stats['workers']}, "
+                     f"rejected {stats['rejected']}, failed {stats['failed']}, "
+                     f"wait avg {stats['wait_avg']:.3f}s max {stats['wait_max']:.3f}s")
+    lines.append(', '.join(f"{k}: {v}" for k, v in limiter_stats.items()))
+    await message.reply('\n'.join(lines), parse_mode=None)
+
+async def _save_image_record(user_id: int, username: str | None, message_id: int, raw: float, nsfw: int, image_hash: str, filename: str | None, file_id: str | None = None, card_file_id: str | None = None) -> int:
+    row = await db.fetchrow('''
+        INSERT INTO images (user_id, username, message_id, image_hash, raw_score, nsfw, filename, file_id, card_file_id)
+        VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)
+        RETURNING id
+    ''', user_id, username, message_id, image_hash, raw, nsfw, filename, file_id, card_file_id)
     return int(row['id']) if row else 0
 
-async def _update_user_avatar(user_id: int, username: str | None, userpic_b64: str | None):
-    existing = await db.fetchrow('SELECT userpic FROM user_avatars WHERE user_id=$1', user_id)
-    if existing:
-        if existing['userpic'] != userpic_b64:
-            await db.execute('UPDATE user_avatars SET userpic=$1, username=$2 WHERE user_id=$3', userpic_b64, username, user_id)
-    else:
-        await db.execute('INSERT INTO user_avatars (user_id, username, userpic) VALUES ($1,$2,$3)', user_id, username, userpic_b64)
+async def _reply_stored_photo(message: types.Message, row, caption: str, **kwargs) -> bool:
+    if row['file_id']:
+        await message.reply_photo(row['file_id'], caption=caption, **kwargs)
+        return True
+    cached_path = image_cache.path(row['filename'])
+    if cached_path is None:
+        return False
+    sent = await message.reply_photo(FSInputFile(cached_path), caption=caption, **kwargs)
+    if sent.photo:
+        await db.execute('UPDATE images SET file_id=$1 WHERE id=$2', sent.photo[-1].file_id, row['id'])
+    return True
+
+async def _update_user_avatar(user_id: int, username: str | None, userpic_b64: str | None, stats=None):
+    if stats is not None and stats['userpic'] == userpic_b64 and stats['username'] == username:
+        return
+    await db.execute('''
+        INSERT INTO user_stats (user_id, username, userpic) VALUES ($1,$2,$3)
+        ON CONFLICT (user_id) DO UPDATE SET userpic=EXCLUDED.userpic, username=EXCLUDED.username
+    ''', user_id, username, userpic_b64)
+
+async def _download_top_image(bot: Bot, row, semaphore: asyncio.Semaphore) -> str | None:
+    async with semaphore:
+        try:
+            file_id = row['file_id']
+            if not file_id:
+                msg = await bot.forward_message(STORAGE_CHAT_ID, STORAGE_CHAT_ID, row['message_id'])
+                if msg.photo:
+                    file_id = msg.photo[-1].file_id
+                    await db.execute('UPDATE images SET file_id=$1 WHERE id=$2', file_id, row['id'])
+                await bot.delete_message(STORAGE_CHAT_ID, msg.message_id)
+            if file_id:
+                filename = image_cache.store(await func.download(bot, file_id))
+                if filename != row['filename']:
+                    await db.execute('UPDATE images SET filename=$1 WHERE id=$2', filename, row['id'])
+                return filename
+        except Exception as e:
+            logger.warning("Top image cache error for image %s: %s", row['id'], e)
+        return None
 
 async def _cache_top_images(bot: Bot):
     rows = await db.fetch('''
-        SELECT id, message_id, filename FROM images 
-        WHERE nsfw=0 AND approved=1 AND filename IS NOT NULL
+        SELECT id, message_id, filename, file_id FROM images 
+        WHERE nsfw=0 AND approved=1
         ORDER BY raw_score DESC LIMIT 30
     ''')
-    for row in rows:
-        cache_path = IMAGES_DIR / row['filename']
-        if not cache_path.exists():
-            try:
-                msg = await bot.forward_message(STORAGE_CHAT_ID, STORAGE_CHAT_ID, row['message_id'])
-                if msg.photo:
-                    file_obj = await bot.get_file(msg.photo[-1].file_id)
-                    buf = await bot.download_file(file_obj.file_path)
-                    cache_path.write_bytes(buf.getvalue())
-                await bot.delete_message(STORAGE_CHAT_ID, msg.message_id)
-            except Exception:
-                pass
-
-async def _find_duplicate_image_info(image_bytes: bytes):
-    img_hash = func.calculate_image_hash(image_bytes)
-    perceptual_hash = func.calculate_perceptual_hash(image_bytes)
-    
-    exact_match = await db.fetchrow('''
-        SELECT i.filename, i.raw_score, i.user_id
-        FROM images i
-        INNER JOIN image_hashes ih ON i.image_hash = ih.image_hash
-        WHERE ih.image_hash = $1
+    filenames = {row['id']: row['filename'] for row in rows}
+    image_cache.pin(filenames.values())
+    missing = [row for row in rows if image_cache.path(row['filename']) is None]
+    if missing:
+        semaphore = asyncio.Semaphore(TOP_CACHE_CONCURRENCY)
+        stored = await asyncio.gather(*(_download_top_image(bot, row, semaphore) for row in missing))
+        filenames.update((row['id'], filename) for row, filename in zip(missing, stored) if filename)
+        image_cache.pin(filenames.values())
+
+async def _top_cache_loop(bot: Bot, delay: float):
+    global _top_cache_pending
+    while True:
+        await asyncio.sleep(delay)
+        _top_cache_pending = False
+        try:
+            await _cache_top_images(bot)
+        except Exception:
+            logger.exception("Top image cache refresh failed")
+        if not _top_cache_pending:
+            return
+
+def refresh_top_cache(bot: Bot, delay: float = 0.0):
+    global _top_cache_task, _top_cache_pending
+    if _top_cache_task is not None and not _top_cache_task.done():
+        _top_cache_pending = True
+        return
+    _top_cache_task = asyncio.create_task(_top_cache_loop(bot, delay))
+
+async def _find_duplicate_image_info(image_hash: str):
+    row = await db.fetchrow('''
+        SELECT id, filename, file_id, raw_score, user_id
+        FROM images WHERE image_hash = $1
         LIMIT 1
-    ''', img_hash)
-    
-    if exact_match:
-        place_row = await db.fetchrow('SELECT COUNT(*)+1 AS place FROM images WHERE raw_score>$1', exact_match['raw_score'])
-        exact_match = dict(exact_match)
-        exact_match['place'] = int(place_row['place']) if place_row else 1
-        return exact_match
-    
-    if perceptual_hash:
-        all_hashes = await db.fetch('''
-            SELECT ih.user_id, ih.perceptual_hash, i.filename, i.raw_score
-            FROM image_hashes ih
-            INNER JOIN images i ON ih.image_hash = i.image_hash
-            WHERE ih.perceptual_hash IS NOT NULL
-        ''')
-        
-        for r in all_hashes:
-            stored_hash = r['perceptual_hash']
-            if stored_hash and func.hamming_distance(perceptual_hash, stored_hash) <= 5:
-                place_row = await db.fetchrow('SELECT COUNT(*)+1 AS place FROM images WHERE raw_score>$1', r['raw_score'])
-                result = dict(r)
-                result['place'] = int(place_row['place']) if place_row else 1
-                return result
-    
-    return None
-
-@router.message(Command(commands=['cute']))
+    ''', image_hash)
+    if not row:
+        return None
+    place_row = await db.fetchrow('SELECT COUNT(*)+1 AS place FROM images WHERE raw_score>$1', row['raw_score'])
+    result = dict(row)
+    result['place'] = int(place_row['place']) if place_row else 1
+    return result
+
+@router.message(Command(commands=['cute']), flags={'throttle': 'cute', 'queue': 'heavy'})
 async def cmd_cute(message: types.Message, bot: Bot):
     if message.reply_to_message and message.reply_to_message.photo:
         await process_cute_command(message, message.reply_to_message, bot)
     else:
         await process_cute_command(message, None, bot)
 
-@router.message(lambda m: m.photo and m.caption and m.caption.lower().strip() in CUTE_COMMANDS)
+def _is_cute_album(message: types.Message, album: list[types.Message] | None = None) -> bool:
+    return bool(album) and any(m.caption and m.caption.lower().strip() in CUTE_COMMANDS for m in album)
+
+@router.message(_is_cute_album, flags={'throttle': 'cute', 'queue': 'heavy'})
+async def handle_cute_album(message: types.Message, bot: Bot, album: list[types.Message]):
+    await process_cute_album(message, album, bot)
+
+@router.message(lambda m: m.photo and m.caption and m.caption.lower().strip() in CUTE_COMMANDS, flags={'throttle': 'cute', 'queue': 'heavy'})
 async def handle_cute_photo_with_caption(message: types.Message, bot: Bot):
     await process_cute_command(message, message, bot)
 
-@router.message(lambda m: m.text and m.text.lower().strip() in CUTE_COMMANDS)
+@router.message(lambda m: m.text and m.text.lower().strip() in CUTE_COMMANDS, flags={'throttle': 'cute', 'queue': 'heavy'})
 async def handle_cute_text(message: types.Message, bot: Bot):
     if message.reply_to_message and message.reply_to_message.photo:
         await process_cute_command(message, message.reply_to_message, bot)
     else:
         await process_cute_command(message, None, bot)
 
+class _Upload:
+    __slots__ = ('sizes', 'image_bytes', 'image_hash', 'raw', 'outcome', 'duplicate', 'place', 'card_key', 'card', 'card_file_id', 'storage_msg')
+
+    def __init__(self, sizes: list[types.PhotoSize]):
+        self.sizes = sizes
+        self.image_bytes = b''
+        self.image_hash = ''
+        self.raw = 0.0
+        self.outcome = ''
+        self.duplicate: tuple[int, str] | None = None
+        self.place = 0
+        self.card_key = ''
+        self.card = None
+        self.card_file_id: str | None = None
+        self.storage_msg: types.Message | None = None
+
+    @property
+    def original(self) -> types.PhotoSize:
+        return self.sizes[-1]
+
+async def _find_own_card(image_hash: str):
+    row = await db.fetchrow('''
+        SELECT id, card_file_id AS file_id, filename FROM images
+        WHERE image_hash = $1 AND card_file_id IS NOT NULL
+        LIMIT 1
+    ''', image_hash)
+    return dict(row) if row else None
+
+async def _duplicate_caption(user_id: int, orig_uid: int, image_hash: str) -> tuple[str, dict | None]:
+    if orig_uid == user_id:
+        return MESSAGES["duplicate_own"], await _find_own_card(image_hash)
+    dup_info = await _find_duplicate_image_info(image_hash)
+    if not dup_info:
+        return MESSAGES["duplicate_other"], None
+    return MESSAGES["duplicate_other_with_score"].format(score=func.map_score(dup_info['raw_score']), place=dup_info['place']), dup_info
+
+async def _cascade_scores(uploads: list[_Upload], estimates: list[float]) -> None:
+    with tracing.span('cascade') as s:
+        cut = await db.fetchval('SELECT raw_score FROM images ORDER BY raw_score DESC OFFSET $1 LIMIT 1', TOP_THRESHOLD - 1)
+        reasons = [cascade.decide(estimate, cut) for estimate in estimates]
+        s['escalated'] = sum(1 for reason in reasons if reason)
+    for upload, estimate in zip(uploads, estimates):
+        upload.raw = cascade.calibrated(estimate)
+    escalated = [(upload, estimate, reason) for upload, estimate, reason in zip(uploads, estimates, reasons) if reason]
+    if not escalated:
+        return
+    with tracing.span('scoring_full'):
+        scores = await model.get_cuteness_scores([upload.image_bytes for upload, _, _ in escalated])
+    for (upload, estimate, reason), raw in zip(escalated, scores):
+        upload.raw = raw
+        cascade.observe(estimate, raw, reason)
+
 async def process_cute_command(message: types.Message, photo_message: types.Message | None, bot: Bot):
-    user = message.from_user
-    user_id = user.id
-    warnings, banned = await func.get_user_warnings(user_id)
+    with tracing.span('cute', user_id=message.from_user.id) as trace:
+        trace['outcome'] = await _process_cute_command(message, photo_message, bot)
+
+async def process_cute_album(message: types.Message, album: list[types.Message], bot: Bot):
+    with tracing.span('cute', user_id=message.from_user.id, images=len(album)) as trace:
+        trace['outcome'] = await _process_cute_album(message, album, bot)
+
+async def _check_banned(user_id: int):
+    with tracing.span('user_stats'):
+        stats = await func.get_user_stats(user_id)
+    return stats, bool(stats and stats['banned'])
+
+async def _process_cute_command(message: types.Message, photo_message: types.Message | None, bot: Bot) -> str:
+    stats, banned = await _check_banned(message.from_user.id)
     if banned:
-        return
-    now = time.time()
-    last = _last_call.get(user_id, 0)
-    if now - last < RATE_LIMIT_SECONDS:
-        wait = int(RATE_LIMIT_SECONDS - (now - last))
-        await message.reply(MESSAGES["rate_limited"].format(seconds=wait))
-        return
-    _last_call[user_id] = now
+        return 'banned'
     target = photo_message or message
     if not target.photo:
         await message.reply(MESSAGES["no_image"])
-        return
-    file_obj = await bot.get_file(target.photo[-1].file_id)
-    buf = await bot.download_file(file_obj.file_path)
-    image_bytes = buf.getvalue()
-    is_dup, orig_uid = await func.check_duplicate_image(user_id, image_bytes)
-    if is_dup:
-        if orig_uid == user_id:
-            await message.reply(MESSAGES["duplicate_own"])
+        return 'no_image'
+    upload = _Upload(target.photo)
+    await _score_uploads(message, [upload], bot, stats)
+    if upload.duplicate:
+        with tracing.span('reply'):
+            caption, dup_info = await _duplicate_caption(message.from_user.id, *upload.duplicate)
+            if dup_info is None or not await _reply_stored_photo(message, dup_info, caption):
+                await message.reply(caption)
+    elif upload.outcome == 'nsfw':
+        await message.reply(MESSAGES["nsfw"])
+    elif upload.outcome == 'scored':
+        with tracing.span('reply'):
+            card_msg = await message.reply_photo(_card_input(upload.card), caption=_result_caption(upload))
+        _remember_card(upload, card_msg)
+        await _record_uploads(message, [upload])
+    return upload.outcome
+
+async def _process_cute_album(message: types.Message, album: list[types.Message], bot: Bot) -> str:
+    stats, banned = await _check_banned(message.from_user.id)
+    if banned:
+        return 'banned'
+    uploads = [_Upload(m.photo) for m in album if m.photo][:ALBUM_MAX_PHOTOS]
+    if not uploads:
+        await message.reply(MESSAGES["no_image"])
+        return 'no_image'
+    await _score_uploads(message, uploads, bot, stats)
+    with tracing.span('reply'):
+        shown, media = [], []
+        for upload in uploads:
+            if upload.outcome == 'scored':
+                media.append(InputMediaPhoto(media=_card_input(upload.card), caption=_result_caption(upload)))
+            elif upload.duplicate:
+                caption, dup_info = await _duplicate_caption(message.from_user.id, *upload.duplicate)
+                own_card = dup_info['file_id'] if dup_info and upload.duplicate[0] == message.from_user.id else None
+                media.append(InputMediaPhoto(media=own_card or upload.original.file_id, caption=caption))
+            else:
+                continue
+            shown.append(upload)
+        if any(upload.outcome == 'nsfw' for upload in uploads):
+            await message.reply(MESSAGES["nsfw"])
+        if len(media) == 1:
+            sent = [await message.reply_photo(media[0].media, caption=media[0].caption)]
+        elif media:
+            sent = await message.reply_media_group(media)
         else:
-            dup_info = await _find_duplicate_image_info(image_bytes)
-            if dup_info:
-                caption = MESSAGES["duplicate_other_with_score"].format(
-                    score=func.map_score(dup_info['raw_score']),
-                    place=dup_info['place']
-                )
-                if dup_info['filename']:
-                    cached_path = IMAGES_DIR / dup_info['filename']
-                    if cached_path.exists():
-                        await message.reply_photo(FSInputFile(cached_path), caption=caption)
-                    else:
-                        await message.reply(caption)
-                else:
-                    await message.reply(caption)
+            sent = []
+    for upload, msg in zip(shown, sent):
+        if upload.outcome == 'scored':
+            _remember_card(upload, msg)
+    scored = [u for u in uploads if u.outcome == 'scored']
+    if scored:
+        await _record_uploads(message, scored)
+    return 'album'
+
+def _card_input(card):
+    return card.file_id or BufferedInputFile(card.data, filename='card.png')
+
+def _result_caption(upload: _Upload) -> str:
+    return MESSAGES["cute_result"].format(score=func.map_score(upload.raw), place=upload.place)
+
+def _remember_card(upload: _Upload, card_msg: types.Message) -> None:
+    if card_msg.photo:
+        upload.card_file_id = card_msg.photo[-1].file_id
+        card_cache.set_file_id(upload.card_key, upload.card_file_id)
+
+async def _score_uploads(message: types.Message, uploads: list[_Upload], bot: Bot, stats) -> None:
+    user = message.from_user
+    user_id = user.id
+    with tracing.span('dedup'):
+        for upload in uploads:
+            known = await func.find_photo_duplicate(upload.original.file_unique_id)
+            if known is not None:
+                upload.outcome, upload.duplicate = 'duplicate', known
+    fresh = [u for u in uploads if not u.outcome]
+    if not fresh:
         return
-    temp_path = IMAGES_DIR / f'temp_{uuid.uuid4().hex}.jpg'
-    temp_path.write_bytes(image_bytes)
-    try:
-        nsfw_flag = 0
-        if NSFW_FILTER_ENABLED:
-            try:
-                nsfw_flag = 1 if await func.is_nsfw(image_bytes) else 0
-                if nsfw_flag:
-                    await message.reply(MESSAGES["nsfw"])
-                    return
-            except Exception as e:
-                print(f"NSFW check error: {e}")
-                nsfw_flag = 0
-        
-        image_hash = func.calculate_image_hash(image_bytes)
-        storage_msg = await bot.send_photo(STORAGE_CHAT_ID, FSInputFile(temp_path))
-        await _storage_queue.put(image_bytes)
+    with tracing.span('download') as s:
+        downloads = await asyncio.gather(*(func.download(bot, func.pick_photo_size(u.sizes).file_id) for u in fresh))
+        s['bytes'] = sum(len(data) for data in downloads)
+    with tracing.span('dedup'):
+        for upload, data in zip(fresh, downloads):
+            upload.image_bytes = data
+            upload.image_hash = func.calculate_image_hash(data)
+            orig_uid = await func.find_exact_duplicate(upload.image_hash)
+            if orig_uid is not None:
+                upload.outcome, upload.duplicate = 'duplicate', (orig_uid, upload.image_hash)
+    fresh = [u for u in fresh if not u.outcome]
+    if not fresh:
+        return
+    with tracing.span('scoring'):
+        scores, embeddings = await model.get_scores_and_embeddings([u.image_bytes for u in fresh], model.EMBEDDING_SIZE)
+    with tracing.span('near_dedup'):
+        for upload, raw, embedding in zip(fresh, scores, embeddings):
+            upload.raw = raw
+            is_dup, orig_uid, orig_hash = await func.check_near_duplicate(user_id, upload.image_hash, embedding,
+                                                                          upload.original.file_unique_id)
+            if is_dup:
+                upload.outcome, upload.duplicate = 'near_duplicate', (orig_uid, orig_hash)
+    fresh = [u for u in fresh if not u.outcome]
+    if not fresh:
+        return
+    if CASCADE_SIZE:
+        await _cascade_scores(fresh, [u.raw for u in fresh])
+    if NSFW_FILTER_ENABLED:
+        with tracing.span('nsfw'):
+            for upload in fresh:
+                try:
+                    if await func.is_nsfw(upload.image_bytes):
+                        upload.outcome = 'nsfw'
+                except Exception:
+                    logger.exception("NSFW check failed")
+        fresh = [u for u in fresh if not u.outcome]
+        if not fresh:
+            return
+
+    with tracing.span('storage_upload'):
+        if len(fresh) == 1:
+            storage_msgs = [await bot.send_photo(STORAGE_CHAT_ID, fresh[0].original.file_id)]
+        else:
+            storage_msgs = await bot.send_media_group(STORAGE_CHAT_ID, [InputMediaPhoto(media=u.original.file_id) for u in fresh])
+    for upload, storage_msg in zip(fresh, storage_msgs):
+        upload.storage_msg = storage_msg
+    with tracing.span('avatar'):
         userpic_b64 = None
         try:
             photos = await bot.get_user_profile_photos(user_id, limit=1)
             if photos.total_count > 0:
-                file2 = await bot.get_file(photos.photos[0][-1].file_id)
-                buf2 = await bot.download_file(file2.file_path)
-                userpic_b64 = base64.b64encode(buf2.getvalue()).decode()
+                userpic = await func.download(bot, func.pick_photo_size(photos.photos[0], AVATAR_MIN_SIDE).file_id)
+                userpic_b64 = base64.b64encode(userpic).decode()
         except Exception:
+            logger.warning("Avatar download failed for user %s", user_id, exc_info=True)
             userpic_b64 = None
-        await _update_user_avatar(user_id, user.username, userpic_b64)
-        raw = await model.get_cuteness_score(image_bytes)
-        score = func.map_score(raw)
-        cached_filename = f'cached_{uuid.uuid4().hex}.jpg'
-        cached_path = IMAGES_DIR / cached_filename
-        cached_path.write_bytes(image_bytes)
-        image_id = await _save_image_record(user_id, user.username, storage_msg.message_id, raw, nsfw_flag, image_hash, cached_filename)
-        row = await db.fetchrow('SELECT COUNT(*)+1 AS rank FROM images WHERE raw_score>$1', raw)
-        place = int(row['rank']) if row else 1
+        await _update_user_avatar(user_id, user.username, userpic_b64, stats)
+    with tracing.span('rank'):
+        for upload in fresh:
+            row = await db.fetchrow('SELECT COUNT(*)+1 AS rank FROM images WHERE raw_score>$1', upload.raw)
+            upload.place = int(row['rank']) if row else 1
         top_images = []
         top_rows = await db.fetch('''
             SELECT filename FROM images 
-            WHERE nsfw=0 AND approved=1 AND filename IS NOT NULL
+            WHERE nsfw=0 AND approved=1
             ORDER BY raw_score DESC LIMIT 4
         ''')
-        for top_row in top_rows:
-            top_path = IMAGES_DIR / top_row['filename']
-            top_images.append(str(top_path) if top_path.exists() else None)
-        while len(top_images) < 4:
-            top_images.append(None)
-        output_filename = f'result_{uuid.uuid4().hex}.png'
-        output_path = IMAGES_DIR / output_filename
-        from utils.stats_generator import process_image
-        await process_image(score, place, user.username, userpic_b64, top_images, output_path)
-        await message.reply_photo(FSInputFile(output_path), caption=MESSAGES["cute_result"].format(score=score, place=place))
-        if place <= TOP_THRESHOLD:
-            username_safe = user.username.replace('_', r'\_').replace('*', r'\*').replace('[', r'\[').replace(']', r'\]').replace('(', r'\(').replace(')', r'\)').replace('~', r'\~').replace('`', r'\`').replace('>', r'\>').replace('#', r'\#').replace('+', r'\+').replace('-', r'\-').replace('=', r'\=').replace('|', r'\|').replace('{', r'\{').replace('}', r'\}').replace('.', r'\.').replace('!', r'\!') if user.username else 'неизвестно'
-            await bot.send_photo(
-                chat_id=ADMIN_ID,
-                photo=FSInputFile(cached_path),
-                caption=f"🔍 Модерация\n👤 Пользователь: @{username_safe} (ID: {user_id})\n⭐ Оценка: {score}%\n🏆 Место: #{place}",
-                reply_markup=moderation_kb(image_id)
-            )
-        if output_path.exists():
-            output_path.unlink()
-    finally:
-        if temp_path.exists():
-            temp_path.unlink()
+    for top_row in top_rows:
+        top_path = image_cache.path(top_row['filename'])
+        top_images.append(str(top_path) if top_path else None)
+    while len(top_images) < 4:
+        top_images.append(None)
+    with tracing.span('render') as s:
+        top_version = card_cache.top_version(top_images)
+        for upload in fresh:
+            score = func.map_score(upload.raw)
+            upload.card_key = card_cache.card_key(score, upload.place, user.username, userpic_b64, top_version)
+            upload.card = card_cache.get(upload.card_key)
+        missing = [u for u in fresh if u.card is None]
+        s['cached'] = len(fresh) - len(missing)
+        if missing:
+            from utils.stats_generator import render_card
+            rendered = await asyncio.gather(*(render_card(func.map_score(u.raw), u.place, user.username, userpic_b64, top_images) for u in missing))
+            for upload, data in zip(missing, rendered):
+                upload.card = card_cache.put(upload.card_key, data)
+    for upload in fresh:
+        upload.outcome = 'scored'
+
+async def _record_uploads(message: types.Message, uploads: list[_Upload]) -> None:
+    user = message.from_user
+    user_id = user.id
+    for upload in uploads:
+        storage_file_id = upload.storage_msg.photo[-1].file_id if upload.storage_msg.photo else None
+        with tracing.span('db_write'):
+            image_id = await _save_image_record(user_id, user.username, upload.storage_msg.message_id, upload.raw, 0, upload.image_hash, None, storage_file_id or upload.original.file_id, upload.card_file_id)
+        try:
+            await thumbnails.store(upload.image_hash, bytes(upload.image_bytes))
+        except Exception:
+            logger.warning("Thumbnail for image %s failed", image_id, exc_info=True)
+        if upload.place <= TOP_THRESHOLD:
+            moderation.submit(image_id, storage_file_id or upload.original.file_id, user_id, user.username, upload.raw, upload.place)
 
 @router.callback_query(lambda c: c.data == "show_image_request")
 async def handle_show_image_request(callback: CallbackQuery):
-    _user_states[callback.from_user.id] = "waiting_for_rank"
+    await states.set(f'state:{callback.from_user.id}', "waiting_for_rank", USER_STATE_TTL)
     await callback.message.answer(MESSAGES["ask_rank"])
     await callback.answer()
 
 @router.message(lambda m: m.text and m.text.isdigit())
 async def handle_rank_input(message: types.Message, bot: Bot):
     user_id = message.from_user.id
-    if _user_states.get(user_id) != "waiting_for_rank":
+    if await states.get(f'state:{user_id}') != "waiting_for_rank":
         return
     rank = int(message.text)
     if rank < 1 or rank > 30:
         await message.reply(MESSAGES["rank_invalid"])
         return
     row = await db.fetchrow('''
-        WITH ranked AS (
-            SELECT message_id, username, raw_score, filename,
-                   ROW_NUMBER() OVER (ORDER BY raw_score DESC) as place
-            FROM images WHERE nsfw=0 AND approved=1
-        )
-        SELECT message_id, username, raw_score, filename, place FROM ranked WHERE place=$1
-    ''', rank)
+        SELECT id, message_id, username, raw_score, filename, file_id
+        FROM images WHERE nsfw=0 AND approved=1
+        ORDER BY raw_score DESC
+        OFFSET $1 LIMIT 1
+    ''', rank - 1)
     if not row:
         await message.reply(MESSAGES["rank_not_found"].format(rank=rank))
-        _user_states.pop(user_id, None)
+        await states.delete(f'state:{user_id}')
         return
     try:
         username = row['username']
         username_link = f"[{username}](https://t.me/{username})" if username else "аноним"
         caption = MESSAGES["rank_result"].format(rank=rank, username_link=username_link, score=row['raw_score'])
-        if row['filename']:
-            cached_path = IMAGES_DIR / row['filename']
-            if cached_path.exists():
-                await message.reply_photo(FSInputFile(cached_path), caption=caption, parse_mode="Markdown")
-            else:
-                msg = await bot.forward_message(message.chat.id, STORAGE_CHAT_ID, row['message_id'])
-                try:
-                    await msg.edit_caption(caption, parse_mode="Markdown")
-                except:
-                    pass
-        else:
-            msg = await bot.forward_message(message.chat.id, STORAGE_CHAT_ID, row['message_id'])
-            try:
-                await msg.edit_caption(caption, parse_mode="Markdown")
-            except:
-                pass
+        if not await _reply_stored_photo(message, row, caption, parse_mode="Markdown"):
+            await bot.copy_message(message.chat.id, STORAGE_CHAT_ID, row['message_id'],
+                                   caption=caption, parse_mode="Markdown",
+                                   reply_to_message_id=message.message_id)
     except Exception:
+        logger.exception("Failed to load image for rank %s", rank)
         await message.reply(MESSAGES["rank_load_error"])
-    _user_states.pop(user_id, None)
+    await states.delete(f'state:{user_id}')
 
-@router.callback_query(lambda c: c.data.startswith('approve_'))
+async def _mark_moderated(callback: CallbackQuery, image_id: int, suffix: str, mark: str) -> None:
+    message = callback.message
+    if message.caption is not None:
+        await message.edit_caption(caption=message.caption + suffix, parse_mode=None, reply_markup=None)
+        return
+    rows = message.reply_markup.inline_keyboard if message.reply_markup else []
+    number = next((row[0].text.split()[0] for row in rows if row[0].callback_data.endswith(f'_{image_id}')), None)
+    lines = [line + mark if number and line.startswith(f"{number}. ") else line for line in message.text.split('\n')]
+    remaining = [row for row in rows if not row[0].callback_data.endswith(f'_{image_id}')]
+    await message.edit_text('\n'.join(lines), parse_mode=None,
+                            reply_markup=InlineKeyboardMarkup(inline_keyboard=remaining) if remaining else None)
+
+@router.callback_query(lambda c: c.data.startswith('approve_'), flags={'queue': 'admin'})
 async def handle_approve(callback: CallbackQuery, bot: Bot):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer(MESSAGES["approve_no_permissions"])
         return
     image_id = int(callback.data.split('_', 1)[1])
     await db.execute('UPDATE images SET approved=1 WHERE id=$1', image_id)
-    await callback.message.edit_caption(callback.message.caption + MESSAGES["approved_suffix"], reply_markup=None)
+    await _mark_moderated(callback, image_id, MESSAGES["approved_suffix"], MESSAGES["approved_mark"])
     await callback.answer(MESSAGES["approved"])
-    await _cache_top_images(bot)
+    refresh_top_cache(bot, TOP_CACHE_DEBOUNCE)
 
-@router.callback_query(lambda c: c.data.startswith('ban_'))
+@router.callback_query(lambda c: c.data.startswith('ban_'), flags={'queue': 'admin'})
 async def handle_ban(callback: CallbackQuery, bot: Bot):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer(MESSAGES["approve_no_permissions"])
@@ -317,24 +497,15 @@ async def handle_ban(callback: CallbackQuery, bot: Bot):
     if row:
         user_id = int(row['user_id'])
         await db.execute('UPDATE images SET approved=0 WHERE id=$1', image_id)
-        if row['filename']:
-            cached_path = IMAGES_DIR / row['filename']
-            if cached_path.exists():
-                try:
-                    cached_path.unlink()
-                except Exception:
-                    pass
-        await func.add_warning(user_id)
-        warnings_row = await db.fetchrow('SELECT warnings, banned FROM user_warnings WHERE user_id=$1', user_id)
-        warnings = int(warnings_row['warnings']) if warnings_row else 0
-        banned = bool(warnings_row['banned']) if warnings_row else False
+        image_cache.remove(row['filename'])
+        warnings, banned = await func.add_warning(user_id)
         try:
             if banned:
                 await bot.send_message(user_id, MESSAGES["user_blocked_message"])
             else:
                 await bot.send_message(user_id, MESSAGES["user_warn_message"].format(warnings=warnings))
-        except Exception:
-            pass
-    await callback.message.edit_caption(callback.message.caption + MESSAGES["banned_suffix"], reply_markup=None)
+        except Exception as e:
+            logger.info("Could not notify user %s: %s", user_id, e)
+    await _mark_moderated(callback, image_id, MESSAGES["banned_suffix"], MESSAGES["banned_mark"])
     await callback.answer(MESSAGES["banned"])
-    await _cache_top_images(bot)
\ No newline at end of file
+    refresh_top_cache(bot, TOP_CACHE_DEBOUNCE)
\ No newline at end of file
@@ -0,0 +1,121 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import (ADMIN_ID, RATE_LIMIT_SECONDS, RATE_LIMIT_BURST, GLOBAL_RATE_LIMIT, GLOBAL_RATE_BURST,
+                    HEAVY_WORKERS, HEAVY_QUEUE_SIZE, LIGHT_WORKERS, LIGHT_QUEUE_SIZE, ALBUM_WINDOW)
+from keyboards.messages import MESSAGES
+from model.cascade import cascade
+from utils import ban_cache, moderation
+from utils.rate_limiter import TokenBucket, UserRateLimiter
+from utils.state_store import StateStore
+from utils.work_queue import WorkQueue
+
+limiter_stats = {
+    'allowed': 0,
+    'banned': 0,
+    'throttled_user': 0,
+    'throttled_global': 0,
+}
+
+heavy_queue = WorkQueue('heavy', HEAVY_WORKERS, HEAVY_QUEUE_SIZE)
+light_queue = WorkQueue('light', LIGHT_WORKERS, LIGHT_QUEUE_SIZE)
+REJECTED = object()
+
+def _schedule(event: TelegramObject, data: Dict[str, Any]) -> tuple[WorkQueue, int]:
+    lane = get_flag(data, 'queue', default='light')
+    queue = heavy_queue if lane == 'heavy' else light_queue
+    user = getattr(event, 'from_user', None)
+    priority = 0 if lane == 'admin' and user is not None and user.id == ADMIN_ID else 1
+    return queue, priority
+
+def gauges() -> Dict[str, float]:
+    values = {f'limiter_{name}_total': count for name, count in limiter_stats.items()}
+    for queue in (heavy_queue, light_queue):
+        for name, value in queue.stats().items():
+            values[f'queue_{name}{{queue="{queue.name}"}}'] = value
+    values.update((f'cascade_{name}', value) for name, value in cascade.stats().items())
+    values.update((f'moderation_{name}_total', count) for name, count in moderation.stats.items())
+    values['moderation_pending'] = moderation.pending()
+    return values
+
+class AlbumMiddleware(BaseMiddleware):
+    def __init__(self, window: float = ALBUM_WINDOW):
+        self.window = window
+        self._albums: Dict[str, List[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not event.media_group_id:
+            return await handler(event, data)
+        album = self._albums.get(event.media_group_id)
+        if album is not None:
+            album.append(event)
+            return None
+        self._albums[event.media_group_id] = album = [event]
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            del self._albums[event.media_group_id]
+        album.sort(key=lambda m: m.message_id)
+        data['album'] = album
+        return await handler(next((m for m in album if m.caption), album[0]), data)
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, store: StateStore):
+        self.user_limiter = UserRateLimiter(store, 1 / RATE_LIMIT_SECONDS, RATE_LIMIT_BURST)
+        self.global_bucket = TokenBucket(GLOBAL_RATE_LIMIT, GLOBAL_RATE_BURST)
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not get_flag(data, 'throttle') or event.from_user is None:
+            return await handler(event, data)
+        user_id = event.from_user.id
+        if ban_cache.is_banned(user_id):
+            limiter_stats['banned'] += 1
+            return None
+        if _schedule(event, data)[0].full() or self.global_bucket.consume() > 0:
+            limiter_stats['throttled_global'] += 1
+            await event.reply(MESSAGES["busy"])
+            return None
+        wait = await self.user_limiter.consume(user_id)
+        if wait > 0:
+            self.global_bucket.refund()
+            limiter_stats['throttled_user'] += 1
+            await event.reply(MESSAGES["rate_limited"].format(seconds=max(1, int(wait))))
+            return None
+        result = await handler(event, data)
+        if result is REJECTED:
+            self.global_bucket.refund()
+            await self.user_limiter.refund(user_id)
+            limiter_stats['throttled_global'] += 1
+            return None
+        limiter_stats['allowed'] += 1
+        return result
+
+class SchedulingMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        queue, priority = _schedule(event, data)
+        if queue.submit(lambda: handler(event, data), priority):
+            return None
+        if isinstance(event, CallbackQuery):
+            await event.answer(MESSAGES["busy"])
+        elif isinstance(event, Message):
+            await event.reply(MESSAGES["busy"])
+        return REJECTED
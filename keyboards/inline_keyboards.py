@@ -11,3 +11,12 @@ def moderation_kb(image_id: int):
             InlineKeyboardButton(text="❌ Ban", callback_data=f"ban_{image_id}")
         ]
     ])
+
+def digest_kb(items: list[tuple[int, int]]):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text=f"{number} ✅", callback_data=f"approve_{image_id}"),
+            InlineKeyboardButton(text=f"{number} ❌", callback_data=f"ban_{image_id}")
+        ]
+        for number, image_id in items
+    ])
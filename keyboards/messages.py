@@ -4,6 +4,7 @@ MESSAGES = {
     "top_list_header": "🏆 Топ-30 милейших картинок в мире:\n\n",
     "no_image": "Ой! Нужно отправить картинку, чтобы я её оценила 🎀",
     "rate_limited": "Погоди немножко~ ⏳ Попробуй снова через {seconds} сек.",
+    "busy": "Ой, сейчас слишком много милоты на проверке~ 🐾 Попробуй чуть позже!",
     "duplicate_own": "🔄 Хм… ты уже отправлял эту картинку (или очень похожую)!",
     "duplicate_other": "🔄 Ой! Эта картинка (или очень похожая) уже была у другого пользователя~",
     "duplicate_other_with_score": "🔄 Ой! Эта картинка уже была у другого пользователя~\n💖 Оценка: {score}%\n🏆 Место: #{place}",
@@ -19,6 +20,10 @@ MESSAGES = {
     "approved_suffix": "\n\n✅ ОДОБРЕНО",
     "banned": "Картинка заблокирована, пользователь получил предупреждение ⚠️",
     "banned_suffix": "\n\n❌ ЗАБЛОКИРОВАНО",
+    "approved_mark": " — ✅",
+    "banned_mark": " — ❌",
+    "moderation_caption": "🔍 Модерация\n👤 Пользователь: {author} (ID: {user_id})\n⭐ Оценка: {score}%\n🏆 Место: #{place}",
+    "moderation_digest": "🔍 Модерация: {count} шт.\n\n",
     "user_blocked_message": "⛔ Твоя картинка была удалена модератором.\nЭто второе предупреждение — я больше не смогу отвечать на твои сообщения…",
     "user_warn_message": "⚠️ Твоя картинка была удалена модератором.\nПредупреждений: {warnings}/2\nЕсли их будет 2, я не смогу больше с тобой общаться 😿",
     "processing_error": "Ой… что-то пошло не так при обработке картинки 💔"
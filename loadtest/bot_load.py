@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import secrets
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit, urlunsplit
+
+import asyncpg
+import numpy as np
+from PIL import Image
+
+ADMIN_ID = 1_000_000_001
+STORAGE_CHAT_ID = -1_000_000_002
+os.environ.setdefault('ADMIN_ID', str(ADMIN_ID))
+os.environ.setdefault('STORAGE_CHAT_ID', str(STORAGE_CHAT_ID))
+os.environ.setdefault('MODERATION_DIGEST_INTERVAL', '1')
+
+ACTIONS = {'upload': 0.5, 'album': 0.1, 'top': 0.25, 'rank': 0.15}
+
+_request: contextvars.ContextVar['Request | None'] = contextvars.ContextVar('load_request', default=None)
+
+class Request:
+    __slots__ = ('action', 'started', 'finished', 'outcome', 'queries')
+
+    def __init__(self, action: str):
+        self.action = action
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self.outcome = 'timeout'
+        self.queries = 0
+
+def make_fixtures(count: int, seed: int = 0) -> list[bytes]:
+    rng = np.random.default_rng(seed)
+    fixtures = []
+    for _ in range(count):
+        blocks = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+        img = Image.fromarray(blocks).resize((640, 480), Image.Resampling.BILINEAR)
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=85)
+        fixtures.append(buf.getvalue())
+    return fixtures
+
+def load_fixtures(path: str) -> list[bytes]:
+    names = sorted(n for n in os.listdir(path) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+    return [open(os.path.join(path, n), 'rb').read() for n in names]
+
+def _database_url(dsn: str, name: str) -> str:
+    parts = urlsplit(dsn)
+    return urlunsplit((parts.scheme, parts.netloc, f'/{name}', parts.query, parts.fragment))
+
+class LoadRun:
+    def __init__(self, args, fixtures: list[bytes]):
+        from aiogram import Bot, Dispatcher
+        from loadtest.fake_telegram import FakeSession, FakeTelegram
+        from handlers import main_handler
+        self.args = args
+        self.fake = FakeTelegram(latency=args.latency, fixtures=fixtures)
+        self.fake.observer = self._observe
+        self.bot = Bot('123456:load', session=FakeSession(self.fake))
+        self.dp = Dispatcher()
+        self.dp.include_router(main_handler.router)
+        self.requests: list[Request] = []
+        self.waiters: dict[tuple, tuple[Request, asyncio.Future]] = {}
+        self.moderation: asyncio.Queue = asyncio.Queue()
+        self.banned: set[int] = set()
+        self.ids = itertools.count(1)
+        self.uploads = itertools.count()
+        self.stop_at = 0.0
+
+    def _observe(self, method: str, params: dict, result) -> None:
+        chat_id = params.get('chat_id')
+        if method in ('sendphoto', 'sendmessage') and chat_id == ADMIN_ID:
+            for row in (params.get('reply_markup') or {}).get('inline_keyboard', []):
+                for button in row:
+                    if button.get('callback_data', '').startswith('approve_'):
+                        self.moderation.put_nowait(int(button['callback_data'].split('_', 1)[1]))
+        if method == 'sendmessage' and params.get('text') == self.blocked_text:
+            self.banned.add(chat_id)
+        reply = params.get('reply_parameters') or {}
+        reply_to = reply.get('message_id') or params.get('reply_to_message_id')
+        if reply_to is not None:
+            key = ('message', chat_id, reply_to)
+        elif method == 'answercallbackquery':
+            key = ('callback', params.get('callback_query_id'))
+        else:
+            return
+        waiter = self.waiters.pop(key, None)
+        if waiter is None:
+            return
+        request, future = waiter
+        request.finished = time.perf_counter()
+        request.outcome = self._classify(method, params)
+        if not future.done():
+            future.set_result(None)
+
+    def _classify(self, method: str, params: dict) -> str:
+        from keyboards.messages import MESSAGES
+        text = params.get('text') or params.get('caption') or ''
+        if text == MESSAGES['busy']:
+            return 'busy'
+        if text.startswith(MESSAGES['rate_limited'].split('{')[0]):
+            return 'rate_limited'
+        for name in ('duplicate_own', 'duplicate_other', 'duplicate_other_with_score', 'no_image', 'rank_not_found', 'top_empty'):
+            if text == MESSAGES[name] or text.startswith(MESSAGES[name].split('{')[0]):
+                return name
+        return method
+
+    @property
+    def blocked_text(self) -> str:
+        from keyboards.messages import MESSAGES
+        return MESSAGES['user_blocked_message']
+
+    def _user(self, user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}', 'username': f'load_user_{user_id}'}
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {'message_id': next(self.ids), 'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'}, 'from': self._user(user_id), **fields}
+
+    async def _send(self, action: str, update: dict, key: tuple, extra: tuple[dict, ...] = ()) -> Request:
+        from aiogram.types import Update
+        request = Request(action)
+        self.requests.append(request)
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[key] = (request, future)
+        token = _request.set(request)
+        try:
+            await asyncio.gather(*(
+                self.dp.feed_update(self.bot, Update.model_validate({'update_id': next(self.ids), **u}, context={'bot': self.bot}))
+                for u in (update, *extra)))
+        finally:
+            _request.reset(token)
+        try:
+            await asyncio.wait_for(future, self.args.reply_timeout)
+        except asyncio.TimeoutError:
+            self.waiters.pop(key, None)
+        return request
+
+    def _photo(self) -> list[dict]:
+        n = next(self.uploads)
+        return [{'file_id': f'fixture_{n}', 'file_unique_id': f'fx{n}', 'width': 640, 'height': 480},
+                {'file_id': f'original_{n}', 'file_unique_id': f'fo{n}', 'width': 2560, 'height': 1920}]
+
+    async def upload(self, user_id: int) -> Request:
+        message = self._message(user_id, caption='cute', photo=self._photo())
+        return await self._send('upload', {'message': message}, ('message', user_id, message['message_id']))
+
+    async def album(self, user_id: int) -> Request:
+        group = secrets.token_hex(8)
+        messages = [self._message(user_id, media_group_id=group, photo=self._photo()) for _ in range(random.randint(2, 5))]
+        messages[0]['caption'] = 'cute'
+        return await self._send('album', {'message': messages[0]}, ('message', user_id, messages[0]['message_id']),
+                                tuple({'message': m} for m in messages[1:]))
+
+    async def top(self, user_id: int) -> Request:
+        message = self._message(user_id, text='/top', entities=[{'type': 'bot_command', 'offset': 0, 'length': 4}])
+        return await self._send('top', {'message': message}, ('message', user_id, message['message_id']))
+
+    async def rank(self, user_id: int) -> Request:
+        callback_id = secrets.token_hex(8)
+        callback = {'id': callback_id, 'from': self._user(user_id), 'chat_instance': 'load', 'data': 'show_image_request',
+                    'message': self._message(user_id, text='top')}
+        await self._send('show_top_image', {'callback_query': callback}, ('callback', callback_id))
+        message = self._message(user_id, text=str(random.randint(1, 30)))
+        return await self._send('rank', {'message': message}, ('message', user_id, message['message_id']))
+
+    async def moderate(self, image_id: int, approve: bool) -> Request:
+        callback_id = secrets.token_hex(8)
+        data = f"{'approve' if approve else 'ban'}_{image_id}"
+        callback = {'id': callback_id, 'from': self._user(ADMIN_ID), 'chat_instance': 'load', 'data': data,
+                    'message': self._message(ADMIN_ID, caption='moderation', photo=[
+                        {'file_id': 'mod', 'file_unique_id': 'mod', 'width': 320, 'height': 240}])}
+        return await self._send('moderate', {'callback_query': callback}, ('callback', callback_id))
+
+    async def user_loop(self, user_id: int) -> None:
+        await asyncio.sleep(random.uniform(0, self.args.think))
+        actions, weights = zip(*ACTIONS.items())
+        while time.monotonic() < self.stop_at and user_id not in self.banned:
+            action = random.choices(actions, weights)[0]
+            await getattr(self, action)(user_id)
+            await asyncio.sleep(random.expovariate(1 / self.args.think))
+
+    async def admin_loop(self) -> None:
+        while time.monotonic() < self.stop_at:
+            try:
+                image_id = await asyncio.wait_for(self.moderation.get(), 1)
+            except asyncio.TimeoutError:
+                continue
+            await self.moderate(image_id, random.random() >= self.args.ban_ratio)
+
+    async def run(self) -> float:
+        self.stop_at = time.monotonic() + self.args.duration
+        start = time.perf_counter()
+        base = 10_000_000
+        await asyncio.gather(self.admin_loop(), *(self.user_loop(base + i) for i in range(self.args.users)))
+        return time.perf_counter() - start
+
+def _count_queries(db) -> Counter:
+    totals = Counter()
+    for name in ('fetch', 'fetchrow', 'fetchval', 'execute'):
+        original = getattr(db, name)
+
+        async def counted(query, *args, _original=original, _name=name):
+            totals[_name] += 1
+            request = _request.get()
+            if request is not None:
+                request.queries += 1
+            return await _original(query, *args)
+
+        setattr(db, name, counted)
+    return totals
+
+def report(run: LoadRun, elapsed: float, query_totals: Counter) -> dict:
+    from handlers import middlewares
+    from utils import tracing
+    by_action = defaultdict(list)
+    for request in run.requests:
+        by_action[request.action].append(request)
+    actions = {}
+    for action, requests in sorted(by_action.items()):
+        hist = tracing.Histogram()
+        for request in requests:
+            if request.finished is not None:
+                hist.record(request.finished - request.started)
+        actions[action] = {
+            'requests': len(requests),
+            'per_sec': round(len(requests) / elapsed, 2),
+            'latency_ms': {f'p{int(q * 100)}': round(hist.percentile(q) * 1000, 2) for q in tracing.QUANTILES} | {'max': round(hist.max * 1000, 2)},
+            'db_queries_per_request': round(sum(r.queries for r in requests) / len(requests), 2),
+            'outcomes': dict(Counter(r.outcome for r in requests)),
+        }
+    stages = {name: {f'p{int(q * 100)}_ms': round(hist.percentile(q) * 1000, 2) for q in tracing.QUANTILES} | {'count': hist.count}
+              for name, hist in sorted(tracing.histograms().items())}
+    return {
+        'users': run.args.users,
+        'duration_s': round(elapsed, 2),
+        'requests': len(run.requests),
+        'requests_per_sec': round(len(run.requests) / elapsed, 2),
+        'actions': actions,
+        'db_queries': dict(query_totals),
+        'api_calls': dict(run.fake.calls),
+        'banned_users': len(run.banned),
+        'stages': stages,
+        'gauges': middlewares.gauges(),
+    }
+
+async def main(args) -> dict:
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else make_fixtures(args.images)
+    name = f'cutebot_load_{secrets.token_hex(4)}'
+    admin = await asyncpg.connect(args.dsn)
+    await admin.execute(f'CREATE DATABASE {name}')
+    os.environ['DATABASE_URL'] = _database_url(args.dsn, name)
+    os.environ['EMBEDDINGS_DIR'] = tempfile.mkdtemp(prefix='cutebot_load_')
+    if not args.checkpoint:
+        os.environ.setdefault('DUPLICATE_SIMILARITY', '1.01')
+    try:
+        import torch
+        from database import db
+        from model import model
+        from handlers import middlewares
+        from utils import ban_cache, func, image_cache, moderation
+        if not args.checkpoint:
+            torch.manual_seed(0)
+            model.set_model(model.CutenessModel(pretrained=False))
+        await db.init_db()
+        await ban_cache.start()
+        await func.load_embedding_index()
+        query_totals = _count_queries(db)
+        run = LoadRun(args, fixtures)
+        moderation.start(run.bot)
+        elapsed = await run.run()
+        await middlewares.heavy_queue.stop(args.reply_timeout)
+        await middlewares.light_queue.stop(args.reply_timeout)
+        await moderation.stop()
+        result = report(run, elapsed, query_totals)
+        await ban_cache.stop()
+        await db.close_db()
+        for data in (*fixtures, run.fake.photo):
+            image_cache.remove(image_cache.filename_for(hashlib.sha256(data).hexdigest()))
+        return result
+    finally:
+        shutil.rmtree(os.environ['EMBEDDINGS_DIR'], ignore_errors=True)
+        if not args.keep_db:
+            await admin.execute(f'DROP DATABASE IF EXISTS {name} WITH (FORCE)')
+        await admin.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end load test of the bot router against a fake Bot API and a throwaway PostgreSQL database')
+    parser.add_argument('--dsn', default=os.getenv('LOAD_DSN', 'postgresql://postgres@localhost/postgres'),
+                        help='PostgreSQL server; a temporary database is created on it and dropped afterwards')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=60, help='seconds of simulated traffic')
+    parser.add_argument('--think', type=float, default=5.0, help='mean seconds between actions of one user')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every fake Bot API call')
+    parser.add_argument('--images', type=int, default=2000, help='number of synthetic fixture images')
+    parser.add_argument('--fixtures', help='directory of images to upload instead of synthetic ones')
+    parser.add_argument('--ban-ratio', type=float, default=0.1, help='share of moderated images that get banned')
+    parser.add_argument('--reply-timeout', type=float, default=30)
+    parser.add_argument('--checkpoint', action='store_true', help='use the real model checkpoint instead of random weights')
+    parser.add_argument('--keep-db', action='store_true')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args)), indent=2, ensure_ascii=False))
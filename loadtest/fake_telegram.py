@@ -0,0 +1,175 @@
+import asyncio
+import io
+import itertools
+import json
+import time
+from collections import Counter
+from typing import Callable
+
+from aiohttp import web
+from aiogram.client.session.base import BaseSession
+from PIL import Image
+
+def make_fixture_jpeg(width: int = 1280, height: int = 960, seed: int = 0) -> bytes:
+    img = Image.effect_mandelbrot((width, height), (-2.0 + seed * 0.01, -1.5, 1.0, 1.5), 100).convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=85)
+    return buf.getvalue()
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0, photo: bytes | None = None, fixtures: list[bytes] | None = None):
+        self.latency = latency
+        self.photo = photo or make_fixture_jpeg()
+        self.fixtures = fixtures or [self.photo]
+        self.observer: Callable[[str, dict, object], None] | None = None
+        self.calls: Counter[str] = Counter()
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self._ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self._waiters: list[tuple[str, int, asyncio.Future]] = []
+
+    def _photo_sizes(self) -> list[dict]:
+        n = next(self._ids)
+        return [
+            {'file_id': f'small_{n}', 'file_unique_id': f'us{n}', 'width': 320, 'height': 240, 'file_size': len(self.photo)},
+            {'file_id': f'large_{n}', 'file_unique_id': f'ul{n}', 'width': 1280, 'height': 960, 'file_size': len(self.photo)},
+        ]
+
+    def _message(self, params, **extra) -> dict:
+        chat_id = int(params.get('chat_id', 0) or 0)
+        return {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            **extra,
+        }
+
+    def _result(self, method: str, params) -> object:
+        if method == 'getme':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        if method == 'getupdates':
+            return None
+        if method in ('sendphoto', 'forwardmessage', 'editmessagecaption'):
+            return self._message(params, photo=self._photo_sizes(), caption=params.get('caption'))
+        if method in ('sendmessage', 'editmessagetext'):
+            return self._message(params, text=params.get('text', ''))
+        if method == 'sendmediagroup':
+            media = params.get('media') or []
+            media = json.loads(media) if isinstance(media, str) else media
+            group = str(next(self._ids))
+            return [self._message(params, photo=self._photo_sizes(), caption=item.get('caption'), media_group_id=group)
+                    for item in media]
+        if method == 'copymessage':
+            return {'message_id': next(self._ids)}
+        if method == 'getfile':
+            file_id = params.get('file_id', 'file')
+            return {'file_id': file_id, 'file_unique_id': file_id, 'file_size': len(self.photo), 'file_path': f'photos/{file_id}.jpg'}
+        if method == 'getuserprofilephotos':
+            return {'total_count': 1, 'photos': [self._photo_sizes()]}
+        return True
+
+    def file_bytes(self, path: str) -> bytes:
+        name = path.rsplit('/', 1)[-1].split('.', 1)[0]
+        if name.startswith('fixture_'):
+            return self.fixtures[int(name[len('fixture_'):]) % len(self.fixtures)]
+        return self.photo
+
+    def respond(self, method: str, params) -> object:
+        result = self._result(method, params)
+        if self.observer is not None:
+            self.observer(method, params, result)
+        return result
+
+    async def _api(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        params = await request.post()
+        self.calls[method] += 1
+        self._notify(method)
+        if method == 'getupdates':
+            timeout = float(params.get('timeout', 0) or 0)
+            try:
+                update = await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01))
+                batch = [update]
+                while not self.updates.empty() and len(batch) < 100:
+                    batch.append(self.updates.get_nowait())
+            except asyncio.TimeoutError:
+                batch = []
+            return web.json_response({'ok': True, 'result': batch})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'ok': True, 'result': self.respond(method, params)})
+
+    async def _file(self, request: web.Request) -> web.Response:
+        self.calls['download'] += 1
+        self._notify('download')
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=self.file_bytes(request.match_info['path']), content_type='image/jpeg')
+
+    def _notify(self, method: str) -> None:
+        for waiter in list(self._waiters):
+            name, count, future = waiter
+            if name == method and self.calls[method] >= count and not future.done():
+                future.set_result(None)
+                self._waiters.remove(waiter)
+
+    async def wait_for(self, method: str, count: int, timeout: float | None = None) -> None:
+        if self.calls[method] >= count:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((method, count, future))
+        await asyncio.wait_for(future, timeout)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_post('/bot{token}/{method}', self._api)
+        app.router.add_get('/file/bot{token}/{path:.+}', self._file)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8081) -> str:
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f'http://{host}:{port}'
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+class FakeSession(BaseSession):
+    def __init__(self, fake: FakeTelegram | None = None):
+        super().__init__()
+        self.fake = fake or FakeTelegram()
+
+    async def make_request(self, bot, method, timeout=None):
+        name = method.__api_method__.lower()
+        self.fake.calls[name] += 1
+        if self.fake.latency:
+            await asyncio.sleep(self.fake.latency)
+        result = self.fake.respond(name, method.model_dump(exclude_none=True))
+        return self.check_response(bot, method, 200, json.dumps({'ok': True, 'result': result})).result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        self.fake.calls['download'] += 1
+        if self.fake.latency:
+            await asyncio.sleep(self.fake.latency)
+        yield self.fake.file_bytes(url)
+
+    async def close(self) -> None:
+        pass
+
+async def _serve(host: str, port: int, latency: float) -> None:
+    fake = FakeTelegram(latency=latency)
+    url = await fake.start(host, port)
+    print(f'Fake Telegram Bot API on {url} (set TELEGRAM_API_URL={url})')
+    await asyncio.Event().wait()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Local fake Telegram Bot API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API call')
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port, args.latency))
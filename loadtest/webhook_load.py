@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from loadtest.fake_telegram import FakeTelegram
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load', 'username': f'load{user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+async def run(args) -> dict:
+    fake = FakeTelegram(latency=args.latency)
+    await fake.start(args.fake_host, args.fake_port)
+    print(f'Waiting for the bot to call setWebhook on http://{args.fake_host}:{args.fake_port} ...')
+    await fake.wait_for('setwebhook', 1, timeout=args.timeout)
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret}
+    statuses: dict[int, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.updates):
+        queue.put_nowait(make_update(i + 1, 100000 + i % args.users, args.text))
+
+    async def worker(session: aiohttp.ClientSession):
+        while not queue.empty():
+            update = queue.get_nowait()
+            async with session.post(args.webhook_url, json=update, headers=headers) as resp:
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+    reply_method = 'sendmessage' if args.text.startswith(('/start', '/top')) else args.reply_method
+    baseline = fake.calls[reply_method]
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+    accepted = time.perf_counter() - started
+    try:
+        await fake.wait_for(reply_method, baseline + args.updates, timeout=args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+    replies = fake.calls[reply_method] - baseline
+    await fake.stop()
+    return {
+        'updates': args.updates,
+        'statuses': statuses,
+        'accept_seconds': round(accepted, 3),
+        'accepted_per_sec': round(args.updates / accepted, 1) if accepted else None,
+        'replies': replies,
+        'processed_seconds': round(elapsed, 3),
+        'processed_per_sec': round(replies / elapsed, 1) if elapsed else None,
+        'api_calls': dict(fake.calls),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Synthetic webhook load. Run the bot with TELEGRAM_API_URL pointing at the fake API '
+                    'started here and WEBHOOK_URL/WEBHOOK_SECRET matching --webhook-url/--secret.')
+    parser.add_argument('--webhook-url', default='http://127.0.0.1:8080/webhook')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--text', default='/start')
+    parser.add_argument('--reply-method', default='sendphoto')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fake-host', default='127.0.0.1')
+    parser.add_argument('--fake-port', type=int, default=8081)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
@@ -1,20 +1,83 @@
 import asyncio
+import logging
+import signal
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from config import BOT_TOKEN
+from config import (BOT_TOKEN, TELEGRAM_API_URL, UPDATE_CONCURRENCY, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST,
+                    WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_DRAIN_TIMEOUT, METRICS_PATH, METRICS_FLUSH_SECONDS,
+                    TRACE_LOG_PATH, CASCADE_SIZE, CASCADE_CALIBRATION_PATH, TOP_CACHE_DEBOUNCE, TOP_CHANNEL,
+                    STATE_CLEANUP_SECONDS)
 from database import db
 from handlers import main_handler
+from handlers import middlewares
+from handlers.middlewares import heavy_queue, light_queue
+from model import model
+from model.cascade import cascade
+from utils import ban_cache, func, image_cache, moderation, tracing
+from utils.state_store import cleanup_loop
+from utils.webhook import run_webhook
+
+def _stop_event() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    return stop
+
+def _setup_logging() -> None:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if TRACE_LOG_PATH:
+        handler = logging.FileHandler(TRACE_LOG_PATH)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        tracing.logger.addHandler(handler)
+        tracing.logger.propagate = False
 
 async def main():
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
+    _setup_logging()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
     dp = Dispatcher()
     dp.include_router(main_handler.router)
     await db.init_db()
+    await ban_cache.start()
+    version = await asyncio.to_thread(model.embedding_version)
+    await func.load_embedding_index(version)
+    if CASCADE_SIZE:
+        await asyncio.to_thread(cascade.load, CASCADE_CALIBRATION_PATH, version)
+    await asyncio.to_thread(image_cache.rebuild)
+    await asyncio.to_thread(model.get_model)
+    moderation.start(bot)
+
+    async def resync_top_cache() -> None:
+        main_handler.refresh_top_cache(bot)
+
+    await db.listen(TOP_CHANNEL, lambda *_: main_handler.refresh_top_cache(bot, TOP_CACHE_DEBOUNCE), resync_top_cache)
+    metrics_task = asyncio.create_task(tracing.export_loop(METRICS_PATH, METRICS_FLUSH_SECONDS, middlewares.gauges))
+    cleanup_task = asyncio.create_task(cleanup_loop(main_handler.states, STATE_CLEANUP_SECONDS))
     try:
-        await dp.start_polling(bot)
+        if WEBHOOK_URL:
+            await run_webhook(dp, bot, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+                              UPDATE_CONCURRENCY, WEBHOOK_DRAIN_TIMEOUT, _stop_event())
+        else:
+            await dp.start_polling(bot, tasks_concurrency_limit=UPDATE_CONCURRENCY)
     finally:
+        await heavy_queue.stop(WEBHOOK_DRAIN_TIMEOUT)
+        await light_queue.stop(WEBHOOK_DRAIN_TIMEOUT)
+        await moderation.stop()
+        metrics_task.cancel()
+        cleanup_task.cancel()
+        tracing.write_snapshot(METRICS_PATH, middlewares.gauges())
+        if CASCADE_SIZE:
+            cascade.save(CASCADE_CALIBRATION_PATH)
         await bot.session.close()
+        await ban_cache.stop()
+        await func.close_embedding_index()
         await db.close_db()
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+import argparse
+import copy
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import torch
+
+from config import INFERENCE_PROFILE_PATH, MODEL_INPUT_SIZE, MODEL_PATH
+from model import model
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+BF16_TOLERANCE = 0.01
+THROUGHPUT_SLACK = 0.05
+
+def _thread_candidates(cpus: int) -> list[int]:
+    candidates, n = {1, cpus}, 2
+    while n < cpus:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+def _interop_candidates(cpus: int) -> list[int]:
+    return [1, 2] if cpus > 1 else [1]
+
+def _time(net: model.CutenessModel, x: torch.Tensor, min_time: float) -> float:
+    for _ in range(2):
+        model.infer(net, x)
+    samples, start = [], time.perf_counter()
+    while len(samples) < 3 or time.perf_counter() - start < min_time:
+        began = time.perf_counter()
+        model.infer(net, x)
+        samples.append(time.perf_counter() - began)
+    return statistics.median(samples)
+
+def _build(args) -> model.CutenessModel:
+    if args.random_weights:
+        torch.manual_seed(0)
+        return model.CutenessModel(pretrained=False)
+    return model.load_model(args.checkpoint)
+
+def trial(args) -> dict:
+    torch.set_num_interop_threads(args.trial)
+    base = _build(args).eval()
+    torch.manual_seed(1)
+    probe = torch.rand(8, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)
+    single = probe[:1]
+    model.configure({'channels_last': False, 'bf16': False})
+    reference = model.infer(base, probe)[0]
+    bf16_options = (False, True) if model.device.type != 'cpu' or torch.ops.mkldnn._is_mkldnn_bf16_supported() else (False,)
+    configs = []
+    for threads in _thread_candidates(os.cpu_count()):
+        for channels_last in (False, True):
+            for bf16 in bf16_options:
+                settings = {'num_threads': threads, 'interop_threads': args.trial, 'channels_last': channels_last, 'bf16': bf16}
+                model.configure(settings)
+                net = model.prepare(copy.deepcopy(base))
+                error = (model.infer(net, probe)[0] - reference).abs().max().item()
+                latency = _time(net, single, args.min_time)
+                configs.append({**settings, 'latency_ms': latency * 1000, 'error': error})
+                print(json.dumps(configs[-1]), file=sys.stderr)
+    best = min((c for c in configs if c['error'] <= BF16_TOLERANCE), key=lambda c: c['latency_ms'])
+    model.configure(best)
+    net = model.prepare(copy.deepcopy(base))
+    batches = {}
+    for batch_size in BATCH_SIZES:
+        x = torch.rand(batch_size, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)
+        batches[batch_size] = batch_size / _time(net, x, args.min_time)
+        print(json.dumps({'batch_size': batch_size, 'images_per_second': batches[batch_size]}), file=sys.stderr)
+    peak = max(batches.values())
+    batch_size = min(size for size, rate in batches.items() if rate >= peak * (1 - THROUGHPUT_SLACK))
+    return {**best, 'batch_size': batch_size, 'images_per_second': batches[batch_size], 'configs': configs}
+
+def tune(args) -> dict:
+    forwarded = ['--min-time', str(args.min_time), '--checkpoint', args.checkpoint] + (['--random-weights'] if args.random_weights else [])
+    results = []
+    for interop in _interop_candidates(os.cpu_count()):
+        print(f'Interop threads {interop}...', flush=True)
+        proc = subprocess.run([sys.executable, '-m', 'model.autotune', '--trial', str(interop), *forwarded],
+                              stdout=subprocess.PIPE, text=True, check=True)
+        results.append(json.loads(proc.stdout))
+    best = min(results, key=lambda r: r['latency_ms'])
+    return {
+        'num_threads': best['num_threads'],
+        'interop_threads': best['interop_threads'],
+        'channels_last': best['channels_last'],
+        'bf16': best['bf16'],
+        'batch_size': best['batch_size'],
+        'latency_ms': round(best['latency_ms'], 2),
+        'images_per_second': round(best['images_per_second'], 1),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'device': model.device.type,
+        'tuned_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find the fastest inference settings for this host')
+    parser.add_argument('--checkpoint', default=MODEL_PATH)
+    parser.add_argument('--random-weights', action='store_true', help='tune with an untrained model')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds spent timing each configuration')
+    parser.add_argument('--out', default=str(INFERENCE_PROFILE_PATH), help='where to write the profile')
+    parser.add_argument('--trial', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.trial is not None:
+        print(json.dumps(trial(args)))
+        sys.exit()
+    profile = tune(args)
+    with open(args.out, 'w') as f:
+        json.dump(profile, f, indent=2)
+    print(json.dumps(profile, indent=2))
+    print(f'Saved to {args.out}')
@@ -0,0 +1,97 @@
+import json
+import logging
+import random
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from config import (CASCADE_AUDIT_RATE, CASCADE_MAX_ERROR, CASCADE_MIN_SAMPLES, CASCADE_QUANTILE, CASCADE_WINDOW,
+                    RAW_MIN, RAW_MAX)
+
+logger = logging.getLogger(__name__)
+
+class Cascade:
+    def __init__(self, window: int = CASCADE_WINDOW, quantile: float = CASCADE_QUANTILE,
+                 min_samples: int = CASCADE_MIN_SAMPLES, audit_rate: float = CASCADE_AUDIT_RATE,
+                 max_error: float = CASCADE_MAX_ERROR):
+        self.errors: deque[float] = deque(maxlen=window)
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.audit_rate = audit_rate
+        self.max_error = max_error
+        self.version = ''
+        self.counts: Counter[str] = Counter()
+        self.audit_delta_total = 0.0
+        self._bias = 0.0
+        self._bound: Optional[float] = None
+
+    def _recalibrate(self) -> None:
+        errors = np.fromiter(self.errors, dtype=np.float64, count=len(self.errors))
+        self._bias = float(errors.mean()) if len(errors) else 0.0
+        self._bound = float(np.quantile(np.abs(errors - self._bias), self.quantile)) if len(errors) >= self.min_samples else None
+
+    @property
+    def bound(self) -> Optional[float]:
+        return self._bound
+
+    def calibrated(self, estimate: float) -> float:
+        return max(RAW_MIN, min(RAW_MAX, estimate + self._bias))
+
+    def decide(self, estimate: float, cut: Optional[float]) -> str:
+        self.counts['estimated'] += 1
+        if self._bound is None:
+            reason = 'uncalibrated'
+        elif self._bound > self.max_error:
+            reason = 'imprecise'
+        elif random.random() < self.audit_rate:
+            reason = 'audit'
+        elif cut is None or self.calibrated(estimate) + self._bound >= cut:
+            reason = 'top'
+        else:
+            return ''
+        self.counts[f'full_{reason}'] += 1
+        return reason
+
+    def observe(self, estimate: float, full: float, reason: str) -> None:
+        if reason == 'audit':
+            delta = abs(full - self.calibrated(estimate))
+            self.audit_delta_total += delta
+            if delta > self._bound:
+                self.counts['audit_missed'] += 1
+        elif reason == 'top':
+            return
+        self.errors.append(full - estimate)
+        self._recalibrate()
+
+    def stats(self) -> Dict[str, float]:
+        estimated = self.counts['estimated']
+        full = sum(count for name, count in self.counts.items() if name.startswith('full_'))
+        audits = self.counts['full_audit']
+        values = {f'{name}_total': count for name, count in self.counts.items()}
+        values.update({
+            'hit_rate': (estimated - full) / estimated if estimated else 0.0,
+            'audit_mean_abs_delta': self.audit_delta_total / audits if audits else 0.0,
+            'bias': self._bias,
+            'bound': self._bound if self._bound is not None else -1.0,
+            'samples': len(self.errors),
+        })
+        return values
+
+    def load(self, path: Path, version: str) -> None:
+        self.version = version
+        try:
+            data = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get('version') != version:
+            logger.info("Cascade calibration is for another model, starting over")
+            return
+        self.errors.extend(data['errors'])
+        self._recalibrate()
+
+    def save(self, path: Path) -> None:
+        path.write_text(json.dumps({'version': self.version, 'errors': list(self.errors)}))
+
+cascade = Cascade()
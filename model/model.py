@@ -1,23 +1,39 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torchvision import transforms
 from torchvision.models import mobilenet_v3_large, MobileNet_V3_Large_Weights
 from PIL import Image
 import io
-from config import MODEL_PATH
+from config import MODEL_PATH, MODEL_INPUT_SIZE, INFERENCE_PROFILE_PATH, CASCADE_SIZE, HEAVY_WORKERS
+
+logger = logging.getLogger(__name__)
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+_executor = ThreadPoolExecutor(max_workers=HEAVY_WORKERS, thread_name_prefix='inference')
+
+def _make_preprocess(size: int) -> transforms.Compose:
+    return transforms.Compose([
+        transforms.Resize((size, size)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
 
-preprocess = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
+preprocess = _make_preprocess(MODEL_INPUT_SIZE)
+_preprocessors = {MODEL_INPUT_SIZE: preprocess}
+EMBEDDING_SIZE = CASCADE_SIZE or MODEL_INPUT_SIZE
 
 class CutenessModel(nn.Module):
-    def __init__(self):
+    def __init__(self, pretrained: bool = True):
         super().__init__()
-        weights = MobileNet_V3_Large_Weights.IMAGENET1K_V1
+        weights = MobileNet_V3_Large_Weights.IMAGENET1K_V1 if pretrained else None
         self.backbone = mobilenet_v3_large(weights=weights)
         for param in self.backbone.features.parameters():
             param.requires_grad = False
@@ -36,14 +52,111 @@ class CutenessModel(nn.Module):
     def forward(self, x):
         return self.backbone(x)
 
-model = CutenessModel().to(device)
-checkpoint = torch.load(MODEL_PATH, map_location=device, weights_only=True)
-model.load_state_dict(checkpoint['model_state_dict'])
-model.eval()
+    def score_and_embed(self, x):
+        features = torch.flatten(self.backbone.avgpool(self.backbone.features(x)), 1)
+        return self.backbone.classifier(features).squeeze(1), features
+
+model: CutenessModel | None = None
+profile = {'num_threads': None, 'interop_threads': None, 'channels_last': False, 'bf16': False, 'batch_size': 1}
+
+def load_profile(path=INFERENCE_PROFILE_PATH) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def configure(settings: dict) -> None:
+    profile.update((key, settings[key]) for key in profile if key in settings)
+    if profile['num_threads']:
+        torch.set_num_threads(profile['num_threads'])
+    if profile['interop_threads'] and torch.get_num_interop_threads() != profile['interop_threads']:
+        try:
+            torch.set_num_interop_threads(profile['interop_threads'])
+        except RuntimeError:
+            logger.warning("Interop threads already initialized, keeping %d", torch.get_num_interop_threads())
+    if profile['bf16'] and device.type == 'cpu' and not torch.ops.mkldnn._is_mkldnn_bf16_supported():
+        profile['bf16'] = False
+
+def prepare(net: CutenessModel) -> CutenessModel:
+    net = net.to(device).eval()
+    if profile['channels_last']:
+        net = net.to(memory_format=torch.channels_last)
+    return net
+
+def infer(net: CutenessModel, x: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    x = x.to(device)
+    if profile['channels_last']:
+        x = x.contiguous(memory_format=torch.channels_last)
+    with torch.inference_mode(), torch.autocast(device.type, dtype=torch.bfloat16, enabled=profile['bf16']):
+        raw, features = net.score_and_embed(x)
+    return raw.float(), features.float()
+
+def warmup(net: CutenessModel, rounds: int = 2) -> None:
+    for size in sorted({MODEL_INPUT_SIZE, EMBEDDING_SIZE}):
+        for batch_size in sorted({1, profile['batch_size']}):
+            x = torch.zeros(batch_size, 3, size, size)
+            for _ in range(rounds):
+                infer(net, x)
+
+def load_model(path=MODEL_PATH) -> CutenessModel:
+    net = CutenessModel(pretrained=False).to(device)
+    checkpoint = torch.load(path, map_location=device, weights_only=True)
+    net.load_state_dict(checkpoint['model_state_dict'])
+    net.eval()
+    return net
+
+def checkpoint_version(path=MODEL_PATH) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def embedding_version(path=MODEL_PATH) -> str:
+    version = checkpoint_version(path)
+    return version if EMBEDDING_SIZE == MODEL_INPUT_SIZE else f'{version}@{EMBEDDING_SIZE}'
+
+def get_model() -> CutenessModel:
+    global model
+    if model is None:
+        settings = load_profile()
+        if settings.get('cpu_count') not in (None, os.cpu_count()):
+            logger.warning("Inference profile was tuned on %s CPUs, this host has %s", settings['cpu_count'], os.cpu_count())
+        configure(settings)
+        net = prepare(load_model())
+        warmup(net)
+        model = net
+    return model
+
+def set_model(net: CutenessModel) -> None:
+    global model
+    model = prepare(net)
+
+def _to_tensor(image_bytes: bytes, size: int = MODEL_INPUT_SIZE) -> torch.Tensor:
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft('RGB', (size, size))
+    if size not in _preprocessors:
+        _preprocessors[size] = _make_preprocess(size)
+    return _preprocessors[size](image.convert('RGB'))
+
+def scores_and_embeddings(tensors: list[torch.Tensor]) -> tuple[list[float], np.ndarray]:
+    raw, features = infer(get_model(), torch.stack(tensors))
+    embeddings = F.normalize(features, dim=1).to(torch.float16).cpu().numpy()
+    return [r * 100.0 for r in raw.tolist()], embeddings
+
+def _score_images(images: list[bytes], size: int) -> tuple[list[float], np.ndarray]:
+    return scores_and_embeddings([_to_tensor(b, size) for b in images])
+
+async def get_scores_and_embeddings(images: list[bytes], size: int = MODEL_INPUT_SIZE) -> tuple[list[float], np.ndarray]:
+    return await asyncio.get_running_loop().run_in_executor(_executor, _score_images, images, size)
+
+async def get_cuteness_scores(images: list[bytes]) -> list[float]:
+    return (await get_scores_and_embeddings(images))[0]
+
+async def get_score_and_embedding(image_bytes: bytes, size: int = MODEL_INPUT_SIZE) -> tuple[float, np.ndarray]:
+    scores, embeddings = await get_scores_and_embeddings([image_bytes], size)
+    return scores[0], embeddings[0]
 
 async def get_cuteness_score(image_bytes: bytes) -> float:
-    img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-    x = preprocess(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        raw = model(x).item()
-    return raw * 100.0
+    return (await get_cuteness_scores([image_bytes]))[0]
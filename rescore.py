@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import logging
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import asyncpg
+import numpy as np
+import torch
+
+from config import BOT_TOKEN, DATABASE_URL, EMBEDDINGS_DIR, IMAGES_DIR, MODEL_PATH, STORAGE_CHAT_ID, TELEGRAM_API_URL
+from model import model
+
+logger = logging.getLogger('rescore')
+
+PAGE_SIZE = 1000
+
+def _decode(data: bytes) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    try:
+        full = model._to_tensor(data).numpy()
+        if model.EMBEDDING_SIZE == model.MODEL_INPUT_SIZE:
+            return full, full
+        return full, model._to_tensor(data, model.EMBEDDING_SIZE).numpy()
+    except Exception:
+        return None
+
+class Progress:
+    def __init__(self, total: int, done: int):
+        self.total = total
+        self.done = done
+        self.scored = 0
+        self.missing = 0
+        self.undecodable = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def rate(self) -> float:
+        return self.scored / max(time.perf_counter() - self.started, 1e-9)
+
+    def report(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not force and now - self._last_report < 5:
+            return
+        self._last_report = now
+        logger.info('%d/%d images, %d scored this run (%.1f img/s), %d missing, %d undecodable',
+                    self.done, self.total, self.scored, self.rate(), self.missing, self.undecodable)
+
+class StorageClient:
+    def __init__(self, concurrency: int):
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+        self.bot = Bot(token=BOT_TOKEN, session=session)
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def fetch(self, row) -> Optional[bytes]:
+        async with self._slots:
+            try:
+                file_id = row['file_id']
+                if not file_id:
+                    msg = await self.bot.forward_message(STORAGE_CHAT_ID, STORAGE_CHAT_ID, row['message_id'])
+                    await self.bot.delete_message(STORAGE_CHAT_ID, msg.message_id)
+                    if not msg.photo:
+                        return None
+                    file_id = msg.photo[-1].file_id
+                file_obj = await self.bot.get_file(file_id)
+                return (await self.bot.download_file(file_obj.file_path)).getvalue()
+            except Exception as e:
+                logger.warning('Storage fetch failed for image %s: %s', row['id'], e)
+                return None
+
+    async def close(self) -> None:
+        await self.bot.session.close()
+
+def _read_cached(filename: Optional[str]) -> Optional[bytes]:
+    if not filename:
+        return None
+    try:
+        return (IMAGES_DIR / filename).read_bytes()
+    except OSError:
+        return None
+
+async def _load(row, source: str, storage: Optional[StorageClient]) -> Optional[bytes]:
+    data = None
+    if source in ('cache', 'auto'):
+        data = await asyncio.to_thread(_read_cached, row['filename'])
+    if data is None and storage is not None:
+        data = await storage.fetch(row)
+    return data
+
+async def _produce(conn: asyncpg.Connection, start_id: int, source: str, storage: Optional[StorageClient],
+                   limit: Optional[int], out: asyncio.Queue, progress: Progress) -> None:
+    last_id, seen = start_id, 0
+    while limit is None or seen < limit:
+        page = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit - seen)
+        rows = await conn.fetch('''
+            SELECT id, filename, file_id, message_id FROM images WHERE id > $1 ORDER BY id LIMIT $2
+        ''', last_id, page)
+        if not rows:
+            break
+        for row, data in zip(rows, await asyncio.gather(*(_load(r, source, storage) for r in rows))):
+            if data is None:
+                progress.missing += 1
+                progress.done += 1
+            else:
+                await out.put((row['id'], data))
+        last_id, seen = rows[-1]['id'], seen + len(rows)
+    await out.put(None)
+
+async def _decode_batches(pool: ProcessPoolExecutor, batch_size: int, inp: asyncio.Queue, out: asyncio.Queue,
+                          progress: Progress) -> None:
+    loop = asyncio.get_running_loop()
+    finished = False
+    while not finished:
+        items = []
+        while len(items) < batch_size:
+            item = await inp.get()
+            if item is None:
+                finished = True
+                break
+            items.append(item)
+        if not items:
+            break
+        tensors = await asyncio.gather(*(loop.run_in_executor(pool, _decode, data) for _, data in items))
+        ids, batch, embed_batch = [], [], []
+        for (image_id, _), tensor in zip(items, tensors):
+            if tensor is None:
+                progress.undecodable += 1
+                progress.done += 1
+            else:
+                ids.append(image_id)
+                batch.append(tensor[0])
+                embed_batch.append(tensor[1])
+        if batch:
+            await out.put((ids, np.stack(batch), np.stack(embed_batch)))
+    await out.put(None)
+
+def _score(net: model.CutenessModel, batch: np.ndarray, embed_batch: np.ndarray) -> tuple[list[float], np.ndarray]:
+    raw, features = model.infer(net, torch.from_numpy(batch))
+    if model.EMBEDDING_SIZE != model.MODEL_INPUT_SIZE:
+        features = model.infer(net, torch.from_numpy(embed_batch))[1]
+    embeddings = torch.nn.functional.normalize(features, dim=1).to(torch.float16).cpu().numpy()
+    return [r * 100.0 for r in raw.tolist()], embeddings
+
+async def _score_and_stage(conn: asyncpg.Connection, net: model.CutenessModel, staging: str, inp: asyncio.Queue,
+                           progress: Progress) -> None:
+    while (item := await inp.get()) is not None:
+        ids, batch, embed_batch = item
+        scores, embeddings = await asyncio.to_thread(_score, net, batch, embed_batch)
+        await conn.copy_records_to_table(staging, columns=('id', 'raw_score', 'embedding'),
+                                         records=[(i, s, e.tobytes()) for i, s, e in zip(ids, scores, embeddings)])
+        progress.scored += len(ids)
+        progress.done += len(ids)
+        progress.report()
+
+async def apply(conn: asyncpg.Connection, staging: str) -> tuple[str, str]:
+    async with conn.transaction():
+        images = await conn.execute(f'''
+            UPDATE images i SET raw_score = s.raw_score
+            FROM {staging} s
+            WHERE i.id = s.id AND i.raw_score IS DISTINCT FROM s.raw_score
+        ''')
+        hashes = await conn.execute(f'''
+            UPDATE image_hashes h SET embedding = e.embedding
+            FROM (
+                SELECT DISTINCT ON (i.image_hash) i.image_hash, s.embedding
+                FROM {staging} s JOIN images i ON i.id = s.id
+                ORDER BY i.image_hash, i.id
+            ) e
+            WHERE h.image_hash = e.image_hash
+        ''')
+        await conn.execute(f'DROP TABLE {staging}')
+    return images, hashes
+
+RUN_NAME = re.compile(r'[a-z0-9_]{1,55}')
+
+def run_name(value: str) -> str:
+    if not RUN_NAME.fullmatch(value):
+        raise argparse.ArgumentTypeError(f'must match {RUN_NAME.pattern}')
+    return value
+
+async def run(args) -> None:
+    pool = ProcessPoolExecutor(max_workers=args.workers)
+    try:
+        settings = model.load_profile()
+        model.configure(settings)
+        batch_size = args.batch_size or settings.get('batch_size', 64)
+        if args.random_weights:
+            torch.manual_seed(0)
+            net, version = model.prepare(model.CutenessModel(pretrained=False)), 'random'
+        else:
+            net, version = model.prepare(model.load_model(args.checkpoint)), model.checkpoint_version(args.checkpoint)
+        staging = f'rescore_{run_name(args.run) if args.run else version}'
+        conn = await asyncpg.connect(DATABASE_URL)
+        storage = StorageClient(args.storage_concurrency) if args.source in ('storage', 'auto') else None
+        try:
+            await conn.execute(f'''
+                CREATE UNLOGGED TABLE IF NOT EXISTS {staging} (
+                    id INTEGER PRIMARY KEY,
+                    raw_score REAL NOT NULL,
+                    embedding BYTEA
+                )
+            ''')
+            start_id = await conn.fetchval(f'SELECT COALESCE(MAX(id), 0) FROM {staging}')
+            total = await conn.fetchval('SELECT COUNT(*) FROM images')
+            done = await conn.fetchval('SELECT COUNT(*) FROM images WHERE id <= $1', start_id)
+            if start_id:
+                logger.info('Resuming %s after image %d', staging, start_id)
+            progress = Progress(total, done)
+            fetched, decoded = asyncio.Queue(maxsize=batch_size * 4), asyncio.Queue(maxsize=4)
+            reader = await asyncpg.connect(DATABASE_URL)
+            try:
+                await asyncio.gather(
+                    _produce(reader, start_id, args.source, storage, args.limit, fetched, progress),
+                    _decode_batches(pool, batch_size, fetched, decoded, progress),
+                    _score_and_stage(conn, net, staging, decoded, progress),
+                )
+            finally:
+                await reader.close()
+            progress.report(force=True)
+            if args.no_apply:
+                logger.info('Scores staged in %s; rerun without --no-apply to write them to images', staging)
+                return
+            images, hashes = await apply(conn, staging)
+            (EMBEDDINGS_DIR / 'meta.json').unlink(missing_ok=True)
+            logger.info('Applied %s: images %s, image_hashes %s. Restart the bot to rebuild the embedding index.',
+                        staging, images, hashes)
+        finally:
+            if storage is not None:
+                await storage.close()
+            await conn.close()
+    finally:
+        pool.shutdown()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-score every stored image with a new model checkpoint')
+    parser.add_argument('--checkpoint', default=MODEL_PATH, help='model checkpoint to score with')
+    parser.add_argument('--random-weights', action='store_true', help='score with an untrained model (dry runs)')
+    parser.add_argument('--source', choices=('cache', 'storage', 'auto'), default='auto',
+                        help='read images from IMAGES_DIR, from the storage chat, or the cache with storage fallback')
+    parser.add_argument('--batch-size', type=int, help='images per inference batch (default: from the inference profile, else 64)')
+    parser.add_argument('--workers', type=int, default=None, help='decode processes (default: CPU count)')
+    parser.add_argument('--storage-concurrency', type=int, default=8)
+    parser.add_argument('--limit', type=int, help='stop after this many images (the run can be resumed)')
+    parser.add_argument('--run', type=run_name, help='staging table suffix; defaults to the checkpoint hash so reruns resume')
+    parser.add_argument('--no-apply', action='store_true', help='only stage scores, do not update images')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    asyncio.run(run(args))
@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('ADMIN_ID', '1')
+os.environ.setdefault('STORAGE_CHAT_ID', '2')
+os.environ.setdefault('ADMIN_PANEL_PASSWORD', 'test')
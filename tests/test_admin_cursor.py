@@ -0,0 +1,23 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from admin_panel import _decode_cursor, _encode_cursor
+
+def test_cursor_roundtrip():
+    created_at = datetime(2024, 5, 1, 12, 30)
+    assert _decode_cursor(_encode_cursor(created_at, 42), datetime.fromisoformat, int) == [created_at, 42]
+    assert _decode_cursor(None, int) is None
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    _encode_cursor(1),
+    _encode_cursor('yesterday', 42),
+    _encode_cursor('2024-05-01T12:30:00', 'x'),
+    _encode_cursor(None, 42),
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        _decode_cursor(cursor, datetime.fromisoformat, int)
+    assert exc.value.status_code == 400
@@ -0,0 +1,54 @@
+import base64
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+
+import admin_panel
+from config import ADMIN_USERNAME, ADMIN_PASSWORD
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append((query, args))
+        return []
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+@pytest.fixture
+def client(monkeypatch):
+    pool = FakePool()
+
+    async def get_db_pool():
+        return pool
+
+    monkeypatch.setattr(admin_panel, 'get_db_pool', get_db_pool)
+    token = base64.b64encode(f'{ADMIN_USERNAME}:{ADMIN_PASSWORD}'.encode()).decode()
+    client = TestClient(admin_panel.app, headers={'Authorization': f'Basic {token}'})
+    client.pool = pool
+    return client
+
+@pytest.mark.parametrize('path', ['/api/images', '/api/images/ids'])
+def test_empty_filters_are_ignored(client, path):
+    response = client.get(f'{path}?approved=&nsfw=&min_score=&max_score=&user_id=')
+    assert response.status_code == 200
+    query, args = client.pool.conn.queries[-1]
+    assert 'WHERE' not in query
+
+def test_filters_are_applied(client):
+    response = client.get('/api/images?approved=1&nsfw=&min_score=50')
+    assert response.status_code == 200
+    query, args = client.pool.conn.queries[-1]
+    assert 'approved = $1' in query
+    assert args[:2] == (1, 50.0)
+
+def test_invalid_filter_is_rejected(client):
+    assert client.get('/api/images?approved=yes').status_code == 422
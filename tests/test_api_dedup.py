@@ -0,0 +1,44 @@
+import numpy as np
+
+from api import _SeenImages
+from config import DUPLICATE_SIMILARITY
+from utils.vector_index import normalize
+
+def reference(hashes, results):
+    seen_hashes, vectors, indexes, out = {}, [], [], []
+    for index, (image_hash, result) in enumerate(zip(hashes, results)):
+        if result is None:
+            out.append(None)
+            continue
+        duplicate_of = seen_hashes.get(image_hash)
+        if duplicate_of is None and vectors:
+            sims = np.stack(vectors).astype(np.float32) @ result[1].astype(np.float32)
+            best = int(np.argmax(sims))
+            if sims[best] >= DUPLICATE_SIMILARITY:
+                duplicate_of = indexes[best]
+        out.append(duplicate_of)
+        seen_hashes.setdefault(image_hash, index)
+        vectors.append(result[1])
+        indexes.append(index)
+    return out
+
+def test_matches_pairwise_reference_across_batches():
+    rng = np.random.default_rng(0)
+    base = normalize(rng.standard_normal((40, 32)))
+    results, hashes = [], []
+    for i in range(700):
+        if i % 17 == 0:
+            results.append(None)
+        else:
+            source = rng.integers(40) if i % 3 == 0 else None
+            vector = base[source] if source is not None else normalize(rng.standard_normal(32))
+            results.append((0.5, vector))
+        hashes.append(f'h{i % 250}' if i % 5 == 0 else f'u{i}')
+    seen = _SeenImages()
+    got = []
+    for start in range(0, len(results), 64):
+        got.extend(seen.match(start, hashes[start:start + 64], results[start:start + 64]))
+    expected = reference(hashes, results)
+    assert got == expected
+    assert any(match is not None for match in got)
+    assert seen.count == sum(1 for r in results if r is not None)
@@ -0,0 +1,31 @@
+import random
+
+from model.cascade import Cascade
+
+def calibrated_cascade() -> Cascade:
+    cascade = Cascade(window=100, min_samples=10, audit_rate=0.5, max_error=5.0)
+    for i in range(20):
+        cascade.observe(50.0, 51.0 + (i % 2) * 0.1, 'uncalibrated')
+    return cascade
+
+def test_escalated_top_items_do_not_shift_calibration():
+    cascade = calibrated_cascade()
+    bias, bound = cascade.stats()['bias'], cascade.bound
+    for _ in range(50):
+        cascade.observe(80.0, 95.0, 'top')
+    assert cascade.stats()['bias'] == bias
+    assert cascade.bound == bound
+    assert cascade.stats()['samples'] == 20
+
+def test_audit_samples_calibrate():
+    cascade = calibrated_cascade()
+    for _ in range(50):
+        cascade.observe(50.0, 53.0, 'audit')
+    assert cascade.stats()['bias'] > 2.0
+
+def test_audits_are_drawn_from_items_above_the_cut():
+    random.seed(0)
+    cascade = calibrated_cascade()
+    reasons = [cascade.decide(90.0, 60.0) for _ in range(200)]
+    assert set(reasons) == {'audit', 'top'}
+    assert 50 < reasons.count('audit') < 150
@@ -0,0 +1,31 @@
+import hashlib
+
+import pytest
+
+from utils import image_cache
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, 'IMAGES_DIR', tmp_path)
+    monkeypatch.setattr(image_cache, 'IMAGE_CACHE_MAX_BYTES', 10)
+    image_cache.rebuild()
+    yield tmp_path
+    image_cache._index.clear()
+    image_cache._pinned.clear()
+
+def test_store_is_content_addressed(cache_dir):
+    filename = image_cache.store(b'abc')
+    assert filename == image_cache.filename_for(hashlib.sha256(b'abc').hexdigest())
+    assert (cache_dir / filename).read_bytes() == b'abc'
+    assert image_cache.store(b'abc') == filename
+    assert image_cache.total_bytes() == 3
+
+def test_eviction_skips_pinned(cache_dir):
+    pinned = image_cache.store(b'x' * 6)
+    image_cache.pin([pinned])
+    other = image_cache.store(b'y' * 3)
+    image_cache.store(b'z' * 3)
+    assert image_cache.path(pinned) is not None
+    assert image_cache.path(other) is None
+    image_cache.rebuild()
+    assert image_cache.path(pinned) is not None
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from utils import moderation
+
+@pytest.fixture(autouse=True)
+def digest(monkeypatch):
+    sent = []
+    failures = []
+
+    async def refresh():
+        return list(moderation._pending.values())
+
+    async def send(bot, items):
+        if failures:
+            failures.pop()
+            raise RuntimeError('telegram down')
+        sent.append([item.image_id for item in items])
+
+    monkeypatch.setattr(moderation, '_refresh', refresh)
+    monkeypatch.setattr(moderation, '_send', send)
+    monkeypatch.setattr(moderation, 'MODERATION_DIGEST_INTERVAL', 0)
+    moderation._pending.clear()
+    moderation.stats.clear()
+    yield sent, failures
+    moderation._pending.clear()
+
+def drain(rounds: int) -> None:
+    async def scenario():
+        moderation._wakeup = asyncio.Event()
+        moderation._wakeup.set()
+        task = asyncio.create_task(moderation._loop(None))
+        for _ in range(rounds * 3):
+            await asyncio.sleep(0)
+        task.cancel()
+
+    asyncio.run(scenario())
+
+def test_failed_send_keeps_items_queued(digest):
+    sent, failures = digest
+    failures.append(1)
+    moderation.submit(1, 'photo', 10, 'user', 5.0, 1)
+    moderation.submit(2, 'photo', 11, None, 4.0, 2)
+    drain(3)
+    assert sent == [[1, 2]]
+    assert moderation.pending() == 0
+    assert moderation.stats['failed'] == 1
+
+def test_items_dropped_after_repeated_failures(digest):
+    sent, failures = digest
+    failures.extend([1] * moderation.MODERATION_DIGEST_ATTEMPTS)
+    moderation.submit(1, 'photo', 10, 'user', 5.0, 1)
+    drain(moderation.MODERATION_DIGEST_ATTEMPTS + 2)
+    assert sent == []
+    assert moderation.pending() == 0
+    assert moderation.stats['dropped'] == 1
@@ -0,0 +1,75 @@
+import asyncio
+
+import fakeredis
+
+from utils.rate_limiter import TokenBucket, UserRateLimiter
+from utils.state_store import MemoryStateStore, RedisStateStore
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_token_bucket_refills():
+    clock = Clock()
+    bucket = TokenBucket(1, 2, clock=clock)
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0
+    assert bucket.consume() == 1
+    clock.now += 1
+    assert bucket.consume() == 0
+
+def test_user_limiter_allows_burst_then_throttles():
+    clock = Clock()
+    limiter = UserRateLimiter(MemoryStateStore(clock=clock), 0.5, 2, clock=clock)
+
+    async def scenario():
+        assert await limiter.consume(1) == 0
+        assert await limiter.consume(1) == 0
+        assert await limiter.consume(1) == 2
+        assert await limiter.consume(2) == 0
+        clock.now += 2
+        assert await limiter.consume(1) == 0
+        assert await limiter.consume(1) == 2
+
+    asyncio.run(scenario())
+
+def test_user_limiter_is_atomic_across_instances():
+    server = fakeredis.FakeServer()
+    limiters = [UserRateLimiter(RedisStateStore(fakeredis.FakeAsyncRedis(server=server, decode_responses=True)), 0.01, 1)
+                for _ in range(5)]
+
+    async def scenario():
+        waits = await asyncio.gather(*(limiter.consume(1) for limiter in limiters for _ in range(4)))
+        assert sum(1 for wait in waits if wait == 0) == 1
+
+    asyncio.run(scenario())
+
+def test_token_bucket_refund_is_capped():
+    clock = Clock()
+    bucket = TokenBucket(1, 2, clock=clock)
+    bucket.refund()
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0
+    assert bucket.consume() == 1
+    bucket.refund()
+    assert bucket.consume() == 0
+
+def test_user_limiter_refund_returns_the_token():
+    clock = Clock()
+    limiter = UserRateLimiter(MemoryStateStore(clock=clock), 0.5, 1, clock=clock)
+
+    async def scenario():
+        await limiter.refund(1)
+        assert await limiter.consume(1) == 0
+        assert await limiter.consume(1) == 2
+        await limiter.refund(1)
+        assert await limiter.consume(1) == 0
+        await limiter.refund(1)
+        await limiter.refund(1)
+        assert await limiter.consume(1) == 0
+        assert await limiter.consume(1) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+from utils.state_store import MemoryStateStore, RedisStateStore, StateStore, cleanup_loop
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+class RealClock:
+    def __call__(self) -> float:
+        return time.monotonic()
+
+    def advance(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+@pytest.fixture(params=['memory', 'redis'])
+def backend(request):
+    if request.param == 'memory':
+        clock = Clock()
+        return MemoryStateStore(capacity=100, clock=clock), clock
+    return RedisStateStore(fakeredis.FakeAsyncRedis(decode_responses=True)), RealClock()
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        StateStore()
+
+def test_get_set_delete(backend):
+    store, _ = backend
+
+    async def scenario():
+        assert await store.get('a') is None
+        await store.set('a', '1', 10)
+        assert await store.get('a') == '1'
+        await store.set('a', '2', 10)
+        assert await store.get('a') == '2'
+        await store.delete('a')
+        assert await store.get('a') is None
+        await store.delete('missing')
+
+    run(scenario())
+
+def test_ttl_expiry(backend):
+    store, clock = backend
+
+    async def scenario():
+        await store.set('a', '1', 0.2)
+        assert 0 < await store.ttl('a') <= 0.2 + 1e-9
+        clock.advance(0.3)
+        assert await store.get('a') is None
+        assert await store.ttl('a') == 0.0
+
+    run(scenario())
+
+def test_set_nx(backend):
+    store, clock = backend
+
+    async def scenario():
+        assert await store.set_nx('a', '1', 0.2)
+        assert not await store.set_nx('a', '2', 0.2)
+        assert await store.get('a') == '1'
+        clock.advance(0.3)
+        assert await store.set_nx('a', '3', 0.2)
+        assert await store.get('a') == '3'
+
+    run(scenario())
+
+def test_update(backend):
+    store, _ = backend
+
+    def increment(value):
+        count = int(value or 0) + 1
+        return str(count), 10, count
+
+    async def scenario():
+        assert await store.update('n', increment) == 1
+        assert await store.update('n', increment) == 2
+        assert await store.update('n', lambda value: (None, 0, value)) == '2'
+        assert await store.get('n') == '2'
+
+    run(scenario())
+
+def test_cleanup(backend):
+    store, clock = backend
+
+    async def scenario():
+        await store.set('short', '1', 0.1)
+        await store.set('long', '1', 60)
+        clock.advance(0.2)
+        await store.cleanup()
+        assert await store.get('short') is None
+        assert await store.get('long') == '1'
+
+    run(scenario())
+
+def test_memory_cleanup_removes_expired_entries_behind_live_ones():
+    clock = Clock()
+    store = MemoryStateStore(capacity=100, clock=clock)
+
+    async def scenario():
+        await store.set('long', '1', 60)
+        for i in range(5):
+            await store.set(f'short{i}', '1', 1)
+        clock.advance(2)
+        assert len(store) == 6
+        assert await store.cleanup() == 5
+        assert len(store) == 1
+
+    run(scenario())
+
+def test_cleanup_loop_sweeps_periodically():
+    store = MemoryStateStore(capacity=100)
+
+    async def scenario():
+        for i in range(5):
+            await store.set(f'short{i}', '1', 0.01)
+        task = asyncio.create_task(cleanup_loop(store, 0.05))
+        await asyncio.sleep(0.15)
+        task.cancel()
+        assert len(store) == 0
+
+    run(scenario())
+
+def test_memory_capacity_evicts_oldest():
+    clock = Clock()
+    store = MemoryStateStore(capacity=3, clock=clock)
+
+    async def scenario():
+        for i in range(5):
+            await store.set(str(i), str(i), 60)
+        assert len(store) == 3
+        assert await store.get('0') is None
+        assert await store.get('4') == '4'
+
+    run(scenario())
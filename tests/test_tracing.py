@@ -0,0 +1,39 @@
+import asyncio
+
+from utils import tracing
+
+def test_snapshot_roundtrip(tmp_path):
+    tracing.record('stage', 0.01)
+    tracing.record('stage', 0.02)
+    path = tmp_path / 'metrics.json'
+    tracing.write_snapshot(path, {'queue_depth': 3})
+    data = tracing.read_snapshot(path)
+    assert data['gauges'] == {'queue_depth': 3}
+    assert data['histograms']['stage'].count >= 2
+
+def test_snapshot_is_detached_from_live_histograms():
+    tracing.record('detached', 0.01)
+    data = tracing.snapshot({})
+    tracing.record('detached', 5.0)
+    tracing.record('other', 0.01)
+    hist = data['histograms']['detached']
+    assert hist['count'] == 1
+    assert sum(hist['counts'].values()) == 1
+
+def test_export_loop_survives_failures(tmp_path):
+    calls = []
+
+    def gauges():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError('boom')
+        return {'ok': 1}
+
+    async def scenario():
+        task = asyncio.create_task(tracing.export_loop(tmp_path / 'metrics.json', 0.01, gauges))
+        while len(calls) < 3:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert tracing.read_snapshot(tmp_path / 'metrics.json')['gauges'] == {'ok': 1}
@@ -0,0 +1,74 @@
+import json
+import threading
+
+import numpy as np
+
+from utils.vector_index import VectorIndex, normalize
+
+DIM = 16
+
+def make_index(tmp_path, **kwargs) -> VectorIndex:
+    index = VectorIndex(tmp_path, DIM, **kwargs)
+    index.reset()
+    return index
+
+def vectors(n: int, seed: int = 0) -> np.ndarray:
+    return normalize(np.random.default_rng(seed).standard_normal((n, DIM)))
+
+def test_search_finds_added_vector(tmp_path):
+    index = make_index(tmp_path)
+    data = vectors(100)
+    index.add_many(range(1, 101), [7] * 100, data)
+    match = index.search(data[42])[0]
+    assert match.row_id == 43
+    assert match.user_id == 7
+
+def test_meta_is_written_in_batches(tmp_path):
+    index = make_index(tmp_path, meta_interval=10)
+    data = vectors(25)
+    for i in range(25):
+        index.add(i + 1, 1, data[i])
+    assert json.loads((tmp_path / 'meta.json').read_text())['count'] == 20
+    index.flush()
+    reopened = VectorIndex(tmp_path, DIM)
+    reopened.open()
+    assert reopened.count == 25
+    assert reopened.last_row_id == 25
+
+def test_search_during_concurrent_adds(tmp_path):
+    index = make_index(tmp_path)
+    data = vectors(3000, seed=1)
+    errors = []
+
+    def searcher():
+        try:
+            for i in range(200):
+                matches = index.search(data[i % 50])
+                assert not matches or matches[0].row_id <= index.count
+        except Exception as e:
+            errors.append(e)
+
+    index.add_many(range(1, 51), [1] * 50, data[:50])
+    thread = threading.Thread(target=searcher)
+    thread.start()
+    for i in range(50, 3000):
+        index.add(i + 1, 1, data[i])
+    thread.join()
+    assert not errors
+    assert index.count == 3000
+
+def test_ivf_rebuild_threshold(tmp_path):
+    index = make_index(tmp_path, mode='ivfpq', ivf_min_rows=300, pq_subspaces=4, retrain_ratio=0.5)
+    data = vectors(600, seed=2)
+    index.add_many(range(1, 201), [1] * 200, data[:200])
+    assert not index.needs_rebuild
+    index.add_many(range(201, 301), [1] * 100, data[200:300])
+    assert index.needs_rebuild
+    index.build_ivf()
+    assert index.trained_count == 300
+    assert not index.needs_rebuild
+    index.add_many(range(301, 450), [1] * 149, data[300:449])
+    assert not index.needs_rebuild
+    index.add(450, 1, data[449])
+    assert index.needs_rebuild
+    assert index.search(data[420])[0].row_id == 421
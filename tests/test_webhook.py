@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from utils.webhook import SECRET_HEADER, WebhookServer
+
+def test_empty_secret_is_rejected():
+    with pytest.raises(ValueError):
+        WebhookServer(None, None, '', 1)
+
+def test_requests_without_matching_secret_are_refused():
+    server = WebhookServer(None, None, 's3cret', 1)
+    server.accepting = False
+
+    async def scenario():
+        async with TestClient(TestServer(server.make_app('/webhook'))) as client:
+            assert (await client.post('/webhook', json={})).status == 401
+            assert (await client.post('/webhook', json={}, headers={SECRET_HEADER: 'wrong'})).status == 401
+            assert (await client.post('/webhook', json={}, headers={SECRET_HEADER: 's3cret'})).status == 503
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+from array import array
+from bisect import bisect_left
+
+from database import db
+
+BAN_CHANNEL = 'user_bans'
+
+_banned = array('q')
+
+def _find(user_id: int) -> tuple[int, bool]:
+    i = bisect_left(_banned, user_id)
+    return i, i < len(_banned) and _banned[i] == user_id
+
+def is_banned(user_id: int) -> bool:
+    return _find(user_id)[1]
+
+def ban(user_id: int) -> None:
+    i, found = _find(user_id)
+    if not found:
+        _banned.insert(i, user_id)
+
+def unban(user_id: int) -> None:
+    i, found = _find(user_id)
+    if found:
+        del _banned[i]
+
+def count() -> int:
+    return len(_banned)
+
+async def load() -> None:
+    rows = await db.fetch('SELECT user_id FROM user_stats WHERE banned=1 ORDER BY user_id')
+    _banned[:] = array('q', (int(r['user_id']) for r in rows))
+
+def _on_notify(conn, pid, channel, payload: str) -> None:
+    banned, _, user_id = payload.partition(':')
+    if banned == '1':
+        ban(int(user_id))
+    else:
+        unban(int(user_id))
+
+async def start() -> None:
+    await db.listen(BAN_CHANNEL, _on_notify, load)
+
+async def stop() -> None:
+    await db.unlisten(BAN_CHANNEL, _on_notify)
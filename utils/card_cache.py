@@ -0,0 +1,59 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from config import CARD_CACHE_MAX_BYTES
+
+@dataclass
+class CachedCard:
+    data: bytes
+    file_id: Optional[str] = None
+
+_cards: OrderedDict[str, CachedCard] = OrderedDict()
+_total_bytes = 0
+_top_version: Optional[str] = None
+
+def top_version(tops: list[str | None]) -> str:
+    global _top_version
+    version = hashlib.sha256('|'.join(t or '' for t in tops).encode()).hexdigest()[:16]
+    if version != _top_version:
+        _top_version = version
+        clear()
+    return version
+
+def card_key(score: int, place: int, nickname: str | None, userpic: str | None, version: str) -> str:
+    avatar_digest = hashlib.sha256(userpic.encode()).hexdigest() if userpic else ''
+    return hashlib.sha256(f'{score}|{place}|{nickname or ""}|{avatar_digest}|{version}'.encode()).hexdigest()
+
+def get(key: str) -> Optional[CachedCard]:
+    card = _cards.get(key)
+    if card is not None:
+        _cards.move_to_end(key)
+    return card
+
+def put(key: str, data: bytes) -> CachedCard:
+    global _total_bytes
+    old = _cards.pop(key, None)
+    if old is not None:
+        _total_bytes -= len(old.data)
+    card = CachedCard(data)
+    _cards[key] = card
+    _total_bytes += len(data)
+    while _total_bytes > CARD_CACHE_MAX_BYTES and len(_cards) > 1:
+        _, evicted = _cards.popitem(last=False)
+        _total_bytes -= len(evicted.data)
+    return card
+
+def set_file_id(key: str, file_id: str) -> None:
+    card = _cards.get(key)
+    if card is not None:
+        card.file_id = file_id
+
+def clear() -> None:
+    global _total_bytes
+    _cards.clear()
+    _total_bytes = 0
+
+def stats() -> dict:
+    return {'entries': len(_cards), 'bytes': _total_bytes}
@@ -1,77 +1,110 @@
+import asyncio
 import hashlib
 import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple
-from PIL import Image
 import numpy as np
+import asyncpg
+from aiogram import Bot
+from aiogram.types import PhotoSize
 from nudenet import NudeDetector
 from database import db
-from config import RAW_MIN, RAW_MAX
+from utils import ban_cache
+from utils.vector_index import VectorIndex
+from config import (RAW_MIN, RAW_MAX, EMBEDDING_DIM, EMBEDDINGS_DIR, VECTOR_INDEX_MODE, IVF_MIN_ROWS, IVF_NPROBE,
+                    IVF_RETRAIN_RATIO, DUPLICATE_SIMILARITY, MODEL_INPUT_SIZE, HEAVY_WORKERS)
 
 import os
 import tempfile
 
+logger = logging.getLogger(__name__)
 detector = NudeDetector()
+_nsfw_executor = ThreadPoolExecutor(max_workers=HEAVY_WORKERS, thread_name_prefix='nsfw')
+embedding_index = VectorIndex(EMBEDDINGS_DIR, EMBEDDING_DIM, mode=VECTOR_INDEX_MODE, nprobe=IVF_NPROBE, ivf_min_rows=IVF_MIN_ROWS,
+                              retrain_ratio=IVF_RETRAIN_RATIO)
+_rebuild_task: Optional[asyncio.Task] = None
 
 def calculate_image_hash(image_bytes: bytes) -> str:
     return hashlib.sha256(image_bytes).hexdigest()
 
-def calculate_perceptual_hash(image_bytes: bytes) -> str:
-    try:
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        img = img.resize((8, 8), Image.Resampling.LANCZOS)
-        pixels = np.array(img)
-        avg = pixels.mean()
-        bits = ''.join('1' if pixel.mean() > avg else '0' for row in pixels for pixel in row)
-        return bits
-    except Exception:
-        return ""
+def pick_photo_size(sizes: list[PhotoSize], min_side: int = MODEL_INPUT_SIZE) -> PhotoSize:
+    sizes = sorted(sizes, key=lambda s: s.width * s.height)
+    return next((s for s in sizes if min(s.width, s.height) >= min_side), sizes[-1])
+
+async def download(bot: Bot, file_id: str) -> memoryview:
+    file_obj = await bot.get_file(file_id)
+    buf = io.BytesIO()
+    await bot.download_file(file_obj.file_path, destination=buf)
+    return buf.getbuffer()
 
-def hamming_distance(hash1: str, hash2: str) -> int:
-    if not hash1 or not hash2 or len(hash1) != len(hash2):
-        return 9999
-    return sum(c1 != c2 for c1, c2 in zip(hash1, hash2))
+async def load_embedding_index(version: str = '') -> None:
+    await asyncio.to_thread(embedding_index.open, version)
+    if await db.fetchval('SELECT COALESCE(MAX(id), 0) FROM image_hashes') < embedding_index.last_row_id:
+        await asyncio.to_thread(embedding_index.reset)
+    while True:
+        rows = await db.fetch('''
+            SELECT id, user_id, embedding FROM image_hashes
+            WHERE id > $1 AND embedding IS NOT NULL ORDER BY id LIMIT 10000
+        ''', embedding_index.last_row_id)
+        if not rows:
+            break
+        vectors = np.frombuffer(b''.join(r['embedding'] for r in rows), dtype=np.float16).reshape(len(rows), EMBEDDING_DIM)
+        embedding_index.add_many([r['id'] for r in rows], [r['user_id'] for r in rows], vectors)
+    await asyncio.to_thread(embedding_index.flush)
+    await asyncio.to_thread(embedding_index.build_ivf)
 
-async def check_duplicate_image(user_id: int, image_bytes: bytes, similarity_threshold: int = 5) -> Tuple[bool, Optional[int]]:
-    img_hash = calculate_image_hash(image_bytes)
-    perceptual_hash = calculate_perceptual_hash(image_bytes)
+async def _rebuild_embedding_index() -> None:
+    try:
+        await asyncio.to_thread(embedding_index.build_ivf)
+    except Exception:
+        logger.exception("Embedding index rebuild failed")
 
-    row = await db.fetchrow('SELECT user_id FROM image_hashes WHERE image_hash=$1', img_hash)
-    if row:
-        return True, row['user_id']
+async def close_embedding_index() -> None:
+    if _rebuild_task is not None:
+        await _rebuild_task
+    await asyncio.to_thread(embedding_index.flush)
 
-    if perceptual_hash:
-        all_hashes = await db.fetch('SELECT user_id, perceptual_hash FROM image_hashes')
-        for r in all_hashes:
-            stored_hash = r['perceptual_hash']
-            if stored_hash and hamming_distance(perceptual_hash, stored_hash) <= similarity_threshold:
-                return True, r['user_id']
+async def find_exact_duplicate(image_hash: str) -> Optional[int]:
+    row = await db.fetchrow('SELECT user_id FROM image_hashes WHERE image_hash=$1', image_hash)
+    return row['user_id'] if row else None
 
-    await db.execute(
-        'INSERT INTO image_hashes (user_id, image_hash, perceptual_hash) VALUES ($1, $2, $3)',
-        user_id, img_hash, perceptual_hash
-    )
+async def find_photo_duplicate(file_unique_id: str) -> Optional[Tuple[int, str]]:
+    row = await db.fetchrow('SELECT user_id, image_hash FROM image_hashes WHERE file_unique_id=$1 LIMIT 1', file_unique_id)
+    return (row['user_id'], row['image_hash']) if row else None
 
-    return False, None
+async def check_near_duplicate(user_id: int, image_hash: str, embedding: np.ndarray,
+                               file_unique_id: Optional[str] = None) -> Tuple[bool, Optional[int], Optional[str]]:
+    global _rebuild_task
+    matches = await asyncio.to_thread(embedding_index.search, embedding)
+    if matches and matches[0].similarity >= DUPLICATE_SIMILARITY:
+        row = await db.fetchrow('SELECT user_id, image_hash FROM image_hashes WHERE id=$1', matches[0].row_id)
+        if row:
+            return True, row['user_id'], row['image_hash']
+    row_id = await db.fetchval('''
+        INSERT INTO image_hashes (user_id, image_hash, embedding, file_unique_id) VALUES ($1, $2, $3, $4) RETURNING id
+    ''', user_id, image_hash, embedding.astype(np.float16).tobytes(), file_unique_id)
+    embedding_index.add(row_id, user_id, embedding)
+    if embedding_index.needs_rebuild and (_rebuild_task is None or _rebuild_task.done()):
+        _rebuild_task = asyncio.create_task(_rebuild_embedding_index())
+    return False, None, None
 
-async def get_user_warnings(user_id: int) -> Tuple[int, bool]:
-    row = await db.fetchrow('SELECT warnings, banned FROM user_warnings WHERE user_id=$1', user_id)
-    if row:
-        return int(row['warnings']), bool(row['banned'])
-    return 0, False
+async def get_user_stats(user_id: int) -> Optional[asyncpg.Record]:
+    return await db.fetchrow('SELECT user_id, username, userpic, warnings, banned FROM user_stats WHERE user_id=$1', user_id)
 
 async def add_warning(user_id: int) -> Tuple[int, bool]:
-    row = await db.fetchrow('SELECT warnings FROM user_warnings WHERE user_id=$1', user_id)
-    if row:
-        new_warnings = int(row['warnings']) + 1
-        banned = 1 if new_warnings >= 2 else 0
-        await db.execute('UPDATE user_warnings SET warnings=$1, banned=$2 WHERE user_id=$3', new_warnings, banned, user_id)
-    else:
-        new_warnings = 1
-        banned = 0
-        await db.execute('INSERT INTO user_warnings (user_id, warnings, banned) VALUES ($1, $2, $3)', user_id, new_warnings, banned)
-    return new_warnings, bool(banned)
+    row = await db.fetchrow('''
+        INSERT INTO user_stats (user_id, warnings, banned) VALUES ($1, 1, 0)
+        ON CONFLICT (user_id) DO UPDATE SET
+            warnings=user_stats.warnings + 1,
+            banned=GREATEST(user_stats.banned, CASE WHEN user_stats.warnings + 1 >= 2 THEN 1 ELSE 0 END)
+        RETURNING warnings, banned
+    ''', user_id)
+    if row['banned']:
+        ban_cache.ban(user_id)
+    return int(row['warnings']), bool(row['banned'])
 
-async def is_nsfw(image_bytes: bytes) -> bool:
+def _detect_nsfw(image_bytes: bytes) -> bool:
     temp_file = None
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as f:
@@ -82,17 +115,20 @@ async def is_nsfw(image_bytes: bytes) -> bool:
         for r in results:
             if 'EXPOSED' in r.get('class', ''):
                 return True
-    except Exception as e:
-        print(f"NSFW detection error: {e}")
+    except Exception:
+        logger.exception("NSFW detection failed")
         return False
     finally:
         if temp_file and os.path.exists(temp_file):
             try:
                 os.unlink(temp_file)
-            except:
+            except OSError:
                 pass
     return False
 
+async def is_nsfw(image_bytes: bytes) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_nsfw_executor, _detect_nsfw, image_bytes)
+
 def map_score(raw: float) -> int:
     raw = max(RAW_MIN, min(raw, RAW_MAX))
     pct = (raw - RAW_MIN) / (RAW_MAX - RAW_MIN) * 100
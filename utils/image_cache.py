@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+
+from config import IMAGES_DIR, IMAGE_CACHE_MAX_BYTES
+
+CACHE_SUBDIR = 'cache'
+
+_index: OrderedDict[str, int] = OrderedDict()
+_pinned: set[str] = set()
+_total_bytes = 0
+
+def filename_for(digest: str) -> str:
+    return f'{CACHE_SUBDIR}/{digest[:2]}/{digest}.jpg'
+
+def path(filename: str | None) -> Optional[Path]:
+    if not filename or filename not in _index:
+        return None
+    _index.move_to_end(filename)
+    return IMAGES_DIR / filename
+
+def write(filename: str, data: bytes) -> Path:
+    global _total_bytes
+    target = IMAGES_DIR / filename
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    _total_bytes += len(data) - _index.pop(filename, 0)
+    _index[filename] = len(data)
+    _evict()
+    return target
+
+def store(data: bytes) -> str:
+    filename = filename_for(hashlib.sha256(data).hexdigest())
+    if filename not in _index:
+        write(filename, data)
+    return filename
+
+def remove(filename: str | None) -> None:
+    global _total_bytes
+    if not filename:
+        return
+    _total_bytes -= _index.pop(filename, 0)
+    _pinned.discard(filename)
+    try:
+        (IMAGES_DIR / filename).unlink()
+    except FileNotFoundError:
+        pass
+
+def pin(filenames: Iterable[str | None]) -> None:
+    _pinned.clear()
+    _pinned.update(f for f in filenames if f)
+
+def total_bytes() -> int:
+    return _total_bytes
+
+def _evict() -> None:
+    global _total_bytes
+    if _total_bytes <= IMAGE_CACHE_MAX_BYTES:
+        return
+    for filename in list(_index):
+        if _total_bytes <= IMAGE_CACHE_MAX_BYTES:
+            break
+        if filename in _pinned:
+            continue
+        _total_bytes -= _index.pop(filename)
+        try:
+            (IMAGES_DIR / filename).unlink()
+        except FileNotFoundError:
+            pass
+
+def rebuild() -> None:
+    global _total_bytes
+    entries = []
+    for entry in os.scandir(IMAGES_DIR):
+        if entry.is_file() and entry.name.startswith('cached_'):
+            entries.append((entry.stat().st_atime, entry.name, entry.stat().st_size))
+    cache_root = IMAGES_DIR / CACHE_SUBDIR
+    if cache_root.is_dir():
+        for shard in os.scandir(cache_root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.tmp_'):
+                    os.unlink(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    entries.append((st.st_atime, f'{CACHE_SUBDIR}/{shard.name}/{entry.name}', st.st_size))
+    entries.sort()
+    _index.clear()
+    _index.update((name, size) for _, name, size in entries)
+    _total_bytes = sum(_index.values())
+    _evict()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import InputMediaPhoto
+
+from config import ADMIN_ID, TOP_THRESHOLD, MODERATION_DIGEST_INTERVAL, MODERATION_DIGEST_SIZE, MODERATION_DIGEST_ATTEMPTS
+from database import db
+from keyboards.inline_keyboards import digest_kb, moderation_kb
+from keyboards.messages import MESSAGES
+from utils import func
+
+logger = logging.getLogger(__name__)
+
+class PendingItem:
+    __slots__ = ('image_id', 'photo', 'user_id', 'username', 'raw', 'place', 'attempts')
+
+    def __init__(self, image_id: int, photo: str, user_id: int, username: Optional[str], raw: float, place: int):
+        self.image_id = image_id
+        self.photo = photo
+        self.user_id = user_id
+        self.username = username
+        self.raw = raw
+        self.place = place
+        self.attempts = 0
+
+_pending: Dict[int, PendingItem] = {}
+_wakeup = asyncio.Event()
+_task: Optional[asyncio.Task] = None
+stats: Counter[str] = Counter()
+
+def submit(image_id: int, photo: str, user_id: int, username: Optional[str], raw: float, place: int) -> None:
+    _pending[image_id] = PendingItem(image_id, photo, user_id, username, raw, place)
+    stats['submitted'] += 1
+    _wakeup.set()
+
+def pending() -> int:
+    return len(_pending)
+
+def _author(item: PendingItem) -> str:
+    return f"@{item.username}" if item.username else "неизвестно"
+
+def _line(number: int, item: PendingItem) -> str:
+    return f"{number}. {_author(item)} (ID: {item.user_id}) · ⭐ {func.map_score(item.raw)}% · 🏆 #{item.place}"
+
+async def _refresh() -> List[PendingItem]:
+    rows = await db.fetch('''
+        SELECT i.id, (SELECT COUNT(*)+1 FROM images j WHERE j.raw_score > i.raw_score) AS place
+        FROM images i WHERE i.id = ANY($1::int[]) AND i.approved = 0
+        AND NOT EXISTS (SELECT 1 FROM user_stats s WHERE s.user_id = i.user_id AND s.banned = 1)
+    ''', list(_pending))
+    places = {row['id']: int(row['place']) for row in rows}
+    for image_id in list(_pending):
+        place = places.get(image_id)
+        if place is None or place > TOP_THRESHOLD:
+            del _pending[image_id]
+            stats['dropped'] += 1
+        else:
+            _pending[image_id].place = place
+    return list(_pending.values())
+
+async def _retrying(call):
+    while True:
+        try:
+            return await call()
+        except TelegramRetryAfter as e:
+            stats['retry_after'] += 1
+            await asyncio.sleep(e.retry_after)
+
+async def _send(bot: Bot, items: List[PendingItem]) -> None:
+    if len(items) == 1:
+        item = items[0]
+        caption = MESSAGES["moderation_caption"].format(author=_author(item), user_id=item.user_id,
+                                                        score=func.map_score(item.raw), place=item.place)
+        await _retrying(lambda: bot.send_photo(ADMIN_ID, item.photo, caption=caption, parse_mode=None,
+                                               reply_markup=moderation_kb(item.image_id)))
+        return
+    media = [InputMediaPhoto(media=item.photo, caption=str(number)) for number, item in enumerate(items, 1)]
+    await _retrying(lambda: bot.send_media_group(ADMIN_ID, media))
+    text = MESSAGES["moderation_digest"].format(count=len(items)) + '\n'.join(_line(n, item) for n, item in enumerate(items, 1))
+    await _retrying(lambda: bot.send_message(ADMIN_ID, text, parse_mode=None,
+                                             reply_markup=digest_kb([(n, item.image_id) for n, item in enumerate(items, 1)])))
+
+async def _loop(bot: Bot) -> None:
+    while True:
+        await _wakeup.wait()
+        await asyncio.sleep(MODERATION_DIGEST_INTERVAL)
+        _wakeup.clear()
+        items = []
+        try:
+            items = (await _refresh())[:MODERATION_DIGEST_SIZE]
+            if items:
+                await _send(bot, items)
+                stats['sent'] += len(items)
+                stats['digests'] += 1
+            for item in items:
+                _pending.pop(item.image_id, None)
+        except Exception:
+            logger.exception("Moderation digest failed")
+            stats['failed'] += 1
+            for item in items:
+                item.attempts += 1
+                if item.attempts >= MODERATION_DIGEST_ATTEMPTS and _pending.pop(item.image_id, None):
+                    stats['dropped'] += 1
+        if _pending:
+            _wakeup.set()
+
+def start(bot: Bot) -> None:
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_loop(bot))
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,60 @@
+import time
+from typing import Optional
+
+from utils.state_store import StateStore
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def consume(self, tokens: float = 1) -> float:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def refund(self, tokens: float = 1) -> None:
+        self._tokens = min(self.capacity, self._tokens + tokens)
+
+class UserRateLimiter:
+    def __init__(self, store: StateStore, rate: float, capacity: float, prefix: str = 'bucket:', clock=time.time):
+        self.rate = rate
+        self.capacity = capacity
+        self._store = store
+        self._prefix = prefix
+        self._clock = clock
+
+    async def consume(self, user_id: int, tokens: float = 1) -> float:
+        now = self._clock()
+
+        def take(value: Optional[str]) -> tuple[Optional[str], float, float]:
+            if value:
+                stored, updated = value.split(':')
+                available = min(self.capacity, float(stored) + (now - float(updated)) * self.rate)
+            else:
+                available = self.capacity
+            if available < tokens:
+                return None, 0.0, (tokens - available) / self.rate
+            available -= tokens
+            return f'{available}:{now}', (self.capacity - available) / self.rate + 1, 0.0
+
+        return await self._store.update(f'{self._prefix}{user_id}', take)
+
+    async def refund(self, user_id: int, tokens: float = 1) -> None:
+        now = self._clock()
+
+        def give(value: Optional[str]) -> tuple[Optional[str], float, None]:
+            if not value:
+                return None, 0.0, None
+            stored, updated = value.split(':')
+            available = min(self.capacity, float(stored) + (now - float(updated)) * self.rate + tokens)
+            return f'{available}:{now}', (self.capacity - available) / self.rate + 1, None
+
+        await self._store.update(f'{self._prefix}{user_id}', give)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple, TypeVar
+
+from config import REDIS_URL, STATE_STORE_CAPACITY
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+Update = Callable[[Optional[str]], Tuple[Optional[str], float, T]]
+
+class StateStore(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: float) -> None: ...
+
+    @abstractmethod
+    async def set_nx(self, key: str, value: str, ttl: float) -> bool: ...
+
+    @abstractmethod
+    async def ttl(self, key: str) -> float: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    async def update(self, key: str, fn: Update[T]) -> T: ...
+
+    @abstractmethod
+    async def cleanup(self) -> int: ...
+
+class MemoryStateStore(StateStore):
+    def __init__(self, capacity: int = STATE_STORE_CAPACITY, clock=time.monotonic):
+        self.capacity = capacity
+        self._clock = clock
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _live(self, key: str) -> Optional[tuple[float, str]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] <= self._clock():
+            del self._data[key]
+            return None
+        return item
+
+    def _sweep(self, now: float) -> None:
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.capacity:
+                break
+            del self._data[key]
+
+    def _expire(self, now: float) -> int:
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._live(key)
+        return item[1] if item else None
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        now = self._clock()
+        self._data[key] = (now + ttl, value)
+        self._data.move_to_end(key)
+        self._sweep(now)
+
+    async def set_nx(self, key: str, value: str, ttl: float) -> bool:
+        if self._live(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def ttl(self, key: str) -> float:
+        item = self._live(key)
+        return max(0.0, item[0] - self._clock()) if item else 0.0
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def update(self, key: str, fn: Update[T]) -> T:
+        item = self._live(key)
+        value, ttl, result = fn(item[1] if item else None)
+        if value is not None:
+            await self.set(key, value, ttl)
+        return result
+
+    async def cleanup(self) -> int:
+        return self._expire(self._clock())
+
+class RedisStateStore(StateStore):
+    def __init__(self, client, prefix: str = 'cutebot:'):
+        self._redis = client
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> 'RedisStateStore':
+        import redis.asyncio as redis
+        return cls(redis.from_url(url, decode_responses=True))
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._redis.get(self._prefix + key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self._redis.set(self._prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    async def set_nx(self, key: str, value: str, ttl: float) -> bool:
+        return bool(await self._redis.set(self._prefix + key, value, px=max(1, int(ttl * 1000)), nx=True))
+
+    async def ttl(self, key: str) -> float:
+        ms = await self._redis.pttl(self._prefix + key)
+        return ms / 1000 if ms and ms > 0 else 0.0
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self._prefix + key)
+
+    async def update(self, key: str, fn: Update[T]) -> T:
+        from redis.exceptions import WatchError
+        key = self._prefix + key
+        async with self._redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    value, ttl, result = fn(await pipe.get(key))
+                    if value is None:
+                        await pipe.unwatch()
+                        return result
+                    pipe.multi()
+                    pipe.set(key, value, px=max(1, int(ttl * 1000)))
+                    await pipe.execute()
+                    return result
+                except WatchError:
+                    continue
+
+    async def cleanup(self) -> int:
+        return 0
+
+async def cleanup_loop(store: StateStore, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await store.cleanup()
+        except Exception:
+            logger.exception('State store cleanup failed')
+
+def create_store() -> StateStore:
+    if REDIS_URL:
+        return RedisStateStore.from_url(REDIS_URL)
+    return MemoryStateStore()
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import pyvips
 from pathlib import Path
@@ -27,14 +28,13 @@ CONTAINER_WIDTH = 550
 TOP_POSITIONS = [(133, 202), (325, 202), (517, 202), (709, 202)]
 TOP_SIZE = (178, 178)
 
-async def process_image(
+def _compose_card(
     value: int,
     place: int,
     nickname: str | None,
     userpic: str | None,
-    tops: list[str | None],
-    output_path: Path
-) -> None:
+    tops: list[str | None]
+) -> pyvips.Image:
     if not (0 <= value <= 100):
         raise ValueError('Value must be between 0 and 100')
     if len(tops) != 4:
@@ -98,5 +98,25 @@ async def process_image(
     rgb = r.bandjoin([g, b])
     rgba_place = rgb.bandjoin([text_mask]).copy(interpretation='srgb')
     image = image.composite2(rgba_place, 'over', x=PLACE_POSITION[0], y=PLACE_POSITION[1])
+    return image
 
-    image.write_to_file(str(output_path))
\ No newline at end of file
+async def process_image(
+    value: int,
+    place: int,
+    nickname: str | None,
+    userpic: str | None,
+    tops: list[str | None],
+    output_path: Path
+) -> None:
+    image = _compose_card(value, place, nickname, userpic, tops)
+    await asyncio.to_thread(image.write_to_file, str(output_path))
+
+async def render_card(
+    value: int,
+    place: int,
+    nickname: str | None,
+    userpic: str | None,
+    tops: list[str | None]
+) -> bytes:
+    image = _compose_card(value, place, nickname, userpic, tops)
+    return await asyncio.to_thread(image.write_to_buffer, '.png')
\ No newline at end of file
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+import pyvips
+
+from config import IMAGES_DIR, THUMBS_DIR, THUMB_SIZE, THUMB_QUALITY, THUMB_CACHE_MAX_BYTES, THUMB_WORKERS
+
+_executor = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix='thumb')
+_inflight: Dict[str, asyncio.Future] = {}
+_lock = threading.Lock()
+_total_bytes: Optional[int] = None
+
+def etag(image_hash: str) -> str:
+    return f'"{image_hash}-{THUMB_SIZE}-{THUMB_QUALITY}"'
+
+def path_for(image_hash: str) -> Path:
+    return THUMBS_DIR / image_hash[:2] / f'{image_hash}_{THUMB_SIZE}.webp'
+
+def _files() -> list[tuple[float, int, Path]]:
+    files = []
+    for path in THUMBS_DIR.rglob('*.webp'):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+def _account(size: int) -> None:
+    global _total_bytes
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = sum(s for _, s, _ in _files())
+        else:
+            _total_bytes += size
+        if _total_bytes <= THUMB_CACHE_MAX_BYTES:
+            return
+        files = sorted(_files())
+        _total_bytes = sum(s for _, s, _ in files)
+        for _, s, path in files:
+            if _total_bytes <= THUMB_CACHE_MAX_BYTES * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            _total_bytes -= s
+
+def _render(source: Path | bytes, target: Path) -> None:
+    if isinstance(source, Path):
+        image = pyvips.Image.thumbnail(str(source), THUMB_SIZE, height=THUMB_SIZE, size='down')
+    else:
+        image = pyvips.Image.thumbnail_buffer(source, THUMB_SIZE, height=THUMB_SIZE, size='down')
+    data = image.webpsave_buffer(Q=THUMB_QUALITY, strip=True)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    _account(len(data))
+
+def _cached(target: Path) -> bool:
+    try:
+        os.utime(target)
+        return True
+    except OSError:
+        return False
+
+async def store(image_hash: str, data: bytes) -> None:
+    await asyncio.get_running_loop().run_in_executor(_executor, _render, data, path_for(image_hash))
+
+async def _build(filename: Optional[str], target: Path, fetch: Callable[[], Awaitable[Optional[bytes]]]) -> None:
+    loop = asyncio.get_running_loop()
+    if filename:
+        try:
+            return await loop.run_in_executor(_executor, _render, IMAGES_DIR / filename, target)
+        except (OSError, pyvips.Error):
+            pass
+    data = await fetch()
+    if data is None:
+        raise FileNotFoundError(target)
+    await loop.run_in_executor(_executor, _render, data, target)
+
+async def get(image_hash: str, filename: Optional[str], fetch: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[Path]:
+    target = path_for(image_hash)
+    if _cached(target):
+        return target
+    future = _inflight.get(image_hash)
+    if future is None:
+        future = asyncio.ensure_future(_build(filename, target, fetch))
+        _inflight[image_hash] = future
+        future.add_done_callback(lambda _: _inflight.pop(image_hash, None))
+    try:
+        await asyncio.shield(future)
+    except (OSError, pyvips.Error):
+        return None
+    return target
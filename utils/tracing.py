@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger('cutebot.trace')
+
+PRECISION = 0.01
+QUANTILES = (0.5, 0.95, 0.99)
+_LOG_BASE = math.log1p(PRECISION)
+
+_current: ContextVar[Optional[dict]] = ContextVar('trace_span', default=None)
+_histograms: Dict[str, 'Histogram'] = {}
+
+class Histogram:
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        index = int(math.log(max(seconds * 1e6, 1.0)) / _LOG_BASE)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(math.exp((index + 0.5) * _LOG_BASE) / 1e6, self.max)
+        return self.max
+
+    def merge(self, other: 'Histogram') -> None:
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        return {'counts': dict(self.counts), 'count': self.count, 'total': self.total, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        hist = cls()
+        hist.counts = {int(k): v for k, v in data['counts'].items()}
+        hist.count = data['count']
+        hist.total = data['total']
+        hist.max = data['max']
+        return hist
+
+def record(name: str, seconds: float) -> None:
+    hist = _histograms.get(name)
+    if hist is None:
+        hist = _histograms[name] = Histogram()
+    hist.record(seconds)
+
+def histograms() -> Dict[str, Histogram]:
+    return _histograms
+
+@contextmanager
+def span(name: str, **fields) -> Iterator[dict]:
+    parent = _current.get()
+    ctx = {
+        'trace_id': parent['trace_id'] if parent else uuid.uuid4().hex[:16],
+        'span_id': uuid.uuid4().hex[:8],
+    }
+    token = _current.set(ctx)
+    status = 'ok'
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current.reset(token)
+        record(name, duration)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'trace_id': ctx['trace_id'],
+                'span_id': ctx['span_id'],
+                'parent_id': parent['span_id'] if parent else None,
+                'span': name,
+                'duration_ms': round(duration * 1000, 3),
+                'status': status,
+                **fields,
+            }, ensure_ascii=False, default=str))
+
+def snapshot(gauges: Dict[str, float]) -> dict:
+    return {
+        'written_at': time.time(),
+        'histograms': {name: hist.to_dict() for name, hist in list(_histograms.items())},
+        'gauges': dict(gauges),
+    }
+
+def _write(path: Path, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = json.dumps(data)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp_')
+    with os.fdopen(fd, 'w') as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+def write_snapshot(path: Path, gauges: Dict[str, float]) -> None:
+    _write(path, snapshot(gauges))
+
+def read_snapshot(path: Path) -> Optional[dict]:
+    try:
+        data = json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    data['histograms'] = {name: Histogram.from_dict(h) for name, h in data['histograms'].items()}
+    return data
+
+async def export_loop(path: Path, interval: float, gauges: Callable[[], Dict[str, float]]) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_write, path, snapshot(gauges()))
+        except Exception:
+            logger.exception('Metrics snapshot write failed')
+
+def render_prometheus(hists: Dict[str, Histogram], gauges: Dict[str, float], prefix: str = 'cutebot') -> str:
+    lines = [f'# TYPE {prefix}_stage_seconds summary']
+    for name in sorted(hists):
+        hist = hists[name]
+        for q in QUANTILES:
+            lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} {hist.percentile(q):.6f}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {hist.total:.6f}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {hist.count}')
+    for name in sorted(gauges):
+        lines.append(f'{prefix}_{name} {gauges[name]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,264 @@
+import json
+import math
+import threading
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+import torch
+
+SEARCH_CHUNK = 65536
+
+class Match(NamedTuple):
+    row_id: int
+    user_id: int
+    similarity: float
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float16)
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    half_norms = 0.5 * (centroids ** 2).sum(axis=1)
+    out = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk):
+        out[start:start + chunk] = np.argmax(data[start:start + chunk] @ centroids.T - half_norms, axis=1)
+    return out
+
+def _kmeans(data: np.ndarray, k: int, iters: int, rng: np.random.Generator, spherical: bool) -> np.ndarray:
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(data, centroids)
+        counts = np.bincount(assign, minlength=k)
+        present = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[present])[:-1]))
+        sums = np.add.reduceat(data[np.argsort(assign, kind='stable')], starts, axis=0)
+        centroids[present] = sums / counts[present, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+        if spherical:
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+class _InvertedList:
+    __slots__ = ('positions', 'codes', 'size')
+
+    def __init__(self, m: int):
+        self.positions = np.empty(16, dtype=np.int64)
+        self.codes = np.empty((16, m), dtype=np.uint8)
+        self.size = 0
+
+    def extend(self, positions: np.ndarray, codes: np.ndarray) -> None:
+        needed = self.size + len(positions)
+        if needed > len(self.positions):
+            capacity = max(needed, 2 * len(self.positions))
+            self.positions = np.resize(self.positions, capacity)
+            self.codes = np.resize(self.codes, (capacity, self.codes.shape[1]))
+        self.positions[self.size:needed] = positions
+        self.codes[self.size:needed] = codes
+        self.size = needed
+
+class IVFPQ:
+    def __init__(self, dim: int, nlist: int, m: int):
+        if dim % m:
+            raise ValueError(f'dim {dim} is not divisible by {m} subspaces')
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.dsub = dim // m
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self.lists: list[_InvertedList] = []
+
+    def train(self, sample: np.ndarray, iters: int = 10, seed: int = 0) -> None:
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(sample, dtype=np.float32)
+        self.centroids = _kmeans(sample, self.nlist, iters, rng, spherical=True)
+        self.nlist = len(self.centroids)
+        subspaces = sample.reshape(len(sample), self.m, self.dsub)
+        self.codebooks = np.stack([_kmeans(subspaces[:, j], 256, iters, rng, spherical=False) for j in range(self.m)])
+        self.lists = [_InvertedList(self.m) for _ in range(self.nlist)]
+
+    def _encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        lists = _nearest(vectors, self.centroids)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        subspaces = vectors.reshape(len(vectors), self.m, self.dsub)
+        for j in range(self.m):
+            codes[:, j] = _nearest(subspaces[:, j], self.codebooks[j])
+        return lists, codes
+
+    def add(self, positions: np.ndarray, vectors: np.ndarray) -> None:
+        lists, codes = self._encode(vectors)
+        order = np.argsort(lists, kind='stable')
+        lists, codes, positions = lists[order], codes[order], np.asarray(positions)[order]
+        bounds = np.flatnonzero(np.diff(lists)) + 1
+        for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(lists)]))):
+            self.lists[lists[start]].extend(positions[start:end], codes[start:end])
+
+    def search(self, query: np.ndarray, nprobe: int, limit: int) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = min(nprobe, self.nlist)
+        probe = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+        tables = np.einsum('md,mkd->mk', query.reshape(self.m, self.dsub), self.codebooks)
+        columns = np.arange(self.m)
+        positions, scores = [], []
+        for index in probe:
+            inverted = self.lists[index]
+            size = inverted.size
+            if not size:
+                continue
+            positions.append(inverted.positions[:size])
+            scores.append(tables[columns, inverted.codes[:size]].sum(axis=1))
+        if not positions:
+            return np.empty(0, dtype=np.int64)
+        positions, scores = np.concatenate(positions), np.concatenate(scores)
+        if len(positions) > limit:
+            positions = positions[np.argpartition(scores, -limit)[-limit:]]
+        return positions
+
+class VectorIndex:
+    def __init__(self, directory: Path, dim: int, mode: str = 'flat', nprobe: int = 8, rerank: int = 64,
+                 ivf_min_rows: int = 100_000, pq_subspaces: int = 48, retrain_ratio: float = 0.5,
+                 meta_interval: int = 256):
+        self.directory = directory
+        self.dim = dim
+        self.mode = mode
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.ivf_min_rows = ivf_min_rows
+        self.pq_subspaces = pq_subspaces
+        self.retrain_ratio = retrain_ratio
+        self.meta_interval = meta_interval
+        self.version = ''
+        self.count = 0
+        self.trained_count = 0
+        self._meta_count = 0
+        self._lock = threading.Lock()
+        self.vectors: Optional[np.memmap] = None
+        self.rows: Optional[np.memmap] = None
+        self.ivf: Optional[IVFPQ] = None
+
+    @property
+    def last_row_id(self) -> int:
+        return int(self.rows[self.count - 1, 0]) if self.count else 0
+
+    def _map(self, capacity: int) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for name, width, itemsize in (('vectors.f16', self.dim, 2), ('rows.i64', 2, 8)):
+            path = self.directory / name
+            with open(path, 'ab') as f:
+                if f.tell() < capacity * width * itemsize:
+                    f.truncate(capacity * width * itemsize)
+        self.vectors = np.memmap(self.directory / 'vectors.f16', dtype=np.float16, mode='r+', shape=(capacity, self.dim))
+        self.rows = np.memmap(self.directory / 'rows.i64', dtype=np.int64, mode='r+', shape=(capacity, 2))
+
+    @property
+    def needs_rebuild(self) -> bool:
+        if self.mode != 'ivfpq' or self.count < self.ivf_min_rows:
+            return False
+        return self.ivf is None or self.count - self.trained_count >= self.retrain_ratio * self.trained_count
+
+    def _write_meta(self) -> None:
+        self._meta_count = self.count
+        (self.directory / 'meta.json').write_text(json.dumps({'count': self.count, 'dim': self.dim, 'version': self.version}))
+
+    def flush(self) -> None:
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.rows.flush()
+        self._write_meta()
+
+    def open(self, version: str = '') -> None:
+        self.version = version
+        meta_path = self.directory / 'meta.json'
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        if meta.get('dim') != self.dim or meta.get('version', '') != version:
+            self.reset()
+            return
+        self.count = self._meta_count = meta['count']
+        self._map(max(1024, self.count))
+
+    def reset(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for name in ('vectors.f16', 'rows.i64'):
+            (self.directory / name).unlink(missing_ok=True)
+        self.count = self.trained_count = 0
+        self.ivf = None
+        self._map(1024)
+        self._write_meta()
+
+    def add_many(self, row_ids: Iterable[int], user_ids: Iterable[int], vectors: np.ndarray) -> None:
+        row_ids, user_ids = np.asarray(list(row_ids), dtype=np.int64), np.asarray(list(user_ids), dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float16).reshape(-1, self.dim)
+        if not len(vectors):
+            return
+        with self._lock:
+            needed = self.count + len(vectors)
+            if needed > len(self.vectors):
+                self.vectors.flush()
+                self.rows.flush()
+                self._map(max(needed, 2 * len(self.vectors)))
+            start = self.count
+            self.vectors[start:needed] = vectors
+            self.rows[start:needed, 0] = row_ids
+            self.rows[start:needed, 1] = user_ids
+            if self.ivf is not None:
+                self.ivf.add(np.arange(start, needed), vectors)
+            self.count = needed
+        if needed - self._meta_count >= self.meta_interval:
+            self._write_meta()
+
+    def add(self, row_id: int, user_id: int, vector: np.ndarray) -> None:
+        self.add_many([row_id], [user_id], vector[None, :])
+
+    def build_ivf(self, sample_size: int = 50_000, seed: int = 0) -> None:
+        if self.mode != 'ivfpq' or self.count < self.ivf_min_rows:
+            with self._lock:
+                self.ivf = None
+                self.trained_count = 0
+            return
+        count = self.count
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(count, min(sample_size, count), replace=False))], dtype=np.float32)
+        ivf = IVFPQ(self.dim, min(4096, int(4 * math.sqrt(count))), self.pq_subspaces)
+        ivf.train(sample, seed=seed)
+        for start in range(0, count, SEARCH_CHUNK):
+            end = min(count, start + SEARCH_CHUNK)
+            ivf.add(np.arange(start, end), self.vectors[start:end])
+        with self._lock:
+            if self.count > count:
+                ivf.add(np.arange(count, self.count), self.vectors[count:self.count])
+            self.ivf = ivf
+            self.trained_count = count
+
+    @staticmethod
+    def _exact(vectors: np.ndarray, query: np.ndarray, positions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        positions = np.sort(positions)
+        return positions, np.asarray(vectors[positions], dtype=np.float32) @ query
+
+    def search(self, vector: np.ndarray, k: int = 1) -> list[Match]:
+        with self._lock:
+            count, vectors, rows, ivf = self.count, self.vectors, self.rows, self.ivf
+        if not count:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        if ivf is not None:
+            positions = ivf.search(query, self.nprobe, max(k, self.rerank))
+            positions, sims = self._exact(vectors, query, positions[positions < count])
+        else:
+            query_half = torch.from_numpy(query.astype(np.float16))
+            best_positions, best_sims = [], []
+            for start in range(0, count, SEARCH_CHUNK):
+                chunk = (torch.from_numpy(vectors[start:min(count, start + SEARCH_CHUNK)]) @ query_half).float().numpy()
+                top = np.argpartition(chunk, -k)[-k:] if len(chunk) > k else np.arange(len(chunk))
+                best_positions.append(top + start)
+                best_sims.append(chunk[top])
+            positions, sims = np.concatenate(best_positions), np.concatenate(best_sims)
+        if not len(positions):
+            return []
+        order = np.argsort(-sims)[:k]
+        return [Match(int(rows[p, 0]), int(rows[p, 1]), float(s)) for p, s in zip(positions[order], sims[order])]
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import secrets
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str, concurrency: int):
+        if not secret:
+            raise ValueError('Webhook secret must not be empty')
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.accepting = True
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            return web.Response(status=401)
+        if not self.accepting:
+            return web.Response(status=503)
+        update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        self.received += 1
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("Update %s failed", update.update_id)
+        finally:
+            self._slots.release()
+
+    async def drain(self, timeout: float) -> None:
+        self.accepting = False
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    def make_app(self, path: str) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        return app
+
+async def run_webhook(dp: Dispatcher, bot: Bot, url: str, path: str, host: str, port: int,
+                      secret: str, concurrency: int, drain_timeout: float, stop: asyncio.Event) -> None:
+    if not secret:
+        secret = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET is not set, using a random secret for this run")
+    server = WebhookServer(dp, bot, secret, concurrency)
+    runner = web.AppRunner(server.make_app(path))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await bot.set_webhook(url, secret_token=secret, allowed_updates=dp.resolve_used_update_types())
+    await dp.emit_startup(bot=bot)
+    try:
+        await stop.wait()
+    finally:
+        await server.drain(drain_timeout)
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
@@ -0,0 +1,88 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+class WorkQueue:
+    def __init__(self, name: str, workers: int, maxsize: int):
+        self.name = name
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def full(self, priority: int = 1) -> bool:
+        return priority > 0 and self._queue.qsize() >= self.maxsize
+
+    def submit(self, job: Job, priority: int = 1) -> bool:
+        if self.full(priority):
+            self.rejected += 1
+            return False
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._queue.put_nowait((priority, next(self._seq), time.monotonic(), contextvars.copy_context(), job))
+        self.submitted += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, enqueued_at, context, job = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            tracing.record(f'queue_wait_{self.name}', wait)
+            self.running += 1
+            try:
+                await context.run(asyncio.ensure_future, job())
+                self.completed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("%s job failed", self.name)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    async def stop(self, timeout: float) -> None:
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        started = self.completed + self.failed + self.running
+        return {
+            'depth': self.depth(),
+            'maxsize': self.maxsize,
+            'workers': self.workers,
+            'running': self.running,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'failed': self.failed,
+            'wait_avg': self.wait_total / started if started else 0.0,
+            'wait_max': self.wait_max,
+        }